@@ -34,6 +34,37 @@ class Settings:
     # --------------------------
     FAISS_INDEX_DIR: str = os.environ["FAISS_INDEX_DIR"]
     FAISS_DIM: int = int(os.environ["FAISS_DIM"])
+    # flat | ivf_flat | ivf_pq | ivf_sq8 | hnsw | sq8 | fp16 | pq
+    FAISS_INDEX_TYPE: str = os.environ.get("FAISS_INDEX_TYPE", "flat").lower()
+    FAISS_NLIST: int = int(os.environ.get("FAISS_NLIST", "1024"))
+    FAISS_PQ_M: int = int(os.environ.get("FAISS_PQ_M", "64"))
+    FAISS_HNSW_M: int = int(os.environ.get("FAISS_HNSW_M", "32"))
+    FAISS_NPROBE: int = int(os.environ.get("FAISS_NPROBE", "16"))
+    FAISS_EF_SEARCH: int = int(os.environ.get("FAISS_EF_SEARCH", "64"))
+    # compressed types: re-score top_k * factor candidates with the float vectors in Postgres (<=1 disables)
+    FAISS_RERANK_FACTOR: int = int(os.environ.get("FAISS_RERANK_FACTOR", "4"))
+    # write-behind saves: flush every N seconds (0 = save on every mutation) or after N mutations
+    FAISS_FLUSH_INTERVAL: float = float(os.environ.get("FAISS_FLUSH_INTERVAL", "5"))
+    FAISS_FLUSH_THRESHOLD: int = int(os.environ.get("FAISS_FLUSH_THRESHOLD", "1000"))
+    # mutations go to a small exact delta (+ tombstones) next to the base index; folded in on save past N entries
+    FAISS_DELTA_MAX: int = int(os.environ.get("FAISS_DELTA_MAX", "5000"))
+    # HNSW keeps deleted ids as tombstones; the graph is rebuilt once they exceed this fraction of it
+    FAISS_TOMBSTONE_MAX_FRACTION: float = float(os.environ.get("FAISS_TOMBSTONE_MAX_FRACTION", "0.1"))
+    FAISS_MMAP: bool = os.environ.get("FAISS_MMAP", "False").lower() == "true"
+    # multi-worker deployments: workers map one published index file and remap newer generations
+    FAISS_SHARED: bool = os.environ.get("FAISS_SHARED", "False").lower() == "true"
+    FAISS_SHARED_CHECK_INTERVAL: float = float(os.environ.get("FAISS_SHARED_CHECK_INTERVAL", "1"))
+    # one index shard per main_category; global queries fan out over FAISS_SHARD_WORKERS threads
+    FAISS_SHARD_BY_CATEGORY: bool = os.environ.get("FAISS_SHARD_BY_CATEGORY", "False").lower() == "true"
+    FAISS_SHARD_WORKERS: int = int(os.environ.get("FAISS_SHARD_WORKERS", "4"))
+    # startup reconcile: full rebuild when the diff exceeds this fraction of the catalog
+    FAISS_RECONCILE_MAX_FRACTION: float = float(os.environ.get("FAISS_RECONCILE_MAX_FRACTION", "0.2"))
+    FAISS_VERIFY_CHECKSUM: bool = os.environ.get("FAISS_VERIFY_CHECKSUM", "True").lower() == "true"
+    # incremental backups: base snapshot + delta log (default dir: <FAISS_INDEX_DIR>/backups)
+    FAISS_BACKUP_DIR: str = os.environ.get("FAISS_BACKUP_DIR", "")
+    FAISS_BACKUP_BASE_INTERVAL: float = float(os.environ.get("FAISS_BACKUP_BASE_INTERVAL", "24"))
+    FAISS_BACKUP_LOG_RATIO: float = float(os.environ.get("FAISS_BACKUP_LOG_RATIO", "0.5"))
+    FAISS_BACKUP_KEEP: int = int(os.environ.get("FAISS_BACKUP_KEEP", "3"))
 
     # --------------------------
     # File Paths
@@ -41,8 +72,6 @@ class Settings:
     IMAGE_DIR: str = os.environ["IMAGE_DIR"]
     STATIC_DIR: str = os.environ["STATIC_DIR"]
     MODEL_PATH: str = os.environ["MODEL_PATH"]
-    TEMP_IMAGE_PATH: str = os.environ["TEMP_IMAGE_PATH"]
-    TEMP_HYBRID_IMAGE_PATH: str = os.environ["TEMP_HYBRID_IMAGE_PATH"]
 
     # --------------------------
     # Admin
@@ -58,6 +87,52 @@ class Settings:
     DEFAULT_TOP_K: int = int(os.environ["DEFAULT_TOP_K"])
     DEFAULT_WEIGHT_IMAGE: float = float(os.environ["DEFAULT_WEIGHT_IMAGE"])
     DEFAULT_WEIGHT_TEXT: float = float(os.environ["DEFAULT_WEIGHT_TEXT"])
+    TEXT_SEARCH_SOURCE: str = os.environ.get("TEXT_SEARCH_SOURCE", "image")  # image | text | both
+    # filtered search: full reload of the in-memory product metadata (seconds, 0 = never)
+    METADATA_REFRESH_INTERVAL: int = int(os.environ.get("METADATA_REFRESH_INTERVAL", "300"))
+    SEARCH_BATCH_MAX_QUERIES: int = int(os.environ.get("SEARCH_BATCH_MAX_QUERIES", "256"))
+    # min_score (range) searches: upper bound on returned hits
+    SEARCH_RANGE_MAX_RESULTS: int = int(os.environ.get("SEARCH_RANGE_MAX_RESULTS", "100"))
+    RRF_K: int = int(os.environ.get("RRF_K", "60"))
+
+    # --------------------------
+    # Near-duplicate Detection
+    # --------------------------
+    # cosine similarity at which two products count as near-duplicates
+    DEDUPE_THRESHOLD: float = float(os.environ.get("DEDUPE_THRESHOLD", "0.95"))
+    DEDUPE_K: int = int(os.environ.get("DEDUPE_K", "5"))
+    DEDUPE_BATCH_SIZE: int = int(os.environ.get("DEDUPE_BATCH_SIZE", "1024"))
+
+    # --------------------------
+    # Related Products
+    # --------------------------
+    RELATED_TOP_N: int = int(os.environ.get("RELATED_TOP_N", "12"))
+    RELATED_BATCH_SIZE: int = int(os.environ.get("RELATED_BATCH_SIZE", "512"))
+    # incremental refresh of the related_products table (seconds, 0 = never)
+    RELATED_REFRESH_INTERVAL: int = int(os.environ.get("RELATED_REFRESH_INTERVAL", "600"))
+
+    # --------------------------
+    # Embedding / Inference
+    # --------------------------
+    EMBED_BATCH_SIZE: int = int(os.environ.get("EMBED_BATCH_SIZE", "32"))
+    CLIP_TOWERS: str = os.environ.get("CLIP_TOWERS", "both")  # both | text | vision
+    EMBEDDING_BACKEND: str = os.environ.get("EMBEDDING_BACKEND", "torch").lower()  # torch | onnx
+    ONNX_MODEL_DIR: str = os.environ.get("ONNX_MODEL_DIR", "/project_data/clip-onnx")
+    ONNX_QUANTIZE: bool = os.environ.get("ONNX_QUANTIZE", "False").lower() == "true"
+    ONNX_NUM_THREADS: int = int(os.environ.get("ONNX_NUM_THREADS", "0"))
+    PREPROCESS_WORKERS: int = int(os.environ.get("PREPROCESS_WORKERS", "2"))
+    IMAGE_MAX_PIXELS: int = int(os.environ.get("IMAGE_MAX_PIXELS", "50000000"))
+    IMAGE_DRAFT_DECODE: bool = os.environ.get("IMAGE_DRAFT_DECODE", "True").lower() == "true"
+    SCHEDULER_ENABLED: bool = os.environ.get("SCHEDULER_ENABLED", "True").lower() == "true"
+    SCHEDULER_MAX_BATCH: int = int(os.environ.get("SCHEDULER_MAX_BATCH", "16"))
+    SCHEDULER_MAX_WAIT_MS: float = float(os.environ.get("SCHEDULER_MAX_WAIT_MS", "5"))
+
+    # --------------------------
+    # Query Embedding Cache
+    # --------------------------
+    QUERY_CACHE_SIZE: int = int(os.environ.get("QUERY_CACHE_SIZE", "5000"))
+    QUERY_CACHE_TTL: float = float(os.environ.get("QUERY_CACHE_TTL", "86400"))
+    QUERY_CACHE_WARM_FILE: str = os.environ.get("QUERY_CACHE_WARM_FILE", "")
 
     # --------------------------
     # Server & CORS
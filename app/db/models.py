@@ -52,10 +52,19 @@ def create_products_table():
         context TEXT,
         seller_id INTEGER,
         approved_by INTEGER,
-        approved_at TIMESTAMP
+        approved_at TIMESTAMP,
+        text_embedding BYTEA,
+        duplicate_of INTEGER,
+        duplicate_score REAL
     );
     """)
 
+    # columns added after the initial schema
+    cur.execute("ALTER TABLE products ADD COLUMN IF NOT EXISTS text_embedding BYTEA;")
+    # closest near-duplicate found at approval (see DEDUPE_THRESHOLD)
+    cur.execute("ALTER TABLE products ADD COLUMN IF NOT EXISTS duplicate_of INTEGER;")
+    cur.execute("ALTER TABLE products ADD COLUMN IF NOT EXISTS duplicate_score REAL;")
+
     conn.commit()
     cur.close()
     conn.close()
@@ -79,3 +88,53 @@ def create_sellers_table():
     conn.commit()
     cur.close()
     conn.close()
+
+
+def create_embedding_cache_table():
+    """
+    Create the image embedding cache table if it doesn't exist.
+    Keyed by SHA-256 of the image bytes + the embedding model id.
+    """
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS embedding_cache (
+        content_hash CHAR(64) NOT NULL,
+        model_id TEXT NOT NULL,
+        embedding BYTEA NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (content_hash, model_id)
+    );
+    """)
+
+    conn.commit()
+    cur.close()
+    conn.close()
+
+
+def create_related_products_table():
+    """
+    Create the precomputed related-products table if it doesn't exist:
+    one row per approved product with its top-N neighbours, best first.
+    """
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS related_products (
+        product_id INTEGER PRIMARY KEY,
+        related_ids INTEGER[] NOT NULL,
+        scores REAL[] NOT NULL,
+        computed_at TIMESTAMP NOT NULL
+    );
+    """)
+    # finds the lists that mention changed / removed products
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS related_products_related_ids_idx
+    ON related_products USING GIN (related_ids);
+    """)
+
+    conn.commit()
+    cur.close()
+    conn.close()
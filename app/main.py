@@ -1,7 +1,6 @@
 # app/main.py
 import logging
 
-import numpy as np
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
@@ -10,9 +9,16 @@ from fastapi.responses import FileResponse
 
 from app.core.config import settings
 from app.db.models import create_products_table
-from app.db.database import get_connection
+from app.services.index_reconcile import backfill_text_embeddings, reconcile_index
 from app.utils.db_sequence_fix import fix_product_id_sequence
-from app.services.global_faiss import ensure_services  # global embedder + faiss
+from app.services.global_faiss import (  # global embedder + faiss
+    ensure_metadata_store,
+    ensure_query_cache,
+    ensure_services,
+    ensure_text_index,
+    shutdown_services,
+    start_related_refresh,
+)
 
 # --------------------------------------------------------------------
 
@@ -27,7 +33,7 @@ CORS_ORIGINS = settings.CORS_ORIGINS
 async def lifespan(app: FastAPI):
     """
     Lifespan context manager for the FastAPI app.
-    Handles startup tasks (DB ensure, sequence fix, FAISS rebuild)
+    Handles startup tasks (DB ensure, sequence fix, FAISS reconcile)
     and shutdown tasks.
     """
     # STARTUP
@@ -35,21 +41,37 @@ async def lifespan(app: FastAPI):
 
     # Ensure DB ready
     create_products_table()
-    from app.db.models import create_sellers_table
+    from app.db.models import (
+        create_embedding_cache_table,
+        create_related_products_table,
+        create_sellers_table,
+    )
     create_sellers_table()
-    logger.info("Products and Sellers tables ensured")
+    create_embedding_cache_table()
+    create_related_products_table()
+    logger.info("Products, Sellers, Embedding cache and Related products tables ensured")
 
     # Sequence fix
     fix_product_id_sequence()
     logger.info("Product ID sequence synchronized.")
 
-    # Auto rebuild FAISS on every container start
-    auto_rebuild_faiss()
+    # Bring the persisted FAISS indexes up to date with the DB
+    reconcile_faiss()
+
+    # Load product metadata for filtered search
+    ensure_metadata_store()
+
+    # Pre-warm text query embeddings for the most popular queries
+    warm_query_cache()
+
+    # Keep the precomputed related-products lists current
+    start_related_refresh()
     
     yield
     
     # SHUTDOWN
     logger.info("SmartCart API shutting down...")
+    shutdown_services()
 
 app = FastAPI(
     title="SmartCart Semantic Search",
@@ -135,41 +157,47 @@ async def root():
 
 
 # ---------------------------------------------------------
-# AUTO REBUILD FAISS
+# STARTUP FAISS RECONCILE
 # ---------------------------------------------------------
-def auto_rebuild_faiss():
+def reconcile_faiss():
     """
-    Checks for approved products with existing embeddings in the DB
-    and rebuilds the in-memory FAISS index on startup.
+    Diffs the persisted image and text FAISS indexes against the approved
+    products in the DB and applies only the missing adds/removes; falls
+    back to a full rebuild when the index watermark doesn't match.
+    Workers with the text tower first embed approved products that are
+    missing a text embedding, so the text reconcile indexes them.
     """
     embedder, faiss_mgr = ensure_services()
+    text_faiss_mgr = ensure_text_index()
 
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT faiss_index, embedding
-        FROM products
-        WHERE status='approved' AND embedding IS NOT NULL;
-    """)
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
-
-    if not rows:
-        print("[FAISS] No embeddings found — skipping rebuild.")
-        return
+    if "text" in embedder.towers:
+        result = backfill_text_embeddings(embedder)
+        print(f"[FAISS] text embedding backfill: {result}")
+
+    for label, mgr, column in (
+        ("image", faiss_mgr, "embedding"),
+        ("text", text_faiss_mgr, "text_embedding"),
+    ):
+        result = reconcile_index(mgr, column)
+        print(f"[FAISS] {label} index: {result}")
 
-    print(f"[FAISS] Rebuilding FAISS index with {len(rows)} vectors...")
 
-    vectors = []
-    ids = []
-    for fid, emb_bytes in rows:
-        vec = np.frombuffer(emb_bytes, dtype="float32")
-        vectors.append(vec)
-        ids.append(int(fid))
+# ---------------------------------------------------------
+# QUERY CACHE WARM-UP
+# ---------------------------------------------------------
+def warm_query_cache():
+    """
+    Pre-fills the text query embedding cache from QUERY_CACHE_WARM_FILE
+    (one query per line, most popular first), if configured.
+    """
+    if not settings.QUERY_CACHE_WARM_FILE:
+        return
 
-    faiss_mgr.rebuild(vectors, ids)
-    print("[FAISS] Rebuild complete!")
+    embedder, _ = ensure_services()
+    count = ensure_query_cache().warm_from_file(
+        settings.QUERY_CACHE_WARM_FILE, embedder.embed_texts
+    )
+    print(f"[CACHE] Pre-warmed {count} text query embeddings.")
 
 
 
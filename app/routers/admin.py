@@ -1,19 +1,35 @@
 # app/routers/admin.py
+import json
 import os
-import tempfile
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 
 import numpy as np
 import psycopg2
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
 
 import boto3
 from botocore.exceptions import BotoCoreError, NoCredentialsError
 
 from app.core.config import settings
 from app.db.database import get_connection
-from app.services.global_faiss import ensure_services
+from app.services.dedupe import find_batch_duplicates, find_near_duplicates, near_duplicate_report
+from app.services.embedding_cache import embed_images_cached
+from app.services.embedding_service import product_text
+from app.services.faiss_manager import compression_report
+from app.services.global_faiss import (
+    drop_metadata,
+    ensure_query_cache,
+    ensure_services,
+    ensure_text_index,
+    refresh_metadata,
+    refresh_related_products,
+)
+from app.services.index_reconcile import backfill_text_embeddings, rebuild_index
+from app.services.metadata_store import STATUSES
+from app.services.search_service import search_by_text
+from app.services.vector_store import load_all_product_vectors
 
 router = APIRouter()
 
@@ -24,10 +40,10 @@ ADMIN_ID = settings.ADMIN_ID
 IMAGE_DIR = settings.IMAGE_DIR
 
 
-# Utility: Download image from S3 → temporary file
-def download_from_s3(image_name: str) -> str:
+# Utility: Download image from S3 → bytes
+def download_from_s3(image_name: str) -> bytes:
     """
-    Downloads an image from S3 and returns a temp file path.
+    Downloads an image from S3 and returns its raw bytes.
     """
 
     s3_key = f"all_images/{image_name}"       # <-- FIXED HERE
@@ -40,12 +56,8 @@ def download_from_s3(image_name: str) -> str:
     )
 
     try:
-        suffix = os.path.splitext(image_name)[1]
-        tmp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
-        s3.download_fileobj(settings.S3_BUCKET_NAME, s3_key, tmp)
-        tmp.flush()
-        tmp.close()
-        return tmp.name
+        obj = s3.get_object(Bucket=settings.S3_BUCKET_NAME, Key=s3_key)
+        return obj["Body"].read()
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -53,6 +65,22 @@ def download_from_s3(image_name: str) -> str:
         )
 
 
+# Utility: Read product image bytes (local or cloud)
+def read_product_image(image_name: str):
+    """
+    Returns the raw bytes of a product image from S3 or IMAGE_DIR,
+    or None if the local file is missing.
+    """
+    if settings.USE_CLOUD:
+        return download_from_s3(image_name)
+
+    image_path = os.path.join(IMAGE_DIR, image_name)
+    if not os.path.exists(image_path):
+        return None
+    with open(image_path, "rb") as f:
+        return f.read()
+
+
 # Utility: Delete object from S3
 def delete_from_s3(image_name: str):
     """
@@ -136,55 +164,91 @@ def approve_product(product_id: int, admin_id: int = ADMIN_ID):
     """
     Approves a product, generates its embedding using CLIP,
     adds it to the FAISS index, and updates the DB status.
-    Handles both local and cloud image storage.
+    Handles both local and cloud image storage. Images already embedded
+    before (same bytes, same model) are served from the embedding cache.
+    Also embeds title + description into the product text index.
+    Indexed products at least DEDUPE_THRESHOLD similar are returned as
+    `near_duplicates` and the closest one is stored in `duplicate_of`.
     """
     embedder, faiss_mgr = ensure_services()
+    text_faiss_mgr = ensure_text_index()
 
     conn = get_connection()
     cur = conn.cursor()
 
-    cur.execute("SELECT id, image FROM products WHERE id = %s;", (product_id,))
+    cur.execute("SELECT id, image, title, description, main_category FROM products WHERE id = %s;", (product_id,))
     row = cur.fetchone()
 
     if not row:
         raise HTTPException(status_code=404, detail="Product not found")
 
-    _, image_name = row
+    _, image_name, title, description, category = row
 
-    # Get image path (local or cloud)
-    if settings.USE_CLOUD:
-        image_path = download_from_s3(image_name)
-    else:
-        image_path = os.path.join(IMAGE_DIR, image_name)
-        if not os.path.exists(image_path):
-            raise HTTPException(status_code=400, detail=f"Image missing: {image_name}")
+    # Get image bytes (local or cloud)
+    image_bytes = read_product_image(image_name)
+    if image_bytes is None:
+        raise HTTPException(status_code=400, detail=f"Image missing: {image_name}")
 
-    try:
-        vec = embedder.embed_image(image_path)
-    finally:
-        if settings.USE_CLOUD and os.path.exists(image_path):
-            os.remove(image_path)  # cleanup temp file
+    vec = embed_images_cached(embedder, [image_bytes])[0]
+    if vec is None:
+        raise HTTPException(status_code=400, detail=f"Invalid image: {image_name}")
 
     emb_bytes = psycopg2.Binary(vec.tobytes())
 
-    # update DB + FAISS
-    faiss_mgr.add_vector(vec, product_id)
+    # text side (skipped on vision-only workers)
+    text_vec = None
+    text_bytes = None
+    if "text" in embedder.towers:
+        text_vec = embedder.embed_texts([product_text(title, description)])[0]
+        text_bytes = psycopg2.Binary(text_vec.tobytes())
 
+    # look for near-duplicates before the product itself is indexed
+    duplicates = find_near_duplicates(faiss_mgr, vec, [product_id])[0]
+    duplicate_of, duplicate_score = duplicates[0] if duplicates else (None, None)
+
+    # update DB, then FAISS: a rebuild reading the DB meanwhile either
+    # sees the approval or runs before the add (see rebuild_index)
+    approved_at = datetime.utcnow()
     cur.execute("""
         UPDATE products
         SET embedding = %s,
+            text_embedding = COALESCE(%s, text_embedding),
             faiss_index = %s,
             status = 'approved',
             approved_by = %s,
-            approved_at = %s
-        WHERE id = %s;
-    """, (emb_bytes, product_id, admin_id, datetime.utcnow(), product_id))
+            approved_at = %s,
+            duplicate_of = %s,
+            duplicate_score = %s
+        WHERE id = %s
+        RETURNING text_embedding;
+    """, (emb_bytes, text_bytes, product_id, admin_id, approved_at,
+          duplicate_of, duplicate_score, product_id))
+    stored_text = cur.fetchone()[0]
 
     conn.commit()
     cur.close()
     conn.close()
 
-    return {"product_id": product_id, "status": "approved"}
+    # without a text tower, index the stored text vector if it is still
+    # current (editing the title/description clears it, see update_product)
+    if text_vec is None and stored_text is not None:
+        text_vec = np.frombuffer(stored_text, dtype="float32")
+
+    faiss_mgr.add_vector(vec, product_id, category)
+    faiss_mgr.note_watermark(approved_at)
+    if text_vec is not None:
+        text_faiss_mgr.add_vector(text_vec, product_id, category)
+        text_faiss_mgr.note_watermark(approved_at)
+    else:
+        text_faiss_mgr.remove_vector(product_id)
+
+    refresh_metadata([product_id])
+
+    return {
+        "product_id": product_id,
+        "status": "approved",
+        "near_duplicates": [{"product_id": fid, "score": round(score, 4)} for fid, score in duplicates],
+    }
 
 
 # -------------------------
@@ -193,15 +257,20 @@ def approve_product(product_id: int, admin_id: int = ADMIN_ID):
 @router.post("/approve-all")
 def approve_all_products(admin_id: int = ADMIN_ID):
     """
-    Iterates through all pending products, approves them,
-    generates embeddings, and adds them to FAISS.
+    Approves all pending products, generating their embeddings in
+    batched CLIP forward passes (skipping images already in the
+    embedding cache), and adds them to the image and text FAISS indexes.
+    Near-duplicates of already indexed products, or of an earlier product
+    of the same chunk, are flagged in `duplicate_of`.
     """
     embedder, faiss_mgr = ensure_services()
+    text_faiss_mgr = ensure_text_index()
+    embed_text = "text" in embedder.towers
 
     conn = get_connection()
     cur = conn.cursor()
 
-    cur.execute("SELECT id, image FROM products WHERE status = 'pending';")
+    cur.execute("SELECT id, image, title, description, main_category FROM products WHERE status = 'pending';")
     rows = cur.fetchall()
 
     if not rows:
@@ -210,46 +279,111 @@ def approve_all_products(admin_id: int = ADMIN_ID):
         return {"count": 0, "status": "no_pending_products"}
 
     processed = 0
+    approved_ids = []
+    flagged = 0
+    batch_size = settings.EMBED_BATCH_SIZE
 
-    for product_id, image_name in rows:
+    for start in range(0, len(rows), batch_size):
+        product_ids = []
+        images = []
+        texts = []
+        categories = {}
 
-        # Get correct image path
-        if settings.USE_CLOUD:
-            image_path = download_from_s3(image_name)
-        else:
-            image_path = os.path.join(IMAGE_DIR, image_name)
-            if not os.path.exists(image_path):
+        for product_id, image_name, title, description, category in rows[start:start + batch_size]:
+
+            # Get image bytes (local or cloud)
+            image_bytes = read_product_image(image_name)
+            if image_bytes is None:
                 continue
 
-        try:
-            vec = embedder.embed_image(image_path)
-        except Exception as e:
-            print(f"Error embedding product {product_id}: {e}")
-            continue
-        finally:
-            if settings.USE_CLOUD and os.path.exists(image_path):
-                os.remove(image_path)
+            images.append(image_bytes)
+            texts.append(product_text(title, description))
+            product_ids.append(product_id)
+            categories[product_id] = category
 
-        emb_bytes = psycopg2.Binary(vec.tobytes())
-        faiss_mgr.add_vector(vec, product_id)
+        if not images:
+            continue
 
-        cur.execute("""
-            UPDATE products
-            SET embedding = %s,
-                faiss_index = %s,
-                status = 'approved',
-                approved_by = %s,
-                approved_at = %s
-            WHERE id = %s;
-        """, (emb_bytes, product_id, admin_id, datetime.utcnow(), product_id))
+        # cache lookup + one batched forward pass for the misses
+        vectors = embed_images_cached(embedder, images)
+        text_vectors = embedder.embed_texts(texts) if embed_text else [None] * len(texts)
+
+        added_ids, added_vecs = [], []
+        text_ids, text_vecs = [], []
+        stale_text_ids = []
+        approved_at = datetime.utcnow()
+
+        # one batched near-duplicate lookup per chunk
+        valid = [(pid, v) for pid, v in zip(product_ids, vectors) if v is not None]
+        duplicates = {}
+        if valid:
+            valid_vecs = np.stack([v for _, v in valid])
+            valid_ids = [pid for pid, _ in valid]
+            found = find_near_duplicates(faiss_mgr, valid_vecs, valid_ids)
+            duplicates = {pid: hits[0] for pid, hits in zip(valid_ids, found) if hits}
+            # the chunk's own vectors are not indexed yet: compare them with each other
+            for pid, hit in find_batch_duplicates(valid_vecs, valid_ids).items():
+                duplicates.setdefault(pid, hit)
+
+        for product_id, vec, text_vec in zip(product_ids, vectors, text_vectors):
+            if vec is None:
+                print(f"Error embedding product {product_id}: invalid image")
+                continue
 
-        processed += 1
+            emb_bytes = psycopg2.Binary(vec.tobytes())
+            added_ids.append(product_id)
+            added_vecs.append(vec)
+
+            text_bytes = None
+            if text_vec is not None:
+                text_bytes = psycopg2.Binary(text_vec.tobytes())
+                text_ids.append(product_id)
+                text_vecs.append(text_vec)
+
+            cur.execute("""
+                UPDATE products
+                SET embedding = %s,
+                    text_embedding = COALESCE(%s, text_embedding),
+                    faiss_index = %s,
+                    status = 'approved',
+                    approved_by = %s,
+                    approved_at = %s,
+                    duplicate_of = %s,
+                    duplicate_score = %s
+                WHERE id = %s
+                RETURNING text_embedding;
+            """, (emb_bytes, text_bytes, product_id, admin_id, approved_at,
+                  *duplicates.get(product_id, (None, None)), product_id))
+            stored_text = cur.fetchone()[0]
+
+            # vision-only worker: reuse the stored text vector while it is
+            # current, drop a stale one from the text index (see approve_product)
+            if text_vec is None:
+                if stored_text is not None:
+                    text_ids.append(product_id)
+                    text_vecs.append(np.frombuffer(stored_text, dtype="float32"))
+                else:
+                    stale_text_ids.append(product_id)
+
+            flagged += product_id in duplicates
+            processed += 1
+            approved_ids.append(product_id)
+
+        # commit the chunk before indexing it (see approve_product), then
+        # one index update per chunk; the index file is saved write-behind
+        conn.commit()
+        faiss_mgr.add_vectors(added_vecs, added_ids, [categories[i] for i in added_ids])
+        faiss_mgr.note_watermark(approved_at)
+        text_faiss_mgr.add_vectors(text_vecs, text_ids, [categories[i] for i in text_ids])
+        text_faiss_mgr.remove_vectors(stale_text_ids)
+        text_faiss_mgr.note_watermark(approved_at)
 
-    conn.commit()
     cur.close()
     conn.close()
 
-    return {"count": processed, "status": "approved_all"}
+    refresh_metadata(approved_ids)
+
+    return {"count": processed, "near_duplicates": flagged, "status": "approved_all"}
 
 
 # -------------------------
@@ -293,7 +427,7 @@ def list_approved_products(offset: int = 0, limit: int = 50):
     cur = conn.cursor()
 
     cur.execute("""
-        SELECT id, title, price, image, faiss_index, approved_at, seller_id
+        SELECT id, title, price, image, faiss_index, approved_at, seller_id, duplicate_of, duplicate_score
         FROM products
         WHERE status = 'approved'
         ORDER BY approved_at DESC
@@ -313,6 +447,8 @@ def list_approved_products(offset: int = 0, limit: int = 50):
             "faiss_index": r[4],
             "approved_at": str(r[5]),
             "seller_id": r[6],
+            "duplicate_of": r[7],
+            "duplicate_score": r[8],
         }
         for r in rows
     ]
@@ -342,6 +478,7 @@ def delete_product_admin(product_id: int):
     # FAISS remove
     if faiss_index is not None:
         faiss_mgr.remove_vector(faiss_index)
+        ensure_text_index().remove_vector(faiss_index)
 
     # Delete image from local or S3
     if image_name:
@@ -358,6 +495,9 @@ def delete_product_admin(product_id: int):
     cur.close()
     conn.close()
 
+    if faiss_index is not None:
+        drop_metadata([faiss_index])
+
     return {"status": "deleted", "product_id": product_id}
 
 
@@ -422,6 +562,7 @@ def permanent_delete_product(product_id: int):
 
     if faiss_index is not None:
         faiss_mgr.remove_vector(faiss_index)
+        ensure_text_index().remove_vector(faiss_index)
 
     if image_name:
         if settings.USE_CLOUD:
@@ -437,6 +578,9 @@ def permanent_delete_product(product_id: int):
     cur.close()
     conn.close()
 
+    if faiss_index is not None:
+        drop_metadata([faiss_index])
+
     return {"status": "permanently_deleted", "product_id": product_id}
 
 
@@ -464,10 +608,12 @@ def permanent_delete_all_deleted_products():
 
     count = 0
 
-    for pid, image_name, faiss_index in rows:
-        if faiss_index is not None:
-            faiss_mgr.remove_vector(faiss_index)
+    # drop all vectors in one pass per index
+    faiss_ids = [faiss_index for _, _, faiss_index in rows if faiss_index is not None]
+    faiss_mgr.remove_vectors(faiss_ids)
+    ensure_text_index().remove_vectors(faiss_ids)
 
+    for pid, image_name, faiss_index in rows:
         if image_name:
             if settings.USE_CLOUD:
                 delete_from_s3(image_name)
@@ -483,6 +629,8 @@ def permanent_delete_all_deleted_products():
     cur.close()
     conn.close()
 
+    drop_metadata(faiss_ids)
+
     return {"status": "all_permanently_deleted", "count": count}
 
 
@@ -490,38 +638,41 @@ def permanent_delete_all_deleted_products():
 # 6. Rebuild FAISS
 # -------------------------
 @router.post("/rebuild-faiss")
-def rebuild_faiss_index():
+def rebuild_faiss_index(category: Optional[str] = None):
     """
-    Rebuilds the FAISS index from scratch using existing embeddings
-    stored in the database for all approved products.
+    Rebuilds the image and text FAISS indexes from scratch using existing
+    embeddings stored in the database for all approved products.
+    With category sharding on, `category` rebuilds only that shard.
     """
     embedder, faiss_mgr = ensure_services()
+    text_faiss_mgr = ensure_text_index()
 
-    conn = get_connection()
-    cur = conn.cursor()
-
-    cur.execute("""
-        SELECT faiss_index, embedding
-        FROM products
-        WHERE status='approved' AND embedding IS NOT NULL;
-    """)
+    if category is not None and not settings.FAISS_SHARD_BY_CATEGORY:
+        raise HTTPException(status_code=400, detail="Per-category rebuild needs FAISS_SHARD_BY_CATEGORY")
 
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
+    image_result = rebuild_index(faiss_mgr, "embedding", category=category)
+    if "text" in embedder.towers:
+        backfill_text_embeddings(embedder)
+    text_result = rebuild_index(text_faiss_mgr, "text_embedding", category=category)
 
-    vectors = []
-    ids = []
+    return {"status": "faiss_rebuilt", "count": image_result["count"], "text_count": text_result["count"]}
 
-    for faiss_id, emb_bytes in rows:
-        if faiss_id is not None and emb_bytes:
-            vec = np.frombuffer(emb_bytes, dtype="float32")
-            vectors.append(vec)
-            ids.append(faiss_id)
 
-    faiss_mgr.rebuild(vectors, ids)
+# -------------------------
+# 6.5 Backfill Text Embeddings
+# -------------------------
+@router.post("/backfill-text-embeddings")
+def backfill_text():
+    """
+    Embeds title + description of approved products that have no text
+    embedding (approved on a vision-only worker, or edited since) and adds
+    them to the text FAISS index. Must run on a worker with the text tower.
+    """
+    embedder, _ = ensure_services()
+    if "text" not in embedder.towers:
+        raise HTTPException(status_code=503, detail="CLIP text tower is not loaded on this worker")
 
-    return {"status": "faiss_rebuilt", "count": len(ids)}
+    return {"status": "text_backfilled", **backfill_text_embeddings(embedder, ensure_text_index())}
 
 
 # -------------------------
@@ -530,12 +681,48 @@ def rebuild_faiss_index():
 @router.post("/backup-faiss")
 def backup_faiss():
     """
-    Creates a backup of the current on-disk FAISS index file.
+    Incremental backup of the image and text FAISS indexes: syncs the
+    add/remove log and takes a new base snapshot only when one is due.
+    """
+    embedder, faiss_mgr = ensure_services()
+    text_faiss_mgr = ensure_text_index()
+
+    return {
+        "status": "backup_done",
+        "backup": faiss_mgr.backup_index(),
+        "text_backup": text_faiss_mgr.backup_index(),
+    }
+
+
+@router.get("/faiss-backups")
+def list_faiss_backups():
+    """
+    Lists the backup bases (newest first) with the size of their delta logs.
+    """
+    embedder, faiss_mgr = ensure_services()
+
+    return {"faiss_index": faiss_mgr.list_backups(), "text_faiss_index": ensure_text_index().list_backups()}
+
+
+@router.post("/restore-faiss")
+def restore_faiss(index: str = "image", base: Optional[str] = None):
+    """
+    Restores the image or text FAISS index from a backup base (default:
+    the latest) plus its replayed delta log.
     """
     embedder, faiss_mgr = ensure_services()
+    managers = {"image": faiss_mgr, "text": ensure_text_index()}
+    if index not in managers:
+        raise HTTPException(status_code=400, detail="index must be 'image' or 'text'")
+
+    try:
+        result = managers[index].restore_backup(base)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    path = faiss_mgr.backup_index()
-    return {"status": "backup_done", "path": path}
+    return {"status": "restored", "index": index, "result": result}
 
 
 # -------------------------
@@ -558,7 +745,8 @@ def faiss_stats():
     cur.execute("SELECT COUNT(*) FROM products WHERE status='approved';")
     approved = cur.fetchone()[0]
 
-    faiss_vectors = faiss_mgr.index.ntotal
+    faiss_vectors = faiss_mgr.ntotal
+    text_faiss_vectors = ensure_text_index().ntotal
 
     cur.close()
     conn.close()
@@ -567,7 +755,140 @@ def faiss_stats():
         "total_products": total,
         "approved_products": approved,
         "faiss_vectors": faiss_vectors,
+        "text_faiss_vectors": text_faiss_vectors,
+        "faiss_index": faiss_mgr.stats(),
+        "text_faiss_index": ensure_text_index().stats(),
+    }
+
+
+# -------------------------
+# 8.1 Tune FAISS search params
+# -------------------------
+@router.post("/faiss-params")
+def set_faiss_params(nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+    """
+    Adjusts IVF `nprobe` / HNSW `efSearch` of the image and text indexes
+    at runtime (higher = better recall, slower queries).
+    """
+    embedder, faiss_mgr = ensure_services()
+    text_faiss_mgr = ensure_text_index()
+
+    for mgr in (faiss_mgr, text_faiss_mgr):
+        mgr.set_search_params(nprobe=nprobe, ef_search=ef_search)
+
+    return {"faiss_index": faiss_mgr.stats(), "text_faiss_index": text_faiss_mgr.stats()}
+
+
+# -------------------------
+# 8.2 FAISS Compression Report
+# -------------------------
+@router.get("/faiss-compression-report")
+def faiss_compression_report(k: int = 10, n_queries: int = 200, index: str = "image"):
+    """
+    Builds every supported index type over the stored embeddings of the
+    image (or text) index and reports memory saved vs recall@k lost
+    compared to exact flat search.
+    """
+    if index not in ("image", "text"):
+        raise HTTPException(status_code=400, detail="index must be 'image' or 'text'")
+
+    vectors, ids, text_vectors, text_ids = load_all_product_vectors()
+    if index == "text":
+        vectors, ids = text_vectors, text_ids
+    if not ids:
+        raise HTTPException(status_code=404, detail="No embeddings to evaluate")
+
+    return {
+        "index": index,
+        "vectors": len(ids),
+        "results": compression_report(
+            vectors, ids, k=k, n_queries=n_queries,
+            rerank_factor=settings.FAISS_RERANK_FACTOR,
+        ),
+    }
+
+
+# -------------------------
+# 8.3 Near-duplicate Report
+# -------------------------
+@router.get("/near-duplicates")
+def near_duplicates(
+    index: str = "image",
+    threshold: Optional[float] = None,
+    k: Optional[int] = None,
+    batch_size: Optional[int] = None,
+):
+    """
+    Catalog-wide near-duplicate clustering via batched self-search of the
+    image (or text) index. Streams NDJSON events as they are found: pairs,
+    progress after each batch, then clusters of product ids (biggest
+    first) and a final summary. Defaults: DEDUPE_THRESHOLD / _K / _BATCH_SIZE.
+    """
+    if index not in ("image", "text"):
+        raise HTTPException(status_code=400, detail="index must be 'image' or 'text'")
+    embedder, faiss_mgr = ensure_services()
+    mgr = faiss_mgr if index == "image" else ensure_text_index()
+
+    events = near_duplicate_report(mgr, threshold, k, batch_size)
+    return StreamingResponse(
+        (json.dumps(event) + "\n" for event in events),
+        media_type="application/x-ndjson",
+    )
+
+
+# -------------------------
+# 8.4 Related Products Refresh
+# -------------------------
+@router.post("/related-products/refresh")
+def refresh_related(full: bool = False):
+    """
+    Brings the precomputed related_products table up to date now instead
+    of waiting for the background job: only changed products and the
+    lists they affect, or every approved product with `full`.
+    """
+    return refresh_related_products(full)
+
+
+# -------------------------
+# 8.5 Query Cache Stats
+# -------------------------
+@router.get("/query-cache-stats")
+def query_cache_stats():
+    """
+    Returns size and hit/miss counters of the text query embedding cache.
+    """
+    return ensure_query_cache().stats()
+
+
+# -------------------------
+# 8.6 Moderation Search
+# -------------------------
+@router.get("/search")
+def moderation_search(
+    query: str = Query(..., description="Search text"),
+    k: int = Query(settings.DEFAULT_TOP_K, description="Number of results"),
+    status: str = Query("approved", description=f"Product status: one of {STATUSES}"),
+    source: Optional[str] = Query(None, description="'image', 'text' or 'both'"),
+    category: Optional[str] = Query(None),
+    min_price: Optional[float] = Query(None),
+    max_price: Optional[float] = Query(None),
+    seller_id: Optional[int] = Query(None),
+):
+    """
+    Text search over indexed products of any status, for moderation (e.g.
+    products rejected after approval whose vectors are still indexed).
+    Public search endpoints only ever return approved products.
+    """
+    if status not in STATUSES:
+        raise HTTPException(status_code=400, detail=f"status must be one of {STATUSES}")
+    filters = {
+        "category": category,
+        "min_price": min_price,
+        "max_price": max_price,
+        "seller_id": seller_id,
+        "status": status,
     }
+    return search_by_text(query, top_k=k, source=source, filters=filters)
 
 
 # -------------------------
@@ -1,7 +1,8 @@
 from typing import List
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 
+from app.core.config import settings
 from app.schemas.product_schema import ProductCreate, ProductUpdate
 from app.services.product_service import (
     create_product,
@@ -10,6 +11,7 @@ from app.services.product_service import (
     get_product,
     update_product,
 )
+from app.services.related_products import get_related_products
 
 router = APIRouter()
 
@@ -89,6 +91,19 @@ def fetch_product(product_id: int):
     }
 
 
+# -------------------------------
+# RELATED PRODUCTS (detail page)
+# -------------------------------
+@router.get("/{product_id}/related", response_model=List[dict])
+def fetch_related_products(product_id: int, limit: int = Query(None, ge=1)):
+    """
+    Returns the precomputed related products of a product, most similar
+    first (at most RELATED_TOP_N). Empty until the background refresh
+    has covered the product.
+    """
+    return get_related_products(product_id, min(limit or settings.RELATED_TOP_N, settings.RELATED_TOP_N))
+
+
 # -------------------------------
 # UPDATE PRODUCT
 # -------------------------------
@@ -1,40 +1,88 @@
-from typing import Optional
+from typing import List, Optional
 
 from fastapi import APIRouter, File, Form, HTTPException, Query, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 
 from app.core.config import settings
 from app.services.groq_service import ask_groq_question
 from app.services.product_service import get_product
-from app.services.search_service import search_by_image, search_by_text, search_hybrid
+from app.services.search_service import (
+    search_batch,
+    search_by_image,
+    search_by_text,
+    search_hybrid,
+    search_similar,
+)
 
 router = APIRouter()
 
+
+def _filters(category, min_price, max_price, seller_id):
+    # no status: public search is approved-only (see _build_filter, /admin/search)
+    return {
+        "category": category,
+        "min_price": min_price,
+        "max_price": max_price,
+        "seller_id": seller_id,
+    }
+
+
 @router.get("/text")
 def text_search(
     query: str = Query(..., description="Search text"),
-    k: int = Query(settings.DEFAULT_TOP_K, description="Number of results")
+    k: int = Query(settings.DEFAULT_TOP_K, description="Number of results"),
+    source: str = Query(
+        settings.TEXT_SEARCH_SOURCE,
+        description="Match against product 'image' vectors, 'text' vectors or 'both'"
+    ),
+    category: Optional[str] = Query(None, description="Filter by main category"),
+    min_price: Optional[float] = Query(None),
+    max_price: Optional[float] = Query(None),
+    seller_id: Optional[int] = Query(None),
+    min_score: Optional[float] = Query(
+        None, ge=-1.0, le=1.0, description="Only return hits at least this similar (ignores k)"
+    ),
+    max_results: Optional[int] = Query(None, ge=1, description="Cap on min_score results"),
 ):
     """
     Performs a semantic search using text embedding (CLIP)
-    against the product database.
+    against the product database, optionally restricted by
+    category, price range and seller, or to hits above a similarity threshold.
     """
     if not query:
         raise HTTPException(status_code=400, detail="Query cannot be empty")
-    return search_by_text(query, top_k=k)
+    filters = _filters(category, min_price, max_price, seller_id)
+    return search_by_text(
+        query, top_k=k, source=source, filters=filters, min_score=min_score, max_results=max_results
+    )
 
 
 @router.post("/image")
 async def image_search(
     image: UploadFile = File(...),
-    k: int = settings.DEFAULT_TOP_K
+    k: int = settings.DEFAULT_TOP_K,
+    category: Optional[str] = Query(None, description="Filter by main category"),
+    min_price: Optional[float] = Query(None),
+    max_price: Optional[float] = Query(None),
+    seller_id: Optional[int] = Query(None),
+    min_score: Optional[float] = Query(
+        None, ge=-1.0, le=1.0, description="Only return hits at least this similar (ignores k)"
+    ),
+    max_results: Optional[int] = Query(None, ge=1, description="Cap on min_score results"),
 ):
     """
     Performs a visual search using the uploaded image's embedding (CLIP)
-    against the product database.
+    against the product database, optionally restricted by
+    category, price range and seller, or to hits above a similarity threshold.
     """
     img_bytes = await image.read()
-    return search_by_image(img_bytes, top_k=k)
+    filters = _filters(category, min_price, max_price, seller_id)
+    # run off the event loop so concurrent uploads can share a batch
+    return await run_in_threadpool(
+        search_by_image, img_bytes, top_k=k, filters=filters,
+        min_score=min_score, max_results=max_results,
+    )
 
 
 @router.post("/hybrid")
@@ -43,17 +91,87 @@ async def hybrid_search_endpoint(
     text: Optional[str] = Form(None),
     w_image: float = Form(settings.DEFAULT_WEIGHT_IMAGE),
     w_text: float = Form(settings.DEFAULT_WEIGHT_TEXT),
-    k: int = Query(settings.DEFAULT_TOP_K)
+    k: int = Query(settings.DEFAULT_TOP_K),
+    category: Optional[str] = Query(None, description="Filter by main category"),
+    min_price: Optional[float] = Query(None),
+    max_price: Optional[float] = Query(None),
+    seller_id: Optional[int] = Query(None),
+    min_score: Optional[float] = Query(
+        None, ge=-1.0, le=1.0, description="Only return hits at least this similar (ignores k)"
+    ),
+    max_results: Optional[int] = Query(None, ge=1, description="Cap on min_score results"),
 ):
     """
     Combines text and image search results using weighted embeddings.
-    Allows adjusting importance of text vs visual similarity.
+    Allows adjusting importance of text vs visual similarity, optionally
+    restricted by category, price range and seller, or to hits above a
+    similarity threshold.
     """
     img_bytes = None
     if image:
         img_bytes = await image.read()
 
-    return search_hybrid(img_bytes, text, w_image, w_text, top_k=k)
+    filters = _filters(category, min_price, max_price, seller_id)
+    return await run_in_threadpool(
+        search_hybrid, img_bytes, text, w_image, w_text, top_k=k, filters=filters,
+        min_score=min_score, max_results=max_results,
+    )
+
+
+@router.get("/similar/{product_id}")
+def similar_products(
+    product_id: int,
+    k: int = Query(settings.DEFAULT_TOP_K, description="Number of results"),
+    source: str = Query("image", description="Compare product 'image' or 'text' vectors"),
+    category: Optional[str] = Query(None, description="Filter by main category"),
+    min_price: Optional[float] = Query(None),
+    max_price: Optional[float] = Query(None),
+    seller_id: Optional[int] = Query(None),
+    min_score: Optional[float] = Query(
+        None, ge=-1.0, le=1.0, description="Only return hits at least this similar (ignores k)"
+    ),
+    max_results: Optional[int] = Query(None, ge=1, description="Cap on min_score results"),
+):
+    """
+    "More like this": products similar to an existing catalog product,
+    searched with its stored vector (no image upload or re-embedding).
+    The product itself is excluded.
+    """
+    filters = _filters(category, min_price, max_price, seller_id)
+    return search_similar(
+        product_id, top_k=k, source=source, filters=filters,
+        min_score=min_score, max_results=max_results,
+    )
+
+
+# -----------------------------------
+# BATCH SEARCH
+# -----------------------------------
+
+class BatchQuery(BaseModel):
+    text: Optional[str] = None
+    image: Optional[str] = None  # base64-encoded JPG/PNG bytes
+    w_image: float = settings.DEFAULT_WEIGHT_IMAGE
+    w_text: float = settings.DEFAULT_WEIGHT_TEXT
+    source: Optional[str] = None  # text-only queries: 'image', 'text' or 'both'
+    category: Optional[str] = None
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    seller_id: Optional[int] = None
+
+class BatchSearchRequest(BaseModel):
+    queries: List[BatchQuery]
+    k: int = settings.DEFAULT_TOP_K
+
+@router.post("/batch")
+async def batch_search(req: BatchSearchRequest):
+    """
+    Runs many text, image or hybrid queries in one request.
+    Queries are embedded in batched forward passes and searched with one
+    FAISS call per index. Returns one result list per query, in order.
+    """
+    queries = [q.model_dump() for q in req.queries]
+    return await run_in_threadpool(search_batch, queries, top_k=req.k)
 
 
 # -----------------------------------
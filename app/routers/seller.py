@@ -12,6 +12,7 @@ from app.core.config import settings
 from app.db.database import get_connection
 from app.schemas.product_schema import ProductCreate, ProductUpdate
 from app.services import product_service
+from app.services.global_faiss import refresh_metadata
 
 router = APIRouter()
 
@@ -224,6 +225,9 @@ async def patch_product(product_id: int, payload: ProductUpdate):
     if not success:
         raise HTTPException(status_code=400, detail="No valid fields provided or update failed")
 
+    # price/category/status changes apply to filtered search right away
+    refresh_metadata([product_id])
+
     return {
         "status": payload.status or current_status,
         "product_id": product_id,
@@ -254,6 +258,8 @@ async def delete_product(product_id: int):
     if not success:
         raise HTTPException(status_code=500, detail="Failed to delete product")
 
+    refresh_metadata([product_id])
+
     return {"status": "deleted", "product_id": product_id}
 
 
@@ -0,0 +1,202 @@
+# app/services/clip_backends.py
+
+import os
+
+import numpy as np
+
+from app.core.config import settings
+
+
+# -------------------------------------------------------
+# ONNX FILE LAYOUT
+# -------------------------------------------------------
+def onnx_path(onnx_dir: str, tower: str, quantized: bool = False) -> str:
+    """Path of an exported tower ('vision' or 'text'), int8 variant if quantized."""
+    suffix = ".int8.onnx" if quantized else ".onnx"
+    return os.path.join(onnx_dir, f"{tower}{suffix}")
+
+
+# -------------------------------------------------------
+# TOWER SELECTION
+# -------------------------------------------------------
+ALL_TOWERS = frozenset({"text", "vision"})
+
+
+def parse_towers(value: str) -> frozenset:
+    """
+    Parses CLIP_TOWERS ('both', 'text', 'vision' or 'text,vision')
+    into the set of towers a worker should load.
+    """
+    value = (value or "both").lower().strip()
+    if value in ("both", "all"):
+        return ALL_TOWERS
+    towers = frozenset(t.strip() for t in value.split(",") if t.strip())
+    if not towers or not towers <= ALL_TOWERS:
+        raise ValueError(f"Invalid CLIP_TOWERS: {value}")
+    return towers
+
+
+# -------------------------------------------------------
+# TORCH BACKEND
+# -------------------------------------------------------
+class TorchCLIPBackend:
+    """
+    Runs the CLIP projection heads with PyTorch.
+    This is the reference backend the FAISS index was built with.
+    With a single tower requested, only that half of the checkpoint
+    (CLIPTextModelWithProjection / CLIPVisionModelWithProjection) is loaded.
+    """
+
+    name = "torch"
+    variant = "torch"
+
+    def __init__(self, model_path: str, device: str, towers=ALL_TOWERS):
+        import torch
+        from transformers import (
+            CLIPTextModelWithProjection,
+            CLIPVisionModelWithProjection,
+        )
+
+        self._torch = torch
+        self.device = device
+        self.towers = frozenset(towers)
+        self.text_model = None
+        self.vision_model = None
+
+        if "text" in self.towers:
+            self.text_model = (
+                CLIPTextModelWithProjection.from_pretrained(model_path).to(device).eval()
+            )
+        if "vision" in self.towers:
+            self.vision_model = (
+                CLIPVisionModelWithProjection.from_pretrained(model_path).to(device).eval()
+            )
+
+    # -----------------------------------------------
+    def image_features(self, pixel_values: np.ndarray) -> np.ndarray:
+        torch = self._torch
+        with torch.no_grad():
+            out = self.vision_model(
+                pixel_values=torch.from_numpy(pixel_values).to(self.device)
+            ).image_embeds
+        return out.cpu().numpy().astype("float32")
+
+    # -----------------------------------------------
+    def text_features(self, input_ids: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        torch = self._torch
+        with torch.no_grad():
+            out = self.text_model(
+                input_ids=torch.from_numpy(input_ids).to(self.device),
+                attention_mask=torch.from_numpy(attention_mask).to(self.device),
+            ).text_embeds
+        return out.cpu().numpy().astype("float32")
+
+
+# -------------------------------------------------------
+# ONNX RUNTIME BACKEND
+# -------------------------------------------------------
+class OnnxCLIPBackend:
+    """
+    Runs exported ONNX vision/text towers with onnxruntime on CPU,
+    optionally the dynamically int8-quantized variants.
+    Export the towers first with `python -m app.utils.onnx_export`.
+    """
+
+    name = "onnx"
+
+    def __init__(self, onnx_dir: str, quantized: bool = False, towers=ALL_TOWERS):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise RuntimeError(
+                "EMBEDDING_BACKEND=onnx requires the 'onnxruntime' package"
+            ) from e
+
+        self.quantized = quantized
+        self.variant = "onnx-int8" if quantized else "onnx"
+        self.towers = frozenset(towers)
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if settings.ONNX_NUM_THREADS > 0:
+            opts.intra_op_num_threads = settings.ONNX_NUM_THREADS
+
+        def load(tower):
+            path = onnx_path(onnx_dir, tower, quantized)
+            if not os.path.exists(path):
+                raise RuntimeError(
+                    f"ONNX model missing: {path}. "
+                    "Run `python -m app.utils.onnx_export` first."
+                )
+            return ort.InferenceSession(path, opts, providers=["CPUExecutionProvider"])
+
+        self.vision = load("vision") if "vision" in self.towers else None
+        self.text = load("text") if "text" in self.towers else None
+
+    # -----------------------------------------------
+    def image_features(self, pixel_values: np.ndarray) -> np.ndarray:
+        (out,) = self.vision.run(
+            ["image_embeds"], {"pixel_values": pixel_values.astype("float32")}
+        )
+        return out.astype("float32")
+
+    # -----------------------------------------------
+    def text_features(self, input_ids: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        (out,) = self.text.run(
+            ["text_embeds"],
+            {
+                "input_ids": input_ids.astype("int64"),
+                "attention_mask": attention_mask.astype("int64"),
+            },
+        )
+        return out.astype("float32")
+
+
+# -------------------------------------------------------
+# FACTORY
+# -------------------------------------------------------
+def create_backend(name: str, device: str, towers=ALL_TOWERS):
+    """Builds the inference backend selected by EMBEDDING_BACKEND."""
+    name = (name or "torch").lower()
+    if name == "torch":
+        return TorchCLIPBackend(settings.MODEL_PATH, device, towers)
+    if name == "onnx":
+        return OnnxCLIPBackend(settings.ONNX_MODEL_DIR, settings.ONNX_QUANTIZE, towers)
+    raise ValueError(f"Unknown EMBEDDING_BACKEND: {name}")
+
+
+# -------------------------------------------------------
+# PARITY CHECK
+# -------------------------------------------------------
+def cosine_drift(reference: np.ndarray, candidate: np.ndarray) -> dict:
+    """
+    Row-wise cosine similarity between two (N, D) embedding matrices.
+    Vectors built by the candidate stay compatible with an index built by
+    the reference as long as the minimum cosine stays close to 1.
+    """
+    a = reference / np.maximum(np.linalg.norm(reference, axis=1, keepdims=True), 1e-12)
+    b = candidate / np.maximum(np.linalg.norm(candidate, axis=1, keepdims=True), 1e-12)
+    cos = np.sum(a * b, axis=1)
+    return {
+        "count": int(len(cos)),
+        "mean_cosine": float(cos.mean()) if len(cos) else None,
+        "min_cosine": float(cos.min()) if len(cos) else None,
+        "max_drift": float(1.0 - cos.min()) if len(cos) else None,
+    }
+
+
+def parity_report(reference, candidate, texts=None, images=None) -> dict:
+    """
+    Compares two CLIPEmbedder instances (e.g. torch vs onnx) on the same
+    sample texts and images and reports the cosine drift per tower.
+    """
+    report = {}
+    if texts:
+        report["text"] = cosine_drift(
+            reference.embed_texts(texts), candidate.embed_texts(texts)
+        )
+    if images:
+        report["image"] = cosine_drift(
+            reference.embed_images(images), candidate.embed_images(images)
+        )
+    return report
@@ -0,0 +1,127 @@
+# app/services/dedupe.py
+import numpy as np
+
+from app.core.config import settings
+
+
+def find_near_duplicates(mgr, vectors, exclude_ids=None, threshold: float = None, k: int = None):
+    """
+    k-NN lookup of each vector (one batched search) against the index.
+    Returns, per row, the [(faiss_id, score)] neighbours scoring at least
+    `threshold` (DEDUPE_THRESHOLD), best first, at most `k` (DEDUPE_K),
+    leaving out the row's own id from `exclude_ids`.
+    """
+    threshold = settings.DEDUPE_THRESHOLD if threshold is None else threshold
+    k = k or settings.DEDUPE_K
+    vecs = np.asarray(vectors, dtype="float32").reshape(-1, settings.FAISS_DIM)
+    if not len(vecs) or mgr.ntotal == 0:
+        return [[] for _ in range(len(vecs))]
+    exclude_ids = exclude_ids if exclude_ids is not None else [None] * len(vecs)
+
+    out = []
+    for own_id, (ids, scores) in zip(exclude_ids, mgr.search_batch(vecs, k + 1)):
+        hits = [
+            (int(fid), float(score)) for fid, score in zip(ids, scores)
+            if fid != -1 and fid != own_id and score >= threshold
+        ]
+        out.append(hits[:k])
+    return out
+
+
+def find_batch_duplicates(vectors, ids, threshold: float = None) -> dict:
+    """
+    Near-duplicates within one batch of vectors that are not indexed yet
+    (V @ V.T, upper triangle in id order). Returns {id: (duplicate_of,
+    score)} for every id scoring >= `threshold` with a lower id of the
+    batch, pointing at the earliest (lowest) such id.
+    """
+    threshold = settings.DEDUPE_THRESHOLD if threshold is None else threshold
+    ids = np.asarray(ids, dtype="int64")
+    if len(ids) < 2:
+        return {}
+    order = np.argsort(ids, kind="stable")
+    ids = ids[order]
+    vecs = np.asarray(vectors, dtype="float32").reshape(len(ids), -1)[order]
+
+    sims = vecs @ vecs.T
+    upper = np.triu(sims >= threshold, k=1)  # [earlier, later]
+    out = {}
+    for later in np.flatnonzero(upper.any(axis=0)):
+        earliest = int(np.argmax(upper[:, later]))
+        out[int(ids[later])] = (int(ids[earliest]), float(sims[earliest, later]))
+    return out
+
+
+class _DisjointSet:
+    """Union-find over the ids that have at least one near-duplicate."""
+
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, x):
+        parent = self.parent
+        parent.setdefault(x, x)
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+    def clusters(self):
+        groups = {}
+        for x in self.parent:
+            groups.setdefault(self.find(x), []).append(x)
+        return sorted((sorted(g) for g in groups.values()), key=lambda g: (-len(g), g[0]))
+
+
+def near_duplicate_report(mgr, threshold: float = None, k: int = None, batch_size: int = None):
+    """
+    Catalog-wide near-duplicate clustering by batched self-search: every
+    indexed vector is searched against the index in batches of
+    `batch_size` (DEDUPE_BATCH_SIZE), pairs scoring >= threshold are
+    joined with union-find, and clusters are emitted at the end.
+
+    Yields events as they are found, so callers can stream them:
+      {"type": "pair", "a", "b", "score"}    each duplicate pair once
+      {"type": "progress", "scanned", "total"} after each batch
+      {"type": "cluster", "product_ids", "size"} biggest first
+      {"type": "done", "scanned", "pairs", "clusters"}
+    Memory is O(batch_size * k) plus the ids that have duplicates; no
+    N x N similarity matrix is built. FAISS ids are product ids.
+    """
+    threshold = settings.DEDUPE_THRESHOLD if threshold is None else threshold
+    k = k or settings.DEDUPE_K
+    batch_size = batch_size or settings.DEDUPE_BATCH_SIZE
+
+    all_ids = np.sort(mgr.ids())
+    sets = _DisjointSet()
+    seen = set()
+
+    for start in range(0, len(all_ids), batch_size):
+        batch = all_ids[start:start + batch_size].tolist()
+        by_id = mgr.vectors(batch)
+        query_ids = [i for i in batch if i in by_id]
+
+        if query_ids:
+            hits = find_near_duplicates(
+                mgr, np.stack([by_id[i] for i in query_ids]), query_ids, threshold, k
+            )
+            for own_id, neighbours in zip(query_ids, hits):
+                for fid, score in neighbours:
+                    pair = (min(own_id, fid), max(own_id, fid))
+                    if pair in seen:
+                        continue
+                    seen.add(pair)
+                    sets.union(*pair)
+                    yield {"type": "pair", "a": pair[0], "b": pair[1], "score": round(score, 4)}
+
+        yield {"type": "progress", "scanned": start + len(batch), "total": len(all_ids)}
+
+    clusters = sets.clusters()
+    for members in clusters:
+        yield {"type": "cluster", "product_ids": members, "size": len(members)}
+    yield {"type": "done", "scanned": len(all_ids), "pairs": len(seen), "clusters": len(clusters)}
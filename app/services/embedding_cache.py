@@ -0,0 +1,111 @@
+# app/services/embedding_cache.py
+
+import hashlib
+from typing import Dict, List, Optional
+
+import numpy as np
+import psycopg2
+from psycopg2.extras import execute_values
+
+from app.db.database import get_connection
+from app.services.image_preprocess import DECODE_ERRORS
+
+
+def image_hash(data: bytes) -> str:
+    """SHA-256 hex digest of raw image bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+# -----------------------------------
+# LOOKUP
+# -----------------------------------
+def get_cached_embeddings(hashes: List[str], model_id: str) -> Dict[str, np.ndarray]:
+    """
+    Fetches previously computed embeddings for the given content hashes
+    in one round trip. Returns {content_hash: vector} for the hits only.
+    """
+    if not hashes:
+        return {}
+
+    conn = get_connection()
+    cur = conn.cursor()
+
+    cur.execute("""
+        SELECT content_hash, embedding
+        FROM embedding_cache
+        WHERE model_id = %s AND content_hash = ANY(%s);
+    """, (model_id, list(set(hashes))))
+
+    rows = cur.fetchall()
+    cur.close()
+    conn.close()
+
+    return {h.strip(): np.frombuffer(emb, dtype="float32") for h, emb in rows}
+
+
+# -----------------------------------
+# STORE
+# -----------------------------------
+def store_embeddings(vectors: Dict[str, np.ndarray], model_id: str):
+    """
+    Persists {content_hash: vector}. Existing entries are kept as is.
+    """
+    if not vectors:
+        return
+
+    conn = get_connection()
+    cur = conn.cursor()
+
+    execute_values(cur, """
+        INSERT INTO embedding_cache (content_hash, model_id, embedding)
+        VALUES %s
+        ON CONFLICT (content_hash, model_id) DO NOTHING;
+    """, [
+        (h, model_id, psycopg2.Binary(np.asarray(v, dtype="float32").tobytes()))
+        for h, v in vectors.items()
+    ])
+
+    conn.commit()
+    cur.close()
+    conn.close()
+
+
+# -----------------------------------
+# EMBED WITH CACHE
+# -----------------------------------
+def embed_images_cached(embedder, blobs: List[bytes]) -> List[Optional[np.ndarray]]:
+    """
+    Embeds raw image bytes, skipping CLIP inference for any image whose
+    bytes were already embedded with the same model (duplicate uploads,
+    re-approvals). Returns one vector per input, or None for images that
+    could not be decoded. Any other failure (missing vision tower, backend
+    error) propagates.
+    """
+    model_id = embedder.model_id
+    hashes = [image_hash(b) for b in blobs]
+    found = get_cached_embeddings(hashes, model_id)
+
+    # embed each distinct missing image once
+    missing = {}
+    for h, blob in zip(hashes, blobs):
+        if h not in found and h not in missing:
+            missing[h] = blob
+
+    if missing:
+        miss_hashes = list(missing)
+        computed = {}
+        try:
+            vectors = embedder.embed_images([missing[h] for h in miss_hashes])
+            computed = dict(zip(miss_hashes, vectors))
+        except DECODE_ERRORS:
+            # isolate undecodable images instead of failing the whole batch
+            for h in miss_hashes:
+                try:
+                    computed[h] = embedder.embed_image(missing[h])
+                except DECODE_ERRORS as e:
+                    print(f"[EMB CACHE] Could not embed image {h[:12]}: {e}")
+
+        store_embeddings(computed, model_id)
+        found.update(computed)
+
+    return [found.get(h) for h in hashes]
@@ -1,41 +1,241 @@
 # app/services/embedding_service.py
 
 
+import hashlib
+import json
+import os
+from concurrent.futures import Future
+from functools import lru_cache
+
 import numpy as np
-import torch
-from PIL import Image
-from transformers import CLIPModel, CLIPProcessor
+from transformers import CLIPImageProcessor, CLIPTokenizerFast
 
 from app.core.config import settings
+from app.services.clip_backends import create_backend, parse_towers
+from app.services.image_preprocess import ImagePreprocessor, config_from_processor
+
+
+# checkpoint files that define the embedding space; weights are sampled, not fully hashed
+CHECKPOINT_CONFIGS = ("config.json", "preprocessor_config.json")
+WEIGHT_SUFFIXES = (".safetensors", ".bin", ".onnx")
+WEIGHT_SAMPLE_BYTES = 1 << 20
+
+
+def checkpoint_dir(model_path: str):
+    """
+    Local directory of a checkpoint: MODEL_PATH itself, or the cached
+    snapshot of a Hugging Face Hub ID (e.g. openai/clip-vit-base-patch32).
+    None when the Hub ID is not in the local cache.
+    """
+    if os.path.isdir(model_path):
+        return model_path
+    try:
+        from huggingface_hub import snapshot_download
+
+        return snapshot_download(model_path, local_files_only=True)
+    except (ImportError, OSError, ValueError):
+        return None
+
+
+@lru_cache(maxsize=None)
+def checkpoint_fingerprint(path: str) -> str:
+    """
+    Short stable hash of a checkpoint (see checkpoint_dir): its config
+    files, plus the name, size and first and last WEIGHT_SAMPLE_BYTES of
+    each weight file (enough to tell retrained weights apart without
+    reading them whole). Unlike the directory name, it changes whenever
+    the checkpoint does. A Hub ID that is not cached locally hashes its
+    name instead.
+    """
+    digest = hashlib.sha256()
+    local = checkpoint_dir(path)
+    if local is None:
+        digest.update(f"hub:{path}".encode())
+        return digest.hexdigest()[:16]
+
+    for name in sorted(os.listdir(local)):
+        file_path = os.path.join(local, name)
+        if name in CHECKPOINT_CONFIGS:
+            with open(file_path, "rb") as f:
+                digest.update(name.encode() + f.read())
+        elif name.endswith(WEIGHT_SUFFIXES):
+            size = os.path.getsize(file_path)
+            digest.update(f"{name}:{size}".encode())
+            with open(file_path, "rb") as f:
+                digest.update(f.read(WEIGHT_SAMPLE_BYTES))
+                f.seek(max(size - WEIGHT_SAMPLE_BYTES, 0))
+                digest.update(f.read(WEIGHT_SAMPLE_BYTES))
+    return digest.hexdigest()[:16]
+
 
+def product_text(title, description) -> str:
+    """
+    Text embedded for the product-side text index: title + description
+    (the tokenizer truncates to MAX_TEXT_LENGTH tokens).
+    """
+    parts = [p.strip() for p in (title, description) if p and p.strip()]
+    return ". ".join(parts)
 
 
 class CLIPEmbedder:
-    def __init__(self, device=None):
+    def __init__(self, device=None, backend=None, towers=None):
         """
-        Initializes the CLIP model and processor.
+        Initializes the CLIP preprocessing and the inference backend
+        (PyTorch or ONNX Runtime, chosen by EMBEDDING_BACKEND).
+        Only the towers listed in CLIP_TOWERS are loaded, so a text-search
+        worker never holds the vision weights and vice versa.
         Loads from the local path defined in configuration.
         """
-        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
-        # load model & processor from local folder
-        self.model = CLIPModel.from_pretrained(settings.MODEL_PATH).to(self.device)
-        self.processor = CLIPProcessor.from_pretrained(settings.MODEL_PATH)
+        if device is None:
+            import torch  # only the torch backend needs it (see clip_backends)
+
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.device = device
+        self.towers = parse_towers(towers or settings.CLIP_TOWERS)
+
+        # load preprocessing from local folder; the backend owns the weights
+        self.tokenizer = None
+        self.image_processor = None
+        self.preprocessor = None
+        if "text" in self.towers:
+            self.tokenizer = CLIPTokenizerFast.from_pretrained(settings.MODEL_PATH)
+        if "vision" in self.towers:
+            self.image_processor = CLIPImageProcessor.from_pretrained(settings.MODEL_PATH)
+            # decode + resize runs on a process pool, in parallel with inference
+            self.preprocessor = ImagePreprocessor(
+                config_from_processor(
+                    self.image_processor,
+                    settings.IMAGE_MAX_PIXELS,
+                    draft=settings.IMAGE_DRAFT_DECODE,
+                ),
+                workers=settings.PREPROCESS_WORKERS,
+            )
+
+        self.backend = create_backend(
+            backend or settings.EMBEDDING_BACKEND, self.device, self.towers
+        )
+
+    # -----------------------------------------------
+    @property
+    def model_id(self) -> str:
+        """
+        Identifies the embedding space, used to key persisted embeddings:
+        checkpoint name and content hash, backend variant and, for image
+        workers, the preprocessing that shapes the pixels (draft decode,
+        resample filter, resize and crop size).
+        """
+        name = os.path.basename(settings.MODEL_PATH.rstrip("/"))
+        parts = [name, checkpoint_fingerprint(settings.MODEL_PATH), self.backend.variant]
+        if self.preprocessor is not None:
+            cfg = self.preprocessor.config
+            preprocessing = json.dumps({
+                "draft": cfg["draft"],
+                "resample": cfg["resample"],
+                "shortest_edge": cfg["shortest_edge"],
+                "crop": [cfg["crop_height"], cfg["crop_width"]],
+            }, sort_keys=True)
+            parts.append(hashlib.sha256(preprocessing.encode()).hexdigest()[:8])
+        return ":".join(parts)
+
+    # -----------------------------------------------
+    def _require(self, tower: str):
+        if tower not in self.towers:
+            raise RuntimeError(
+                f"CLIP {tower} tower is not loaded in this worker "
+                f"(CLIP_TOWERS={settings.CLIP_TOWERS})"
+            )
+
+    # -----------------------------------------------
+    def preprocess(self, image) -> np.ndarray:
+        """
+        Decodes and resizes one image (file path, raw bytes or PIL image)
+        into a normalized (3, 224, 224) pixel tensor on the preprocessing
+        pool. Bytes are decoded in memory, never via disk.
+        """
+        return self.preprocess_async(image).result()
 
-    def embed_image(self, image_path: str) -> np.ndarray:
+    # -----------------------------------------------
+    def preprocess_async(self, image) -> Future:
+        """
+        Schedules preprocess() on the pool and returns a Future, so the
+        images of a batch are decoded in parallel.
         """
-        Opens an image from the given path, preprocesses it with CLIPProcessor,
-        and generates a normalized (L2) 512-dimension vector embedding.
+        self._require("vision")
+        return self.preprocessor.submit(image)
+
+    # -----------------------------------------------
+    def embed_pixels(self, pixel_values: np.ndarray) -> np.ndarray:
         """
-        image = Image.open(image_path).convert("RGB")
-        inputs = self.processor(images=image, return_tensors="pt")
-        # move tensors to device
-        for k, v in inputs.items():
-            inputs[k] = v.to(self.device)
-        with torch.no_grad():
-            outputs = self.model.get_image_features(**inputs)  # (1, 512)
-        vec = outputs.cpu().numpy().astype("float32").reshape(-1)  # shape (512,)
+        Runs the vision tower on an (N, 3, 224, 224) batch of preprocessed
+        pixels and returns (N, 512) L2-normalized float32 vectors.
+        """
+        self._require("vision")
+        out = self.backend.image_features(np.asarray(pixel_values, dtype="float32"))
         # normalize to unit length for cosine similarity with IndexFlatIP
-        norm = np.linalg.norm(vec)
-        if norm > 0:
-            vec = vec / norm
-        return vec
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return out / norms
+
+    # -----------------------------------------------
+    def embed_image(self, image) -> np.ndarray:
+        """
+        Loads an image (file path, raw bytes or PIL image), preprocesses it
+        like CLIPImageProcessor, and generates a normalized (L2)
+        512-dimension vector embedding.
+        """
+        return self.embed_images([image])[0]
+
+    # -----------------------------------------------
+    def embed_images(self, images, batch_size: int = None) -> np.ndarray:
+        """
+        Embeds a list of images (file paths, raw bytes or PIL images)
+        in batches of `batch_size` forward passes.
+        Preprocessing of the next batch runs on the pool while the
+        current batch is in the model.
+        Returns an (N, 512) float32 matrix of L2-normalized vectors,
+        one row per input, in input order.
+        """
+        self._require("vision")
+        batch_size = batch_size or settings.EMBED_BATCH_SIZE
+        out = np.zeros((len(images), settings.FAISS_DIM), dtype="float32")
+
+        def submit(start):
+            chunk = images[start:start + batch_size]
+            return [self.preprocessor.submit(img) for img in chunk]
+
+        next_futures = submit(0)
+        for start in range(0, len(images), batch_size):
+            futures = next_futures
+            next_futures = submit(start + batch_size)
+
+            pixels = np.stack([f.result() for f in futures])
+            out[start:start + len(futures)] = self.embed_pixels(pixels)
+
+        return out
+
+    # -----------------------------------------------
+    def embed_texts(self, texts, batch_size: int = None) -> np.ndarray:
+        """
+        Embeds a list of text queries with the CLIP text tower.
+        Returns an (N, 512) float32 matrix of L2-normalized vectors.
+        """
+        self._require("text")
+        batch_size = batch_size or settings.EMBED_BATCH_SIZE
+        out = np.zeros((len(texts), settings.FAISS_DIM), dtype="float32")
+
+        for start in range(0, len(texts), batch_size):
+            chunk = list(texts[start:start + batch_size])
+            inputs = self.tokenizer(
+                chunk,
+                return_tensors="np",
+                padding=True,
+                truncation=True,
+                max_length=settings.MAX_TEXT_LENGTH
+            )
+            out[start:start + len(chunk)] = self.backend.text_features(
+                inputs["input_ids"], inputs["attention_mask"]
+            )
+
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return out / norms
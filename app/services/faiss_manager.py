@@ -1,97 +1,1381 @@
 # app/faiss_manager.py
+import hashlib
+import json
 import os
-import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
 from datetime import datetime
 
 import faiss
 import numpy as np
 
 from app.core.config import settings
+from app.services.index_backup import IndexBackup
 
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process index sharing
+    fcntl = None
 
 
+# Supported FAISS_INDEX_TYPE values
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw", "sq8", "fp16", "pq", "ivf_sq8")
+
+# Types whose stored codes are lossy; their scores can be refined exactly
+COMPRESSED_TYPES = ("sq8", "fp16", "pq", "ivf_pq", "ivf_sq8")
+
+
+def index_kind(index) -> str:
+    """Maps a (possibly IDMap-wrapped) FAISS index back to its INDEX_TYPES name."""
+    if isinstance(index, faiss.IndexIDMap2):
+        index = faiss.downcast_index(index.index)
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, faiss.IndexIVFScalarQuantizer):
+        return "ivf_sq8"
+    if isinstance(index, faiss.IndexIVFFlat):
+        return "ivf_flat"
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexScalarQuantizer):
+        return "fp16" if index.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq8"
+    if isinstance(index, faiss.IndexPQ):
+        return "pq"
+    return "flat"
+
+
+def index_ids(index) -> np.ndarray:
+    """Returns the external ids stored in the index (any supported type)."""
+    if isinstance(index, faiss.IndexIDMap2):
+        return faiss.vector_to_array(index.id_map).astype("int64")
+
+    ivf = faiss.extract_index_ivf(index)
+    invlists = ivf.invlists
+    parts = []
+    for list_no in range(ivf.nlist):
+        size = invlists.list_size(list_no)
+        if size:
+            ptr = invlists.get_ids(list_no)
+            parts.append(faiss.rev_swig_ptr(ptr, size).copy())
+            invlists.release_ids(list_no, ptr)
+    if not parts:
+        return np.zeros(0, dtype="int64")
+    return np.concatenate(parts).astype("int64")
+
+
+def index_memory_bytes(index) -> int:
+    """Approximate in-memory size of an index (its serialized size)."""
+    return int(faiss.serialize_index(index).nbytes)
+
+
+# -------------------------------------------------------
+# PERSISTENCE HELPERS
+# -------------------------------------------------------
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    """Streaming SHA-256 of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _fsync_file(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _fsync_dir(path: str):
+    """Makes renames inside `path` durable (no-op where unsupported)."""
+    try:
+        _fsync_file(path)
+    except OSError:
+        pass
+
+
+def ids_digest(ids) -> str:
+    """Order-independent SHA-256 of a set of int64 ids."""
+    arr = np.sort(np.asarray(ids, dtype="int64"))
+    return hashlib.sha256(arr.tobytes()).hexdigest()
+
+
+def write_json_atomic(path: str, data: dict):
+    """Writes JSON via temp file + fsync + rename."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def file_lock(path: str, shared: bool = False, blocking: bool = True):
+    """
+    Advisory flock on `path` (created if missing), used to coordinate
+    uvicorn worker processes. Yields False instead of waiting when
+    `blocking` is off and another process holds a conflicting lock.
+    """
+    if fcntl is None:
+        yield True
+        return
+
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        mode = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        try:
+            fcntl.flock(fd, mode if blocking else mode | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
+
+
+def file_state(path: str):
+    """(inode, mtime, size) of a file, or None; changes whenever it is replaced."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+# -------------------------------------------------------
+# INDEX CONSTRUCTION
+# -------------------------------------------------------
+def factory_string(index_type: str, n: int):
+    """
+    FAISS index_factory description for `index_type` and a training set
+    of `n` vectors, or None if `n` is too small to train it.
+    """
+    nlist = min(settings.FAISS_NLIST, n // 39)  # FAISS wants >= 39 points per centroid
+
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "hnsw":
+        return f"HNSW{settings.FAISS_HNSW_M}"
+    if index_type == "fp16":
+        return "SQfp16"
+    if index_type == "sq8":
+        return "SQ8" if n >= 1 else None
+    if index_type == "pq":
+        # 8-bit PQ codebooks need at least 256 training points
+        return f"PQ{settings.FAISS_PQ_M}" if n >= 256 else None
+    if index_type == "ivf_flat":
+        return f"IVF{nlist},Flat" if nlist >= 1 else None
+    if index_type == "ivf_sq8":
+        return f"IVF{nlist},SQ8" if nlist >= 1 else None
+    if index_type == "ivf_pq":
+        if nlist < 1 or n < 256:
+            return None
+        return f"IVF{nlist},PQ{settings.FAISS_PQ_M}"
+    return None
+
+
+def build_index(index_type: str, dim: int, vectors_np: np.ndarray, ids_np: np.ndarray):
+    """
+    Builds (and trains, if needed) a new index of `index_type` holding
+    the given vectors. Falls back to a flat index when there are too few
+    vectors to train that type.
+    """
+    desc = factory_string(index_type, len(vectors_np)) or "Flat"
+    inner = faiss.index_factory(dim, desc, faiss.METRIC_INNER_PRODUCT)
+    if not inner.is_trained:
+        inner.train(vectors_np)
+
+    if isinstance(inner, faiss.IndexIVF):
+        # IVF maps ids natively; IDMap2 over IVF breaks on remove_ids.
+        # The hashtable direct map keeps reconstruct() + removals working.
+        inner.set_direct_map_type(faiss.DirectMap.Hashtable)
+        index = inner
+    else:
+        index = faiss.IndexIDMap2(inner)
+
+    if len(vectors_np):
+        index.add_with_ids(vectors_np, ids_np)
+    return index
+
+
+# -------------------------------------------------------
+# COMPRESSION REPORT
+# -------------------------------------------------------
+def compression_report(vectors, ids, index_types=INDEX_TYPES, k: int = 10,
+                       n_queries: int = 200, rerank_factor: int = 4) -> list:
+    """
+    Builds each index type over the same float32 vectors and reports its
+    memory next to the exact flat index, plus recall@k against exact
+    search (and, for compressed codes, recall after exact re-scoring of
+    the top k * rerank_factor candidates). Queries are sampled from the
+    stored vectors.
+    """
+    vectors_np = np.asarray(vectors, dtype="float32").reshape(len(vectors), -1)
+    ids_np = np.asarray(ids, dtype="int64")
+    if not len(vectors_np):
+        return []
+
+    dim = vectors_np.shape[1]
+    k = min(k, len(vectors_np))
+    rng = np.random.default_rng(0)
+    queries = vectors_np[rng.choice(len(vectors_np), min(n_queries, len(vectors_np)), replace=False)]
+    by_id = dict(zip(ids_np.tolist(), vectors_np))
+
+    exact = build_index("flat", dim, vectors_np, ids_np)
+    flat_bytes = index_memory_bytes(exact)
+    _, truth = exact.search(queries, k)
+
+    def recall(found):
+        hits = sum(len(set(f[:k]) & set(t)) for f, t in zip(found, truth))
+        return hits / float(truth.size)
+
+    report = []
+    for index_type in index_types:
+        index = build_index(index_type, dim, vectors_np, ids_np)
+        kind = index_kind(index)
+        params = _default_params(kind)
+
+        _, found = index.search(queries, k, params=params)
+        row = {
+            "type": index_type,
+            "built_as": kind,
+            "memory_bytes": index_memory_bytes(index),
+            "memory_ratio": round(index_memory_bytes(index) / float(flat_bytes), 4),
+            f"recall@{k}": round(recall(found.tolist()), 4),
+        }
+
+        if kind in COMPRESSED_TYPES and rerank_factor > 1:
+            _, cand = index.search(queries, k * rerank_factor, params=params)
+            reranked = [
+                _exact_order(q, [i for i in row_ids if i >= 0], by_id)
+                for q, row_ids in zip(queries, cand.tolist())
+            ]
+            row[f"recall@{k}_rescored"] = round(recall([ids_ for ids_, _ in reranked]), 4)
+
+        report.append(row)
+    return report
+
+
+def _default_params(kind: str):
+    if kind in ("ivf_flat", "ivf_pq", "ivf_sq8"):
+        return faiss.SearchParametersIVF(nprobe=settings.FAISS_NPROBE)
+    if kind == "hnsw":
+        return faiss.SearchParametersHNSW(efSearch=settings.FAISS_EF_SEARCH)
+    return None
+
+
+def _exact_order(query: np.ndarray, candidate_ids: list, vectors_by_id: dict):
+    """
+    Re-scores candidates with exact inner products on their float vectors.
+    Candidates without a stored vector are dropped.
+    """
+    known = [i for i in candidate_ids if i in vectors_by_id]
+    if not known:
+        return [], []
+    mat = np.stack([np.asarray(vectors_by_id[i], dtype="float32") for i in known])
+    scores = mat @ np.asarray(query, dtype="float32").reshape(-1)
+    order = np.argsort(-scores)
+    return [known[j] for j in order], [float(scores[j]) for j in order]
+
+
+# -------------------------------------------------------
+# INDEX SNAPSHOTS
+# -------------------------------------------------------
+def _new_base_id() -> str:
+    return uuid.uuid4().hex
+
+
+def _merge_hits(ids_a, scores_a, ids_b, scores_b, k: int):
+    """Top-k of two disjoint hit lists by score, best first (-1 padding dropped)."""
+    hits = [(s, i) for i, s in zip(ids_a, scores_a) if i != -1]
+    hits += [(s, i) for i, s in zip(ids_b, scores_b) if i != -1]
+    hits.sort(key=lambda h: -h[0])
+    return [i for _, i in hits[:k]], [s for s, _ in hits[:k]]
+
+
+class IndexSnapshot:
+    """
+    One published, immutable state of a FaissManager index:
+
+    - `base`: the trained index (possibly memory-mapped), never modified
+    - `delta_ids` / `delta_vectors`: vectors added or updated since the
+      base was built, sorted by id and searched exactly (flat)
+    - `tombstones`: base ids deleted or superseded since, kept out of
+      base searches by an IDSelector over a bitmap
+
+    Live ids = base ids - tombstones + delta ids (disjoint). Writers
+    derive a new snapshot, copying only the small delta, and publish it;
+    the base is replaced only when the delta is folded into it.
+    """
+
+    def __init__(self, base, base_id: str, delta_ids=None, delta_vectors=None, tombstones=None):
+        self.base = base
+        self.base_id = base_id
+        dim = base.d
+        self.delta_ids = np.asarray(delta_ids if delta_ids is not None else [], dtype="int64")
+        if delta_vectors is None:
+            delta_vectors = np.zeros((0, dim), dtype="float32")
+        self.delta_vectors = np.ascontiguousarray(delta_vectors, dtype="float32").reshape(len(self.delta_ids), dim)
+        self.tombstones = np.asarray(tombstones if tombstones is not None else [], dtype="int64")
+
+        self.delta = None
+        if len(self.delta_ids):
+            self.delta = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+            self.delta.add_with_ids(self.delta_vectors, self.delta_ids)
+
+        # bit i set = base id i is dead; live_selector accepts every other id
+        self._dead_bitmap = None
+        self._dead_selector = None
+        self.live_selector = None
+        if len(self.tombstones):
+            dead = self.tombstones
+            self._dead_bitmap = np.zeros(int(dead.max() >> 3) + 1, dtype="uint8")
+            np.bitwise_or.at(self._dead_bitmap, dead >> 3, (1 << (dead & 7)).astype("uint8"))
+            self._dead_selector = faiss.IDSelectorBitmap(len(self._dead_bitmap), faiss.swig_ptr(self._dead_bitmap))
+            self.live_selector = faiss.IDSelectorNot(self._dead_selector)
+
+    # -----------------------------------------------
+    @property
+    def ntotal(self) -> int:
+        return int(self.base.ntotal) - len(self.tombstones) + len(self.delta_ids)
+
+    # -----------------------------------------------
+    def ids(self) -> np.ndarray:
+        base_ids = index_ids(self.base)
+        if len(self.tombstones):
+            base_ids = base_ids[~np.isin(base_ids, self.tombstones)]
+        return np.concatenate([base_ids, self.delta_ids])
+
+    # -----------------------------------------------
+    def is_dead(self, ids) -> np.ndarray:
+        """True for ids whose base entry is tombstoned."""
+        return np.isin(np.asarray(ids, dtype="int64"), self.tombstones)
+
+    # -----------------------------------------------
+    def allowed(self, ids, id_filter=None) -> np.ndarray:
+        """Which base hits are live and pass `id_filter` (-1 padding never is)."""
+        ids = np.asarray(ids, dtype="int64")
+        keep = (ids >= 0) & ~self.is_dead(ids)
+        if id_filter is not None:
+            keep &= id_filter.contains(ids)
+        return keep
+
+    # -----------------------------------------------
+    def selector(self, id_filter=None):
+        """
+        IDSelector of the live base ids accepted by `id_filter` (None when
+        every id is). The caller keeps the returned object alive while
+        searching; the snapshot keeps the tombstone selectors alive.
+        """
+        if id_filter is None:
+            return self.live_selector
+        if self.live_selector is None:
+            return id_filter.selector
+        return faiss.IDSelectorAnd(id_filter.selector, self.live_selector)
+
+    # -----------------------------------------------
+    def delta_vectors_of(self, ids) -> dict:
+        """{id: vector} of the given ids that are in the delta."""
+        if not len(self.delta_ids):
+            return {}
+        ids = np.asarray(ids, dtype="int64")
+        rows = np.minimum(np.searchsorted(self.delta_ids, ids), len(self.delta_ids) - 1)
+        hit = self.delta_ids[rows] == ids
+        return {int(fid): self.delta_vectors[row] for fid, row in zip(ids[hit], rows[hit])}
+
+    # -----------------------------------------------
+    def _in_base(self, ids: np.ndarray) -> np.ndarray:
+        """Which ids have a live (not tombstoned) entry in the base."""
+        found = np.zeros(len(ids), dtype=bool)
+        for row, fid in enumerate(ids.tolist()):
+            try:
+                self.base.reconstruct(fid)
+                found[row] = True
+            except RuntimeError:
+                pass
+        return found & ~self.is_dead(ids)
+
+    # -----------------------------------------------
+    def _tombstoned(self, ids: np.ndarray) -> np.ndarray:
+        return np.union1d(self.tombstones, ids[self._in_base(ids)])
+
+    # -----------------------------------------------
+    def with_added(self, ids, vectors) -> "IndexSnapshot":
+        """Snapshot with vectors added or updated (the last one wins for a repeated id)."""
+        ids = np.asarray(ids, dtype="int64")
+        vectors = np.asarray(vectors, dtype="float32").reshape(len(ids), -1)
+        ids, last = np.unique(ids[::-1], return_index=True)
+        vectors = vectors[::-1][last]
+
+        keep = ~np.isin(self.delta_ids, ids)
+        delta_ids = np.concatenate([self.delta_ids[keep], ids])
+        delta_vectors = np.concatenate([self.delta_vectors[keep], vectors])
+        order = np.argsort(delta_ids, kind="stable")
+        return IndexSnapshot(
+            self.base, self.base_id, delta_ids[order], delta_vectors[order], self._tombstoned(ids)
+        )
+
+    # -----------------------------------------------
+    def with_removed(self, ids) -> "IndexSnapshot":
+        """Snapshot without the given ids."""
+        ids = np.unique(np.asarray(ids, dtype="int64"))
+        keep = ~np.isin(self.delta_ids, ids)
+        return IndexSnapshot(
+            self.base, self.base_id, self.delta_ids[keep], self.delta_vectors[keep], self._tombstoned(ids)
+        )
+
 
 class FaissManager:
-    def __init__(self):
+    def __init__(self, name: str = "index", vector_loader=None):
+        """
+        Manages one persisted FAISS index, stored as `<name>.faiss`
+        in FAISS_INDEX_DIR (image vectors use "index", product text
+        vectors use "text_index").
+        The index structure (flat / IVF / HNSW / SQ / PQ) follows
+        FAISS_INDEX_TYPE and is (re)trained on rebuild.
+
+        `vector_loader(ids) -> {id: float32 vector}` supplies the original
+        vectors used to re-score results of compressed indexes exactly
+        (see FAISS_RERANK_FACTOR).
+        """
+        self.name = name
+        self.vector_loader = vector_loader
+        self.rerank_factor = settings.FAISS_RERANK_FACTOR
         self.index_dir = settings.FAISS_INDEX_DIR
-        self.index_path = os.path.join(self.index_dir, "index.faiss")
+        self.index_path = os.path.join(self.index_dir, f"{name}.faiss")
+        # sidecar with checksum, size and type of the last complete save
+        self.meta_path = os.path.join(self.index_dir, f"{name}.meta.json")
+        # vectors added / ids removed since the base file was written
+        self.delta_path = os.path.join(self.index_dir, f"{name}.delta.npz")
+        self.delta_max = settings.FAISS_DELTA_MAX
+        # HNSW: share of tombstoned base entries that triggers a graph rebuild
+        self.tombstone_max_fraction = settings.FAISS_TOMBSTONE_MAX_FRACTION
         self.dim = settings.FAISS_DIM
-        
+        self.index_type = settings.FAISS_INDEX_TYPE
+        if self.index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown FAISS_INDEX_TYPE: {self.index_type}")
+
+        # runtime-tunable search parameters
+        self.nprobe = settings.FAISS_NPROBE
+        self.ef_search = settings.FAISS_EF_SEARCH
+
+        # write-behind persistence: mutations mark the index dirty and a
+        # background thread saves it (see FAISS_FLUSH_INTERVAL / _THRESHOLD)
+        self.flush_interval = settings.FAISS_FLUSH_INTERVAL
+        self.flush_threshold = settings.FAISS_FLUSH_THRESHOLD
+        self._lock = threading.RLock()
+        self._dirty = 0
+        self._stop = threading.Event()
+        self._flusher = None
+
+        # Concurrency: readers grab `self.snapshot` once and search it
+        # without locking. Writers (serialized by `_lock`) derive a new
+        # snapshot and swap it in, so a published one is never modified.
+        # Mutations only touch the snapshot's small delta; the base index
+        # is copied when the delta is folded into it (see FAISS_DELTA_MAX).
+        self.generation = 0
+        # True while the base index is a read-only view of the mmapped file
+        self._mapped = False
+
+        # FAISS_SHARED: all workers map the published file; writers publish
+        # under an exclusive lock on `<name>.lock` and readers remap when
+        # the file changes (checked every FAISS_SHARED_CHECK_INTERVAL s)
+        self.shared = settings.FAISS_SHARED
+        if self.shared and fcntl is None:
+            raise RuntimeError("FAISS_SHARED needs POSIX file locks (fcntl)")
+        self.check_interval = settings.FAISS_SHARED_CHECK_INTERVAL
+        self.lock_path = os.path.join(self.index_dir, f"{name}.lock")
+        self._file_state = None  # state of the published files the snapshot came from
+        self._next_check = 0.0
+        self._writing = False  # this process holds the exclusive file lock
+        # sidecar of the file this index was loaded from ({} if none / rejected)
+        self.loaded_meta = {}
+        # latest approved_at (UTC) known to be reflected in the index
+        self.watermark = None
+        # incremental backups: base snapshots + delta log of adds/removes
+        self.backup = IndexBackup(name)
+
         os.makedirs(self.index_dir, exist_ok=True)
-        self.index = None
+        self.snapshot = None
         self._load_or_create()
+        with self.writer():  # shared: another worker may be appending
+            self.backup.repair()
+
+    # -----------------------------------------------
+    @property
+    def index(self):
+        """Base index of the current snapshot (without the pending delta)."""
+        return self.snapshot.base
 
     # -----------------------------------------------
     def _load_or_create(self):
-        """Load existing FAISS index or create a new one."""
-        if os.path.exists(self.index_path):
-            try:
-                idx = faiss.read_index(self.index_path)
-                self.index = faiss.IndexIDMap2(idx)
-            except Exception:
-                self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(self.dim))
+        """
+        Load existing FAISS index or create a new one.
+        The file is checked against its checksum sidecar first; a file
+        that fails the check or cannot be parsed is moved aside as
+        `.corrupt` (and reported) rather than silently overwritten.
+        With FAISS_MMAP (always on for FAISS_SHARED) the codes are
+        memory-mapped instead of read.
+        """
+        if self.shared:
+            # a writer in another worker may be mid-publish
+            with file_lock(self.lock_path, shared=True):
+                self._load_file()
         else:
-            self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(self.dim))
+            self._load_file()
 
     # -----------------------------------------------
-    def save(self):
-        """Save FAISS index to disk."""
-        faiss.write_index(self.index, self.index_path)
+    def _load_file(self):
+        self.snapshot = IndexSnapshot(self._empty_index(), _new_base_id())
+        self._mapped = False
+        self.loaded_meta = {}
+        self.watermark = None
+
+        if not os.path.exists(self.index_path):
+            return
+
+        problem, meta = self._verify_file()
+        if problem:
+            self._quarantine(problem)
+            return
+
+        mmap = settings.FAISS_MMAP or self.shared
+        state = self._published_state()
+        try:
+            idx = self._read_index(mmap)
+        except Exception as e:
+            self._quarantine(f"unreadable ({e})")
+            return
+
+        self._mapped = mmap
+        self._file_state = state
+        self.loaded_meta = meta
+        # files saved before deltas existed get a base id on the next save
+        self.snapshot = IndexSnapshot(idx, self.loaded_meta.get("base_id") or _new_base_id())
+        watermark = self._attach_delta()
+        if watermark:
+            self.watermark = datetime.fromisoformat(watermark)
 
     # -----------------------------------------------
-    def add_vector(self, vector: np.ndarray, id_: int):
-        """Add/update one vector"""
-        vec = np.asarray(vector, dtype="float32").reshape(1, -1)
-        ids = np.array([id_], dtype="int64")
+    def _published_state(self):
+        return file_state(self.index_path), file_state(self.delta_path)
+
+    # -----------------------------------------------
+    def _attach_delta(self):
+        """
+        Applies the published delta file to the current base, if it was
+        written against it. Returns the published watermark (ISO string)
+        of the base + delta pair, or None.
+        """
+        base = self.snapshot
+        published = self._read_delta(self.delta_path, base.base_id)
+        if published is None:
+            self.snapshot = IndexSnapshot(base.base, base.base_id)
+            return self.loaded_meta.get("watermark")
+        ids, vectors, tombstones, meta = published
+        self.snapshot = IndexSnapshot(base.base, base.base_id, ids, vectors, tombstones)
+        return meta.get("watermark")
+
+    # -----------------------------------------------
+    @staticmethod
+    def _read_delta(path: str, base_id: str):
+        """
+        (ids, vectors, tombstones, meta) of a delta file written against
+        base `base_id`, or None. A delta of another base was already folded
+        into a newer one (or belongs to a replaced index) and is ignored.
+        """
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                meta = json.loads(str(data["meta"]))
+                if meta.get("base_id") != base_id:
+                    return None
+                return data["ids"], data["vectors"], data["tombstones"], meta
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[FAISS] Ignoring unreadable delta {path}: {e}")
+            return None
+
+    # -----------------------------------------------
+    def _read_index(self, mmap: bool):
+        idx = faiss.read_index(self.index_path, faiss.IO_FLAG_MMAP_IFC if mmap else 0)
+        # written indexes are already IDMap2 / native IVF; only wrap bare ones
+        if not isinstance(idx, (faiss.IndexIDMap2, faiss.IndexIVF)):
+            idx = faiss.IndexIDMap2(idx)
+        return idx
 
+    # -----------------------------------------------
+    def read_meta(self) -> dict:
+        """Sidecar metadata of the last complete save ({} if none)."""
         try:
-            self.index.remove_ids(ids)
-        except Exception:
-            pass
+            with open(self.meta_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
 
-        self.index.add_with_ids(vec, ids)
-        self.save()
+    # -----------------------------------------------
+    def _verify_file(self):
+        """
+        Checks the index file against its sidecar. Returns (problem, meta):
+        why the file fails the check (None if it passes) and the sidecar
+        entry describing it. The sidecar is renamed before the index (see
+        _write_base), so after a crash between the two renames the file
+        still matches the sidecar's `previous` entry and is accepted.
+        """
+        meta = self.read_meta()
+        if not meta:
+            # index written before checksums were introduced
+            print(f"[FAISS] No checksum for {self.index_path}; loading unverified.")
+            return None, {}
+
+        size = os.path.getsize(self.index_path)
+        entries = [meta] + ([meta["previous"]] if meta.get("previous") else [])
+        entries = [m for m in entries if m.get("size") == size]
+        if not entries:
+            return f"size {size} != expected {meta.get('size')}", meta
+        if settings.FAISS_VERIFY_CHECKSUM:
+            digest = file_sha256(self.index_path)
+            entries = [m for m in entries if m.get("sha256") == digest]
+            if not entries:
+                return "checksum mismatch", meta
+
+        if entries[0] is not meta:
+            print(f"[FAISS] Last save of {self.index_path} was interrupted; loading the previous index.")
+        return None, entries[0]
 
     # -----------------------------------------------
-    def remove_vector(self, product_id: int):
-        """Remove vector by FAISS ID"""
+    def _quarantine(self, reason: str):
+        stamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+        corrupt_path = f"{self.index_path}.corrupt-{stamp}"
+        try:
+            os.replace(self.index_path, corrupt_path)
+        except FileNotFoundError:
+            return  # already moved aside by another worker
+        print(f"[FAISS] Index {self.index_path} is corrupt ({reason}); moved to {corrupt_path}. Starting empty.")
+
+    # -----------------------------------------------
+    def _writable_base(self, snapshot: IndexSnapshot):
+        """
+        Private, writable copy of a snapshot's base for folding the delta
+        into. A memory-mapped index is copied into RAM (clone_index would
+        keep viewing the mapped pages, which FAISS cannot resize).
+        """
+        if self._mapped and snapshot.base is self.snapshot.base:
+            return faiss.deserialize_index(faiss.serialize_index(snapshot.base))
+        return faiss.clone_index(snapshot.base)
+
+    # -----------------------------------------------
+    def _swap(self, snapshot: IndexSnapshot):
+        """Publishes a new snapshot generation (a single reference assignment)."""
+        if snapshot.base is not self.snapshot.base:
+            self._mapped = False
+        self.snapshot = snapshot
+        self.generation += 1
+
+    # -----------------------------------------------
+    def _fold_due(self, snapshot: IndexSnapshot) -> bool:
+        if index_kind(snapshot.base) != "hnsw":
+            return len(snapshot.delta_ids) + len(snapshot.tombstones) >= self.delta_max
+        fresh = ~np.isin(snapshot.delta_ids, snapshot.tombstones)
+        return fresh.sum() >= self.delta_max or self._compaction_due(snapshot)
+
+    # -----------------------------------------------
+    def _compaction_due(self, snapshot: IndexSnapshot) -> bool:
+        """
+        HNSW graphs cannot delete in place, so tombstones stay in the base
+        across folds (updated ids stay in the delta) until they exceed
+        FAISS_TOMBSTONE_MAX_FRACTION of it or the updates fill a delta.
+        """
+        superseded = np.isin(snapshot.delta_ids, snapshot.tombstones).sum()
+        return (
+            len(snapshot.tombstones) > self.tombstone_max_fraction * snapshot.base.ntotal
+            or superseded >= self.delta_max
+        )
+
+    # -----------------------------------------------
+    def _fold(self, snapshot: IndexSnapshot, copy: bool = True) -> IndexSnapshot:
+        """
+        New snapshot with the delta of `snapshot` merged into a new base
+        (one copy of the base for all mutations since the last fold).
+        `copy=False` folds into the base in place; only for a base that
+        was never published.
+        """
+        base = self._writable_base(snapshot) if copy else snapshot.base
+        if index_kind(base) == "hnsw" and not self._compaction_due(snapshot):
+            # keep the tombstones; only ids new to the base join the graph
+            fresh = ~np.isin(snapshot.delta_ids, snapshot.tombstones)
+            if fresh.any():
+                base.add_with_ids(snapshot.delta_vectors[fresh], snapshot.delta_ids[fresh])
+            return IndexSnapshot(
+                base, _new_base_id(),
+                snapshot.delta_ids[~fresh], snapshot.delta_vectors[~fresh], snapshot.tombstones,
+            )
+
+        if len(snapshot.tombstones):
+            base = self._remove_ids(base, snapshot.tombstones)
+        if len(snapshot.delta_ids):
+            base.add_with_ids(snapshot.delta_vectors, snapshot.delta_ids)
+        return IndexSnapshot(base, _new_base_id())
+
+    # -----------------------------------------------
+    def fold(self):
+        """Merges the pending delta into a new base index and saves it."""
+        with self.writer():
+            if len(self.snapshot.delta_ids) or len(self.snapshot.tombstones):
+                self._swap(self._fold(self.snapshot))
+            self.save()
+
+    # -----------------------------------------------
+    def refresh(self, force: bool = False) -> bool:
+        """
+        FAISS_SHARED: maps the latest published generation if another
+        worker published one since this worker last looked. The check is a
+        single stat() of the index file, made at most every
+        FAISS_SHARED_CHECK_INTERVAL seconds unless `force`; it never waits
+        for a writer. Returns True when a new generation was mapped.
+        """
+        if not self.shared:
+            return False
+        now = time.monotonic()
+        if not force and now < self._next_check:
+            return False
+        self._next_check = now + self.check_interval
+
+        if self._published_state() == self._file_state:
+            return False
+        # an in-process writer is about to publish; pick it up next time
+        if not self._lock.acquire(blocking=False):
+            return False
         try:
-            self.index.remove_ids(np.array([product_id], dtype="int64"))
+            if self._writing:
+                return self._map_published()
+            with file_lock(self.lock_path, shared=True, blocking=False) as locked:
+                return self._map_published() if locked else False
+        finally:
+            self._lock.release()
+
+    # -----------------------------------------------
+    def _map_published(self) -> bool:
+        """
+        Maps the published base and delta (caller holds a file lock so they
+        are complete). The base is only remapped when it was replaced.
+        """
+        state = self._published_state()
+        if state[0] is None or state == self._file_state:
+            return False
+        if self._file_state is None or state[0] != self._file_state[0]:
+            self.loaded_meta = self.read_meta()
+            base = IndexSnapshot(self._read_index(mmap=True), self.loaded_meta.get("base_id") or _new_base_id())
+            self._swap(base)
+            self._mapped = True
+        else:
+            self._swap(self.snapshot)
+        self._file_state = state
+
+        published = self._attach_delta()
+        if published:
+            published = datetime.fromisoformat(published)
+            if self.watermark is None or published > self.watermark:
+                self.watermark = published
+        return True
+
+    # -----------------------------------------------
+    @contextmanager
+    def writer(self):
+        """
+        Serializes index writers. With FAISS_SHARED this also holds an
+        exclusive lock on `<name>.lock`, so writers in other workers wait,
+        and maps the latest published generation first, so their changes
+        are not lost. Mutations made inside are published (saved) before
+        the lock is released. Re-entrant.
+        """
+        with self._lock:
+            if not self.shared or self._writing:
+                yield
+                return
+            with file_lock(self.lock_path):
+                self._writing = True
+                try:
+                    self.refresh(force=True)
+                    yield
+                finally:
+                    self._writing = False
+
+    # -----------------------------------------------
+    def _empty_index(self):
+        """Exact flat index; trained index types are built on rebuild."""
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(self.dim))
+
+    # -----------------------------------------------
+    def _build_index(self, vectors_np: np.ndarray, ids_np: np.ndarray):
+        """Builds a new index of the configured type holding the given vectors."""
+        return build_index(self.index_type, self.dim, vectors_np, ids_np)
+
+    # -----------------------------------------------
+    def _search_params(self, index=None, selector=None):
+        """
+        Per-query search parameters for the current index type, optionally
+        restricted to the ids accepted by a FAISS IDSelector.
+        """
+        index = index if index is not None else self.index
+        kind = index_kind(index)
+        if kind in ("ivf_flat", "ivf_pq", "ivf_sq8"):
+            return faiss.SearchParametersIVF(sel=selector, nprobe=self.nprobe)
+        if kind == "hnsw":
+            return faiss.SearchParametersHNSW(sel=selector, efSearch=self.ef_search)
+        if selector is not None:
+            return faiss.SearchParameters(sel=selector)
+        return None
+
+    # -----------------------------------------------
+    def _index_search(self, snapshot: IndexSnapshot, vecs: np.ndarray, k: int, id_filter=None):
+        """
+        Runs index.search on the snapshot's base, restricted to its live
+        ids and to `id_filter` (see metadata_store.IdFilter) when given.
+        The filter is applied inside FAISS; IndexPQ has no selector
+        support, so it over-fetches and filters afterwards instead.
+        """
+        index = snapshot.base
+        out_scores = np.full((len(vecs), k), np.finfo("float32").min, dtype="float32")
+        out_ids = np.full((len(vecs), k), -1, dtype="int64")
+        if index.ntotal == 0:
+            return out_scores, out_ids
+
+        selector = snapshot.selector(id_filter)
+        if selector is None or index_kind(index) != "pq":
+            return index.search(vecs, k, params=self._search_params(index, selector))
+
+        fetch = k
+        while True:
+            fetch = min(max(fetch * 8, k), int(index.ntotal))
+            scores, ids = index.search(vecs, max(fetch, 1))
+            if fetch >= index.ntotal or all(
+                snapshot.allowed(row, id_filter).sum() >= k for row in ids
+            ):
+                break
+
+        for r, (row_ids, row_scores) in enumerate(zip(ids, scores)):
+            keep = snapshot.allowed(row_ids, id_filter)
+            kept_ids, kept_scores = row_ids[keep][:k], row_scores[keep][:k]
+            out_ids[r, :len(kept_ids)] = kept_ids
+            out_scores[r, :len(kept_scores)] = kept_scores
+        return out_scores, out_ids
+
+    # -----------------------------------------------
+    @staticmethod
+    def _delta_params(id_filter=None):
+        return faiss.SearchParameters(sel=id_filter.selector) if id_filter is not None else None
+
+    # -----------------------------------------------
+    def set_search_params(self, nprobe: int = None, ef_search: int = None):
+        """Tunes IVF nprobe / HNSW efSearch at runtime (applies to the next query)."""
+        if nprobe is not None:
+            self.nprobe = max(1, int(nprobe))
+        if ef_search is not None:
+            self.ef_search = max(1, int(ef_search))
+
+    # -----------------------------------------------
+    def _remove_ids(self, index, ids_np: np.ndarray):
+        """
+        Removes ids from an unpublished index and returns it. HNSW graphs
+        cannot delete in place, so they are rebuilt from the remaining
+        stored vectors instead (compaction, see _compaction_due).
+        """
+        if index_kind(index) != "hnsw":
+            index.remove_ids(ids_np)
+            return index
+
+        current = index_ids(index)
+        keep = ~np.isin(current, ids_np)
+        if keep.all():
+            return index
+        vectors = index.index.reconstruct_n(0, index.ntotal)
+        rebuilt = faiss.IndexIDMap2(
+            faiss.index_factory(self.dim, f"HNSW{settings.FAISS_HNSW_M}", faiss.METRIC_INNER_PRODUCT)
+        )
+        rebuilt.add_with_ids(vectors[keep], current[keep])
+        return rebuilt
+
+    # -----------------------------------------------
+    def save(self):
+        """
+        Saves the index, folding the delta into a new base first when it
+        has grown past FAISS_DELTA_MAX. The base file is only rewritten
+        when the base changed; otherwise just the (small) delta file is.
+        Both are written atomically: temp file, fsync, checksum sidecar,
+        rename, so a crash mid-write never leaves a truncated file behind.
+        With FAISS_SHARED a new base file is then mapped in place of the
+        private copy, so all workers share its pages.
+        """
+        with self.writer():
+            if self._fold_due(self.snapshot):
+                self._swap(self._fold(self.snapshot))
+            snapshot = self.snapshot
+
+            wrote_base = snapshot.base_id != self.loaded_meta.get("base_id")
+            if wrote_base:
+                self._write_base(snapshot)
+            self._write_delta(snapshot)
+            _fsync_dir(self.index_dir)
+            self._dirty = 0
+            if self.shared:
+                if wrote_base:
+                    self._map_published()
+                else:
+                    self._file_state = self._published_state()
+
+            self.backup.sync()
+            self._roll_backup()
+
+    # -----------------------------------------------
+    def _write_base(self, snapshot: IndexSnapshot):
+        index = snapshot.base
+        tmp_path = f"{self.index_path}.tmp"
+        faiss.write_index(index, tmp_path)
+        _fsync_file(tmp_path)
+
+        meta = {
+            "sha256": file_sha256(tmp_path),
+            "size": os.path.getsize(tmp_path),
+            "type": index_kind(index),
+            "configured_type": self.index_type,
+            "ntotal": int(index.ntotal),
+            "dim": self.dim,
+            "ids_hash": ids_digest(index_ids(index)),
+            "base_id": snapshot.base_id,
+            "watermark": self.watermark.isoformat() if self.watermark else None,
+            "saved_at": datetime.utcnow().isoformat(),
+        }
+        # sidecar first, keeping the entry of the file it replaces: a crash
+        # before the index rename leaves the old file, which still verifies
+        previous = {}
+        if os.path.exists(self.index_path):
+            previous = {k: v for k, v in self.loaded_meta.items() if k != "previous"}
+        write_json_atomic(self.meta_path, {**meta, "previous": previous or None})
+        os.replace(tmp_path, self.index_path)
+        self.loaded_meta = meta
+
+    # -----------------------------------------------
+    def _write_delta(self, snapshot: IndexSnapshot):
+        meta = {
+            "base_id": snapshot.base_id,
+            "watermark": self.watermark.isoformat() if self.watermark else None,
+            "saved_at": datetime.utcnow().isoformat(),
+        }
+        tmp_path = f"{self.delta_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                ids=snapshot.delta_ids,
+                vectors=snapshot.delta_vectors,
+                tombstones=snapshot.tombstones,
+                meta=np.array(json.dumps(meta)),
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.delta_path)
+
+    # -----------------------------------------------
+    def _roll_backup(self, force: bool = False):
+        """
+        Starts a new backup base from the saved file when one is due (or
+        `force`, e.g. after a rebuild invalidated the delta log). Does
+        nothing until the first backup_index() call created a base.
+        Caller holds the writer lock with the index saved.
+        """
+        latest = self.backup.latest()
+        if latest is None or not os.path.exists(self.index_path):
+            return
+        if force or self.backup.base_due():
+            self.backup.take_base(self.index_path, self.meta_path, self.delta_path)
+
+    # -----------------------------------------------
+    def _mark_dirty(self, count: int):
+        """
+        Records `count` unsaved mutations. Saves right away when write-behind
+        is disabled, the dirty threshold is reached or the index is shared
+        with other workers, otherwise leaves it to the flusher thread.
+        """
+        self._dirty += count
+        if self.shared or self.flush_interval <= 0 or self._dirty >= self.flush_threshold:
             self.save()
+        elif self._flusher is None:
+            self._flusher = threading.Thread(
+                target=self._flush_loop, name=f"faiss-flush-{self.name}", daemon=True
+            )
+            self._flusher.start()
+
+    # -----------------------------------------------
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[FAISS] Background save of {self.name} failed: {e}")
+
+    # -----------------------------------------------
+    def flush(self):
+        """Saves the index if it has unsaved mutations."""
+        with self._lock:
+            if self._dirty:
+                self.save()
+
+    # -----------------------------------------------
+    def close(self):
+        """Stops the flusher thread and saves pending mutations."""
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join(timeout=5)
+            self._flusher = None
+        self.flush()
+
+    # -----------------------------------------------
+    def note_watermark(self, approved_at: datetime):
+        """
+        Records that products approved up to `approved_at` are in the index.
+        Call after the matching add; it is persisted with the next save.
+        """
+        if approved_at is None:
+            return
+        with self._lock:
+            if self.watermark is None or approved_at > self.watermark:
+                self.watermark = approved_at
+
+    # -----------------------------------------------
+    def add_vectors(self, vectors, ids, categories=None):
+        """
+        Adds/updates many vectors at once. They go to the snapshot's delta
+        (superseded base entries are tombstoned); the base index is not
+        copied until the delta is folded into it on save.
+        `categories` is only used by ShardedFaissManager.
+        """
+        if len(ids) == 0:
+            return
+        vecs = np.asarray(vectors, dtype="float32").reshape(len(ids), -1)
+        ids_np = np.asarray(ids, dtype="int64")
+
+        with self.writer():
+            self._swap(self.snapshot.with_added(ids_np, vecs))
+            self.backup.log_add(ids_np, vecs)
+            self._mark_dirty(len(ids_np))
+
+    # -----------------------------------------------
+    def remove_vectors(self, ids):
+        """Removes many vectors by FAISS ID"""
+        if len(ids) == 0:
+            return True
+        try:
+            with self.writer():
+                ids_np = np.asarray(ids, dtype="int64")
+                self._swap(self.snapshot.with_removed(ids_np))
+                self.backup.log_remove(ids_np)
+                self._mark_dirty(len(ids))
             return True
         except Exception:
             return False
 
     # -----------------------------------------------
-    def search(self, vector: np.ndarray, top_k: int = 10):
+    def add_vector(self, vector: np.ndarray, id_: int, category=None):
+        """Add/update one vector"""
+        self.add_vectors(np.asarray(vector, dtype="float32").reshape(1, -1), [id_])
+
+    # -----------------------------------------------
+    def remove_vector(self, product_id: int):
+        """Remove vector by FAISS ID"""
+        return self.remove_vectors([product_id])
+
+    # -----------------------------------------------
+    def search(self, vector: np.ndarray, top_k: int = 10, id_filter=None, category=None):
         """
         Searches the index for the K nearest neighbors of the query vector.
         Returns a list of IDs and their corresponding similarity scores (L2/Interval Product).
+        `id_filter` restricts the search to a subset of ids (metadata filters);
+        `category` picks a shard in ShardedFaissManager and is ignored here.
+        """
+        return self.search_batch(vector, top_k, id_filter)[0]
+
+    # -----------------------------------------------
+    def search_batch(self, vectors: np.ndarray, top_k: int = 10, id_filter=None, category=None):
+        """
+        Searches many query vectors with one matrix `index.search` call on
+        the base (tombstoned ids excluded) and one on the delta, merging
+        the two by score. Returns one (ids, scores) pair per query row, in
+        order.
+        """
+        vecs = np.asarray(vectors, dtype="float32").reshape(-1, self.dim)
+        if not len(vecs):
+            return []
+        self.refresh()
+        snapshot = self.snapshot  # writers never mutate a published snapshot
+
+        if not self._should_rerank(snapshot.base):
+            scores, ids = self._index_search(snapshot, vecs, top_k, id_filter)
+            base_hits = [(i.tolist(), s.tolist()) for i, s in zip(ids, scores)]
+        else:
+            # compressed codes: over-fetch, then re-score exactly on the float
+            # vectors, with one vector load for the candidates of all queries
+            scores, ids = self._index_search(snapshot, vecs, top_k * self.rerank_factor, id_filter)
+            candidates = sorted({int(i) for i in ids.ravel() if i >= 0})
+            try:
+                vectors_by_id = self.vector_loader(candidates)
+            except Exception as e:
+                print(f"[FAISS] Re-scoring skipped for {self.name}: {e}")
+                vectors_by_id = None
+
+            base_hits = []
+            for q, row_ids, row_scores in zip(vecs, ids.tolist(), scores.tolist()):
+                if vectors_by_id is None:
+                    base_hits.append((row_ids[:top_k], row_scores[:top_k]))
+                    continue
+                exact_ids, exact_scores = _exact_order(q, [i for i in row_ids if i >= 0], vectors_by_id)
+                base_hits.append((exact_ids[:top_k], exact_scores[:top_k]))
+
+        if snapshot.delta is None:
+            return base_hits
+
+        # the delta keeps exact vectors
+        d_scores, d_ids = snapshot.delta.search(vecs, top_k, params=self._delta_params(id_filter))
+        return [
+            _merge_hits(b_ids, b_scores, di.tolist(), ds.tolist(), top_k)
+            for (b_ids, b_scores), di, ds in zip(base_hits, d_ids, d_scores)
+        ]
+
+    # -----------------------------------------------
+    def vectors(self, faiss_ids) -> dict:
+        """
+        Stored vectors of many ids as {id: vector} (ids found only), without
+        re-embedding anything: reconstructed from the index when it keeps
+        exact vectors, else (compressed codes, or ids not in the index)
+        loaded via vector_loader.
+        """
+        ids = [int(i) for i in faiss_ids]
+        self.refresh()
+        snapshot = self.snapshot
+        index = snapshot.base
+
+        found = snapshot.delta_vectors_of(ids)
+        if index_kind(index) not in COMPRESSED_TYPES:
+            dead = snapshot.is_dead(ids)
+            for fid, is_dead in zip(ids, dead):
+                if fid in found or is_dead:
+                    continue
+                try:
+                    found[fid] = index.reconstruct(fid)
+                except RuntimeError:
+                    pass
+
+        missing = [i for i in ids if i not in found]
+        if missing and self.vector_loader is not None:
+            found.update(self.vector_loader(missing))
+        return found
+
+    # -----------------------------------------------
+    def vector(self, faiss_id: int):
+        """Stored vector of one id (see vectors()), or None."""
+        return self.vectors([faiss_id]).get(int(faiss_id))
+
+    # -----------------------------------------------
+    def range_search(self, vector: np.ndarray, min_score: float, max_results: int = None,
+                     id_filter=None, category=None):
+        """
+        Returns every vector whose similarity to the query is >= `min_score`
+        (FAISS range_search on the base and the delta), best first and at
+        most `max_results`. Compressed indexes re-score the base candidates
+        exactly and apply the threshold again to the exact scores.
         """
         vec = np.asarray(vector, dtype="float32").reshape(1, -1)
-        scores, ids = self.index.search(vec, top_k)
-        return ids[0].tolist(), scores[0].tolist()
+        self.refresh()
+        snapshot = self.snapshot
+        index = snapshot.base
+
+        # range_search keeps scores strictly above the radius
+        radius = float(np.nextafter(np.float32(min_score), np.float32(-np.inf)))
+        ids, scores = [], []
+        if index.ntotal:
+            selector = snapshot.selector(id_filter) if index_kind(index) != "pq" else None
+            _, b_scores, b_ids = index.range_search(vec, radius, params=self._search_params(index, selector))
+            keep = snapshot.allowed(b_ids, id_filter)
+            b_ids, b_scores = b_ids[keep], b_scores[keep]
+
+            order = np.argsort(-b_scores, kind="stable")
+            ids, scores = b_ids[order].tolist(), b_scores[order].tolist()
+
+            if self._should_rerank(index):
+                if max_results is not None:
+                    ids, scores = ids[:max_results * self.rerank_factor], scores[:max_results * self.rerank_factor]
+                ids, scores = self._rerank(vec[0], ids, scores, len(ids))
+                hits = [(i, s) for i, s in zip(ids, scores) if s >= min_score]
+                ids, scores = [i for i, _ in hits], [s for _, s in hits]
+
+        if snapshot.delta is not None:
+            _, d_scores, d_ids = snapshot.delta.range_search(vec, radius, params=self._delta_params(id_filter))
+            limit = len(ids) + len(d_ids)
+            ids, scores = _merge_hits(ids, scores, d_ids.tolist(), d_scores.tolist(), limit)
+
+        if max_results is not None:
+            ids, scores = ids[:max_results], scores[:max_results]
+        return ids, scores
 
     # -----------------------------------------------
-    def rebuild(self, vectors, ids):
-        """Fully rebuild FAISS from scratch"""
-        self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(self.dim))
+    def _should_rerank(self, index) -> bool:
+        return (
+            self.vector_loader is not None
+            and self.rerank_factor > 1
+            and index_kind(index) in COMPRESSED_TYPES
+        )
 
+    # -----------------------------------------------
+    def _rerank(self, query: np.ndarray, ids: list, scores: list, top_k: int):
+        """
+        Orders candidates by exact inner product. Falls back to the
+        approximate ranking if the original vectors cannot be loaded.
+        """
+        candidates = [i for i in ids if i >= 0]
+        try:
+            vectors_by_id = self.vector_loader(candidates)
+        except Exception as e:
+            print(f"[FAISS] Re-scoring skipped for {self.name}: {e}")
+            return ids[:top_k], scores[:top_k]
+
+        exact_ids, exact_scores = _exact_order(query, candidates, vectors_by_id)
+        return exact_ids[:top_k], exact_scores[:top_k]
+
+    # -----------------------------------------------
+    def rebuild(self, vectors, ids, watermark: datetime = None, categories=None):
+        """
+        Fully rebuild FAISS from scratch, training the configured index type.
+        `watermark` is the latest approved_at the given vectors cover.
+        The new index is built off to the side and swapped in when complete;
+        searches keep using the previous generation meanwhile, other writers
+        wait so their changes are not lost.
+        """
         if vectors and ids:
             vectors_np = np.asarray(vectors, dtype="float32").reshape(len(vectors), -1)
             ids_np = np.asarray(ids, dtype="int64")
-            self.index.add_with_ids(vectors_np, ids_np)
+        else:
+            vectors_np = np.zeros((0, self.dim), dtype="float32")
+            ids_np = np.zeros(0, dtype="int64")
+
+        with self.writer():
+            self._swap(IndexSnapshot(self._build_index(vectors_np, ids_np), _new_base_id()))
+            self.watermark = watermark
+            self.save()
+            # the delta log no longer applies on top of the rebuilt index
+            self._roll_backup(force=True)
 
-        self.save()
+    # -----------------------------------------------
+    def ids(self) -> np.ndarray:
+        """FAISS ids currently in the index (base and delta)."""
+        self.refresh()
+        return self.snapshot.ids()
+
+    # -----------------------------------------------
+    @property
+    def ntotal(self) -> int:
+        self.refresh()
+        return self.snapshot.ntotal
+
+    # -----------------------------------------------
+    def stats(self) -> dict:
+        """Index type, size and current search parameters."""
+        self.refresh()
+        snapshot = self.snapshot
+        index = snapshot.base
+        kind = index_kind(index)
+        info = {
+            "configured_type": self.index_type,
+            "type": kind,
+            "ntotal": snapshot.ntotal,
+            "delta": len(snapshot.delta_ids),
+            "tombstones": len(snapshot.tombstones),
+            "memory_bytes": index_memory_bytes(index) + snapshot.delta_vectors.nbytes,
+            "float32_bytes": snapshot.ntotal * self.dim * 4,
+            "mmapped": self._mapped,
+            "shared": self.shared,
+            "generation": self.generation,
+        }
+        if kind in COMPRESSED_TYPES:
+            info["rerank_factor"] = self.rerank_factor if self.vector_loader else 0
+        if kind in ("ivf_flat", "ivf_pq", "ivf_sq8"):
+            info["nlist"] = int(faiss.extract_index_ivf(index).nlist)
+            info["nprobe"] = self.nprobe
+        if kind == "hnsw":
+            info["ef_search"] = self.ef_search
+        return info
 
     # -----------------------------------------------
     def backup_index(self):
-        """Backup index file"""
-        if not os.path.exists(self.index_path):
-            return None
+        """
+        Incremental backup: saves pending changes and fsyncs the delta log;
+        takes a new base snapshot only when none exists or one is due
+        (see IndexBackup). Returns the current backup chain, or None if
+        nothing was ever saved.
+        """
+        with self.writer():
+            self.flush()
+            if not os.path.exists(self.index_path):
+                return None
+            if self.backup.latest() is None:
+                self.backup.take_base(self.index_path, self.meta_path, self.delta_path)
+            else:
+                self._roll_backup()
+            return self.backup.list()[0]
+
+    # -----------------------------------------------
+    def list_backups(self) -> list:
+        return self.backup.list()
 
-        backup_name = f"index_backup_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.faiss"
-        backup_path = os.path.join(self.index_dir, backup_name)
+    # -----------------------------------------------
+    def restore_backup(self, base: str = None) -> dict:
+        """
+        Replaces the live index with a backup: loads base snapshot `base`
+        (file name; default the latest), replays its delta log and
+        publishes the result. A fresh base is taken afterwards, since later
+        logs do not apply on top of an older restore point.
+        """
+        path = self.backup.resolve(base)
+        with self.writer():
+            index = faiss.read_index(path)
+            if not isinstance(index, (faiss.IndexIDMap2, faiss.IndexIVF)):
+                index = faiss.IndexIDMap2(index)
+            try:
+                with open(self.backup.meta_path(path)) as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                meta = {}
+
+            snapshot = IndexSnapshot(index, meta.get("base_id") or _new_base_id())
+            delta = self._read_delta(self.backup.delta_path(path), snapshot.base_id)
+            watermark = meta.get("watermark")
+            if delta is not None:
+                ids, vectors, tombstones, delta_meta = delta
+                snapshot = IndexSnapshot(index, snapshot.base_id, ids, vectors, tombstones)
+                watermark = delta_meta.get("watermark")
+
+            # the restored base is private until published: fold in place
+            replayed = 0
+            for op, ids, vectors in self.backup.records(path):
+                if op == b"A":
+                    snapshot = snapshot.with_added(ids, vectors)
+                else:
+                    snapshot = snapshot.with_removed(ids)
+                if self._fold_due(snapshot):
+                    snapshot = self._fold(snapshot, copy=False)
+                replayed += 1
+
+            self._swap(self._fold(snapshot, copy=False))
+            # conservative: later approvals are re-added by the next reconcile
+            self.watermark = datetime.fromisoformat(watermark) if watermark else None
+            self.save()
+            self.backup.take_base(self.index_path, self.meta_path, self.delta_path)
 
-        shutil.copy2(self.index_path, backup_path)
-        return backup_path
+        print(f"[FAISS] Restored {self.name} from {os.path.basename(path)} (+{replayed} log records)")
+        return {"base": os.path.basename(path), "replayed": replayed, "ntotal": self.snapshot.ntotal}
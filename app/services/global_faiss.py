@@ -1,11 +1,31 @@
 # app/services/global_faiss.py
 
+import threading
+import time
+from functools import partial
+
+from app.core.config import settings
 from app.services.faiss_manager import FaissManager
 from app.services.embedding_service import CLIPEmbedder
+from app.services.inference_scheduler import InferenceScheduler
+from app.services.metadata_store import MetadataStore
+from app.services.query_cache import QueryEmbeddingCache
+from app.services.related_products import refresh_related
+from app.services.sharded_faiss import ShardedFaissManager
+from app.services.vector_store import load_product_vectors
 
 # Global singletons
 embedder = None
 faiss_mgr = None
+text_faiss_mgr = None
+scheduler = None
+query_cache = None
+metadata_store = None
+
+def _index_class():
+    """Per-category shards when FAISS_SHARD_BY_CATEGORY is on, else one index."""
+    return ShardedFaissManager if settings.FAISS_SHARD_BY_CATEGORY else FaissManager
+
 
 def ensure_services():
     """
@@ -18,6 +38,135 @@ def ensure_services():
         embedder = CLIPEmbedder()
 
     if faiss_mgr is None:
-        faiss_mgr = FaissManager()
+        faiss_mgr = _index_class()(vector_loader=partial(load_product_vectors, column="embedding"))
 
     return embedder, faiss_mgr
+
+
+def ensure_text_index():
+    """
+    Returns the FaissManager holding CLIP text embeddings of
+    product title + description (separate from the image index).
+    """
+    global text_faiss_mgr
+
+    if text_faiss_mgr is None:
+        text_faiss_mgr = _index_class()(
+            name="text_index",
+            vector_loader=partial(load_product_vectors, column="text_embedding"),
+        )
+
+    return text_faiss_mgr
+
+
+def ensure_scheduler():
+    """
+    Returns the shared micro-batching InferenceScheduler wrapped around
+    the global embedder, or None when SCHEDULER_ENABLED is off.
+    """
+    global scheduler
+
+    if not settings.SCHEDULER_ENABLED:
+        return None
+
+    if scheduler is None:
+        scheduler = InferenceScheduler(ensure_services()[0])
+
+    return scheduler
+
+
+def ensure_query_cache():
+    """
+    Returns the shared text query embedding cache.
+    """
+    global query_cache
+
+    if query_cache is None:
+        query_cache = QueryEmbeddingCache()
+
+    return query_cache
+
+
+def ensure_metadata_store():
+    """
+    Returns the shared columnar product metadata used for filtered search,
+    loaded from the DB on first use and reloaded every
+    METADATA_REFRESH_INTERVAL seconds (admin/seller writes also update it
+    immediately).
+    """
+    global metadata_store
+
+    if metadata_store is None:
+        store = MetadataStore()
+        store.load()
+        metadata_store = store
+
+        if settings.METADATA_REFRESH_INTERVAL > 0:
+            threading.Thread(
+                target=_refresh_metadata_loop, name="metadata-refresh", daemon=True
+            ).start()
+
+    return metadata_store
+
+
+def refresh_metadata(product_ids):
+    """Re-reads changed products into the metadata store, if it is loaded."""
+    if metadata_store is not None:
+        metadata_store.refresh_products(product_ids)
+
+
+def drop_metadata(faiss_ids):
+    """Removes deleted products from the metadata store, if it is loaded."""
+    if metadata_store is not None:
+        metadata_store.remove(faiss_ids)
+
+
+def _refresh_metadata_loop():
+    while True:
+        time.sleep(settings.METADATA_REFRESH_INTERVAL)
+        try:
+            metadata_store.load()
+        except Exception as e:
+            print(f"[METADATA] Refresh failed: {e}")
+
+
+def start_related_refresh():
+    """
+    Starts the background job keeping the related_products table current:
+    the first run fills it, later runs (every RELATED_REFRESH_INTERVAL
+    seconds) recompute only what changed.
+    """
+    if settings.RELATED_REFRESH_INTERVAL > 0:
+        threading.Thread(
+            target=_refresh_related_loop, name="related-refresh", daemon=True
+        ).start()
+
+
+def refresh_related_products(full: bool = False):
+    """Brings the related_products table up to date with the image index."""
+    _, mgr = ensure_services()
+    approved = ensure_metadata_store().build_filter(status="approved")
+    return refresh_related(mgr, approved, full)
+
+
+def _refresh_related_loop():
+    while True:
+        try:
+            result = refresh_related_products()
+            print(f"[RELATED] Refresh: {result}")
+        except Exception as e:
+            print(f"[RELATED] Refresh failed: {e}")
+        time.sleep(settings.RELATED_REFRESH_INTERVAL)
+
+
+def shutdown_services():
+    """
+    Releases background resources held by the global services
+    (image preprocessing pool) and saves unsaved FAISS mutations.
+    """
+    for mgr in (faiss_mgr, text_faiss_mgr):
+        if mgr is not None:
+            mgr.close()
+
+    if embedder is not None and embedder.preprocessor is not None:
+        embedder.preprocessor.shutdown()
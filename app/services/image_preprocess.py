@@ -0,0 +1,140 @@
+# app/services/image_preprocess.py
+
+import io
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+# Per-process preprocessing config, set by the pool initializer
+_CONFIG = None
+
+# What a bad upload raises while decoding (UnidentifiedImageError is an
+# OSError); anything else is a backend or configuration fault
+DECODE_ERRORS = (OSError, ValueError, Image.DecompressionBombError)
+
+
+def config_from_processor(image_processor, max_pixels: int, draft: bool = True) -> dict:
+    """
+    Extracts the resize/crop/normalize parameters of a CLIPImageProcessor
+    into a plain (picklable) dict for the worker processes.
+    """
+    size = image_processor.size
+    crop = image_processor.crop_size
+    return {
+        "shortest_edge": int(size.get("shortest_edge") or min(size["height"], size["width"])),
+        "crop_height": int(crop["height"]),
+        "crop_width": int(crop["width"]),
+        "mean": [float(m) for m in image_processor.image_mean],
+        "std": [float(s) for s in image_processor.image_std],
+        "rescale_factor": float(image_processor.rescale_factor),
+        "resample": int(image_processor.resample),
+        "max_pixels": int(max_pixels),
+        "draft": bool(draft),
+    }
+
+
+def _init_worker(config: dict):
+    global _CONFIG
+    _CONFIG = config
+
+
+# -------------------------------------------------------
+# PREPROCESS ONE IMAGE
+# -------------------------------------------------------
+def preprocess_image(source, config: dict = None) -> np.ndarray:
+    """
+    Decodes an image (path, bytes or PIL image) and turns it into a
+    normalized (3, H, W) float32 pixel tensor, the same way CLIPImageProcessor
+    does (shortest-edge resize, center crop, rescale, normalize).
+
+    JPEGs are decoded at reduced resolution (draft mode) when they are much
+    larger than the model input. Images whose pixel count (as stored, before
+    any draft downscaling) exceeds `max_pixels` are rejected.
+    """
+    cfg = config or _CONFIG
+
+    if isinstance(source, Image.Image):
+        img = source
+    else:
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            source = io.BytesIO(source)
+        img = Image.open(source)
+
+    width, height = img.size
+    if cfg["max_pixels"] > 0 and width * height > cfg["max_pixels"]:
+        raise ValueError(f"Image too large: {width}x{height} pixels")
+
+    if cfg["draft"] and not isinstance(source, Image.Image):
+        # let the JPEG decoder downscale by 1/2..1/8 while both sides
+        # stay >= the target edge; no-op for other formats
+        img.draft("RGB", (cfg["shortest_edge"], cfg["shortest_edge"]))
+        width, height = img.size
+
+    img = img.convert("RGB")
+
+    # resize shortest edge
+    target = cfg["shortest_edge"]
+    if width <= height:
+        new_size = (target, int(target * height / width))
+    else:
+        new_size = (int(target * width / height), target)
+    if new_size != img.size:
+        img = img.resize(new_size, resample=cfg["resample"])
+
+    # center crop
+    crop_w, crop_h = cfg["crop_width"], cfg["crop_height"]
+    left = (img.width - crop_w) // 2
+    top = (img.height - crop_h) // 2
+    img = img.crop((left, top, left + crop_w, top + crop_h))
+
+    arr = np.asarray(img, dtype="float32") * cfg["rescale_factor"]
+    arr = (arr - np.asarray(cfg["mean"], dtype="float32")) / np.asarray(cfg["std"], dtype="float32")
+    return arr.transpose(2, 0, 1)
+
+
+# -------------------------------------------------------
+# POOL
+# -------------------------------------------------------
+class ImagePreprocessor:
+    """
+    Runs `preprocess_image` on a process pool so decoding and resizing
+    happen in parallel with (and off the thread of) the model forward pass.
+    With `workers=0` everything runs in the calling thread.
+    """
+
+    def __init__(self, config: dict, workers: int = 0):
+        self.config = config
+        self._pool = None
+        if workers > 0:
+            # spawn: never fork a process that already holds torch/onnx threads
+            self._pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(config,),
+            )
+
+    # -----------------------------------------------
+    def submit(self, source) -> Future:
+        """Schedules one image; the future resolves to its pixel tensor."""
+        # PIL images are already decoded; don't pickle them across processes
+        if self._pool is not None and not isinstance(source, Image.Image):
+            return self._pool.submit(preprocess_image, source)
+
+        fut = Future()
+        try:
+            fut.set_result(preprocess_image(source, self.config))
+        except Exception as e:
+            fut.set_exception(e)
+        return fut
+
+    # -----------------------------------------------
+    def __call__(self, source) -> np.ndarray:
+        return self.submit(source).result()
+
+    # -----------------------------------------------
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
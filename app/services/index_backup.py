@@ -0,0 +1,246 @@
+# app/services/index_backup.py
+import os
+import shutil
+import struct
+import zlib
+from datetime import datetime
+
+import numpy as np
+
+from app.core.config import settings
+
+# delta log record: op (b"A" add / b"R" remove), count, dim, crc32 of the payload;
+# payload = count int64 ids (+ count * dim float32 vectors for adds)
+RECORD_HEADER = struct.Struct("<cIII")
+BASE_PREFIX = "base-"
+
+
+def backup_root() -> str:
+    return settings.FAISS_BACKUP_DIR or os.path.join(settings.FAISS_INDEX_DIR, "backups")
+
+
+class IndexBackup:
+    """
+    Incremental backups of one FAISS index, in `<FAISS_BACKUP_DIR>/<name>/`:
+
+    - `base-<timestamp>.faiss` (+ `.meta.json`, `.delta.npz`): a snapshot
+      of the saved index and delta files. Saved files are replaced, never
+      rewritten, so a base is a hard link when possible and costs no copy.
+    - `base-<timestamp>.log`: append-only log of every add/remove applied
+      after that base; restore = base + replayed log.
+
+    Nothing is logged until the first base exists (the first backup).
+    A new base is taken when the current one is older than
+    FAISS_BACKUP_BASE_INTERVAL hours or its log outgrows
+    FAISS_BACKUP_LOG_RATIO x the base; only FAISS_BACKUP_KEEP bases
+    (with their logs) are kept.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.dir = os.path.join(backup_root(), name)
+
+    # -----------------------------------------------
+    def bases(self) -> list:
+        """Base snapshot paths, oldest first."""
+        try:
+            names = os.listdir(self.dir)
+        except FileNotFoundError:
+            return []
+        return [
+            os.path.join(self.dir, n) for n in sorted(names)
+            if n.startswith(BASE_PREFIX) and n.endswith(".faiss")
+        ]
+
+    # -----------------------------------------------
+    def latest(self):
+        bases = self.bases()
+        return bases[-1] if bases else None
+
+    # -----------------------------------------------
+    @staticmethod
+    def log_path(base: str) -> str:
+        return base[:-len(".faiss")] + ".log"
+
+    # -----------------------------------------------
+    @staticmethod
+    def meta_path(base: str) -> str:
+        return base[:-len(".faiss")] + ".meta.json"
+
+    # -----------------------------------------------
+    @staticmethod
+    def delta_path(base: str) -> str:
+        return base[:-len(".faiss")] + ".delta.npz"
+
+    # -----------------------------------------------
+    def resolve(self, base=None) -> str:
+        """Full path of a base given by file name (default: the latest)."""
+        if base is None:
+            path = self.latest()
+        else:
+            path = os.path.join(self.dir, os.path.basename(base))
+        if path is None or not os.path.exists(path):
+            raise FileNotFoundError(f"No FAISS backup {base or ''} for {self.name}")
+        return path
+
+    # -----------------------------------------------
+    # DELTA LOG
+    # -----------------------------------------------
+    def _append(self, op: bytes, ids, vectors=None):
+        base = self.latest()
+        if base is None:
+            return
+        ids_np = np.ascontiguousarray(ids, dtype="int64")
+        payload = ids_np.tobytes()
+        dim = 0
+        if vectors is not None:
+            vecs = np.ascontiguousarray(vectors, dtype="float32")
+            dim = vecs.shape[1]
+            payload += vecs.tobytes()
+
+        header = RECORD_HEADER.pack(op, len(ids_np), dim, zlib.crc32(payload))
+        with open(self.log_path(base), "ab") as f:
+            f.write(header + payload)
+
+    # -----------------------------------------------
+    def log_add(self, ids, vectors):
+        self._append(b"A", ids, vectors)
+
+    # -----------------------------------------------
+    def log_remove(self, ids):
+        self._append(b"R", ids)
+
+    # -----------------------------------------------
+    def sync(self):
+        """fsyncs the current log (called with each index save)."""
+        base = self.latest()
+        if base is None or not os.path.exists(self.log_path(base)):
+            return
+        with open(self.log_path(base), "ab") as f:
+            os.fsync(f.fileno())
+
+    # -----------------------------------------------
+    def records(self, base: str):
+        """
+        Yields (op, ids, vectors) from the log of `base`, in order. A torn
+        or corrupt record (crash mid-append) ends the replay there.
+        """
+        for _, op, ids, vectors in self._scan(self.log_path(base)):
+            yield op, ids, vectors
+
+    # -----------------------------------------------
+    @staticmethod
+    def _scan(path: str):
+        """Yields (end offset, op, ids, vectors) for each intact record of a log."""
+        if not os.path.exists(path):
+            return
+        size_left = os.path.getsize(path)
+        with open(path, "rb") as f:
+            while size_left >= RECORD_HEADER.size:
+                op, count, dim, crc = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))
+                size = count * 8 + count * dim * 4
+                size_left -= RECORD_HEADER.size
+                if op not in (b"A", b"R") or size > size_left:
+                    break
+                payload = f.read(size)
+                size_left -= size
+                if zlib.crc32(payload) != crc:
+                    break
+                ids = np.frombuffer(payload[:count * 8], dtype="int64")
+                vectors = np.frombuffer(payload[count * 8:], dtype="float32").reshape(count, dim) if dim else None
+                yield f.tell(), op, ids, vectors
+            if size_left:
+                print(f"[FAISS] Backup log {path} ends in a damaged record; replay stops there.")
+
+    # -----------------------------------------------
+    def repair(self):
+        """
+        Truncates a damaged tail (a crash mid-append) off the latest log,
+        so records appended from now on stay replayable.
+        """
+        base = self.latest()
+        if base is None:
+            return
+        path = self.log_path(base)
+        good = 0
+        for good, *_ in self._scan(path):
+            pass
+        if os.path.exists(path) and good < os.path.getsize(path):
+            with open(path, "r+b") as f:
+                f.truncate(good)
+            print(f"[FAISS] Truncated damaged tail of backup log {path}.")
+
+    # -----------------------------------------------
+    # BASE SNAPSHOTS
+    # -----------------------------------------------
+    def base_due(self) -> bool:
+        """True when a new base should be taken (none yet, too old, or log too big)."""
+        base = self.latest()
+        if base is None:
+            return True
+        log = self.log_path(base)
+        log_bytes = os.path.getsize(log) if os.path.exists(log) else 0
+        if not log_bytes:
+            return False  # nothing changed since the base
+
+        age_hours = (datetime.utcnow() - self._created_at(base)).total_seconds() / 3600
+        if age_hours >= settings.FAISS_BACKUP_BASE_INTERVAL:
+            return True
+        return log_bytes > settings.FAISS_BACKUP_LOG_RATIO * os.path.getsize(base)
+
+    # -----------------------------------------------
+    @staticmethod
+    def _created_at(base: str) -> datetime:
+        stamp = os.path.basename(base)[len(BASE_PREFIX):-len(".faiss")]
+        return datetime.strptime(stamp, "%Y%m%d_%H%M%S_%f")
+
+    # -----------------------------------------------
+    def take_base(self, index_path: str, meta_path: str, delta_path: str = None) -> str:
+        """
+        Snapshots the saved index (and delta) file as a new base with an empty log and
+        applies the retention policy. The caller must have saved the index
+        (and hold its writer lock) so the base matches the in-memory state.
+        """
+        os.makedirs(self.dir, exist_ok=True)
+        stamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S_%f")
+        base = os.path.join(self.dir, f"{BASE_PREFIX}{stamp}.faiss")
+
+        try:
+            os.link(index_path, base)
+        except OSError:
+            # other filesystem, or no hard links
+            shutil.copy2(index_path, base)
+        if os.path.exists(meta_path):
+            shutil.copy2(meta_path, self.meta_path(base))
+        if delta_path and os.path.exists(delta_path):
+            try:
+                os.link(delta_path, self.delta_path(base))
+            except OSError:
+                shutil.copy2(delta_path, self.delta_path(base))
+        open(self.log_path(base), "wb").close()
+
+        self.prune()
+        return base
+
+    # -----------------------------------------------
+    def prune(self):
+        """Deletes all but the FAISS_BACKUP_KEEP newest bases and their logs."""
+        keep = max(1, settings.FAISS_BACKUP_KEEP)
+        for base in self.bases()[:-keep]:
+            for path in (base, self.log_path(base), self.meta_path(base), self.delta_path(base)):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    # -----------------------------------------------
+    def list(self) -> list:
+        out = []
+        for base in reversed(self.bases()):
+            log = self.log_path(base)
+            out.append({
+                "base": os.path.basename(base),
+                "created_at": self._created_at(base).isoformat(),
+                "base_bytes": os.path.getsize(base),
+                "log_bytes": os.path.getsize(log) if os.path.exists(log) else 0,
+                "log_records": sum(1 for _ in self.records(base)),
+            })
+        return out
@@ -0,0 +1,284 @@
+# app/services/index_reconcile.py
+
+import numpy as np
+import psycopg2
+
+from app.core.config import settings
+from app.db.database import get_connection
+from app.services.embedding_service import product_text
+from app.services.faiss_manager import ids_digest
+from app.services.sharded_faiss import category_key
+from app.services.vector_store import VECTOR_COLUMNS, load_product_vectors
+
+
+# SQL form of sharded_faiss.category_key
+CATEGORY_KEY_SQL = "LOWER(TRIM(COALESCE(main_category, '')))"
+
+
+def approved_id_state(column: str = "embedding", category=None):
+    """
+    FAISS ids and approval times of approved products that have a vector
+    in `column` (no vector bytes are fetched), optionally only those of
+    one category shard key.
+    Returns ({faiss_id: approved_at}, max approved_at).
+    """
+    if column not in VECTOR_COLUMNS:
+        raise ValueError(f"Unknown vector column: {column}")
+
+    conn = get_connection()
+    cur = conn.cursor()
+
+    where, params = "", ()
+    if category is not None:
+        where, params = f"AND {CATEGORY_KEY_SQL} = %s", (category_key(category),)
+
+    cur.execute(f"""
+        SELECT faiss_index, approved_at
+        FROM products
+        WHERE status='approved' AND faiss_index IS NOT NULL AND {column} IS NOT NULL {where};
+    """, params)
+
+    rows = cur.fetchall()
+    cur.close()
+    conn.close()
+
+    approved = {int(fid): approved_at for fid, approved_at in rows}
+    stamps = [a for a in approved.values() if a is not None]
+    return approved, (max(stamps) if stamps else None)
+
+
+def approved_categories(column: str = "embedding"):
+    """Category shard keys that have at least one approved vector in `column`."""
+    if column not in VECTOR_COLUMNS:
+        raise ValueError(f"Unknown vector column: {column}")
+
+    conn = get_connection()
+    cur = conn.cursor()
+
+    cur.execute(f"""
+        SELECT DISTINCT {CATEGORY_KEY_SQL}
+        FROM products
+        WHERE status='approved' AND faiss_index IS NOT NULL AND {column} IS NOT NULL;
+    """)
+
+    rows = cur.fetchall()
+    cur.close()
+    conn.close()
+
+    return {row[0] for row in rows}
+
+
+def _is_sharded(mgr) -> bool:
+    return hasattr(mgr, "shards")
+
+
+# -------------------------------------------------------
+# FULL REBUILD
+# -------------------------------------------------------
+def rebuild_index(mgr, column: str = "embedding", approved=None, watermark=None,
+                  category=None) -> dict:
+    """
+    Rebuilds `mgr` from every approved vector in `column` and records
+    the matching approved_at watermark. For a sharded manager every shard
+    is rebuilt, or only the shard of `category` when given.
+
+    The DB is read while holding the index's writer lock: approvals add to
+    FAISS after committing, so one that commits after the read waits for
+    the swap and lands on the rebuilt index instead of being lost.
+    """
+    if _is_sharded(mgr):
+        keys = approved_categories(column) if category is None else {category_key(category)}
+        if category is None:
+            for key in set(mgr.shards) - keys:
+                mgr.drop_shard(key)
+        count = 0
+        for key in keys:
+            with mgr.shard(key, create=True).writer():
+                shard_approved, shard_watermark = approved_id_state(column, key)
+                vectors_by_id = load_product_vectors(list(shard_approved), column)
+                ids = sorted(vectors_by_id)
+                mgr.rebuild_shard(key, [vectors_by_id[i] for i in ids], ids, watermark=shard_watermark)
+            count += len(ids)
+        return {"action": "rebuilt", "count": count, "shards": len(keys)}
+
+    with mgr.writer():
+        if approved is None:
+            approved, watermark = approved_id_state(column, category)
+
+        vectors_by_id = load_product_vectors(list(approved), column)
+        ids = sorted(vectors_by_id)
+        mgr.rebuild([vectors_by_id[i] for i in ids], ids, watermark=watermark)
+    return {"action": "rebuilt", "count": len(ids)}
+
+
+# -------------------------------------------------------
+# INCREMENTAL RECONCILE
+# -------------------------------------------------------
+def _rebuild_reason(mgr):
+    """Why the persisted index can't be diffed in place, or None."""
+    meta = mgr.loaded_meta
+    if not meta or "ids_hash" not in meta:
+        return "no watermark"
+    if meta.get("configured_type") != mgr.index_type:
+        return f"index type changed ({meta.get('configured_type')} -> {mgr.index_type})"
+    if meta.get("dim") != mgr.dim:
+        return "dimension changed"
+    return None
+
+
+def reconcile_index(mgr, column: str = "embedding", category=None) -> dict:
+    """
+    Brings a persisted index in line with Postgres at startup.
+
+    - ids and watermark match the DB: nothing to do
+    - otherwise: remove ids no longer approved, add missing ids and
+      re-add ids approved after the watermark (fetching only those vectors)
+    - full rebuild if there is no usable watermark, the index type changed,
+      the diff exceeds FAISS_RECONCILE_MAX_FRACTION of the catalog, or the
+      ids still disagree after applying it
+
+    Sharded managers are reconciled shard by shard (`category` scopes a
+    single shard to its products). With FAISS_SHARED, workers starting
+    together reconcile one at a time and later ones find the index the
+    first one published already up to date.
+    """
+    if _is_sharded(mgr):
+        return _reconcile_shards(mgr, column)
+
+    with mgr.writer():
+        return _reconcile_diff(mgr, column, category)
+
+
+def _reconcile_diff(mgr, column: str, category=None) -> dict:
+    approved, watermark = approved_id_state(column, category)
+
+    reason = _rebuild_reason(mgr)
+    if reason:
+        return {**rebuild_index(mgr, column, approved, watermark), "reason": reason}
+
+    newer = {
+        fid for fid, approved_at in approved.items()
+        if approved_at is not None and (mgr.watermark is None or approved_at > mgr.watermark)
+    }
+    if not newer and ids_digest(list(approved)) == ids_digest(mgr.ids()):
+        return {"action": "up_to_date", "count": len(approved)}
+
+    current = set(mgr.ids().tolist())
+    db_ids = set(approved)
+    to_remove = current - db_ids
+    to_add = (db_ids - current) | newer
+
+    changes = len(to_remove) + len(to_add)
+    if changes > settings.FAISS_RECONCILE_MAX_FRACTION * max(len(db_ids), 1):
+        return {
+            **rebuild_index(mgr, column, approved, watermark),
+            "reason": f"{changes} changes",
+        }
+
+    mgr.remove_vectors(sorted(to_remove))
+
+    vectors_by_id = load_product_vectors(sorted(to_add), column)
+    add_ids = sorted(vectors_by_id)
+    if add_ids:
+        mgr.add_vectors(np.stack([vectors_by_id[i] for i in add_ids]), add_ids)
+
+    if ids_digest(mgr.ids()) != ids_digest(list(db_ids)):
+        return {**rebuild_index(mgr, column, approved, watermark), "reason": "ids mismatch after diff"}
+
+    mgr.note_watermark(watermark)
+    mgr.save()
+    return {"action": "reconciled", "added": len(add_ids), "removed": len(to_remove), "count": len(db_ids)}
+
+
+def _reconcile_shards(mgr, column: str) -> dict:
+    """Reconciles every category shard; shards without products are dropped."""
+    keys = approved_categories(column)
+    for key in set(mgr.shards) - keys:
+        mgr.drop_shard(key)
+
+    results = {}
+    for key in sorted(keys):
+        shard = mgr.shard(key, create=True)
+        results[key or "(uncategorized)"] = reconcile_index(shard, column, category=key)
+        mgr.refresh_shard_ids(key)
+    return {"action": "sharded", "shards": results}
+
+
+# -------------------------------------------------------
+# TEXT EMBEDDING BACKFILL
+# -------------------------------------------------------
+def missing_text_rows():
+    """
+    Approved products without a text embedding: approved on a vision-only
+    worker, or title/description edited since (see update_product).
+    Returns [(faiss_id, title, description, main_category)].
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+
+    cur.execute("""
+        SELECT faiss_index, title, description, main_category
+        FROM products
+        WHERE status='approved' AND faiss_index IS NOT NULL AND text_embedding IS NULL
+        ORDER BY faiss_index;
+    """)
+
+    rows = cur.fetchall()
+    cur.close()
+    conn.close()
+    return rows
+
+
+def store_text_embeddings(rows, vectors) -> list:
+    """
+    Writes text vectors for the given missing_text_rows() entries, unless
+    the product was edited or embedded meanwhile. Returns the faiss ids
+    actually written.
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+
+    written = []
+    for (fid, title, description, _), vec in zip(rows, vectors):
+        cur.execute("""
+            UPDATE products
+            SET text_embedding = %s
+            WHERE faiss_index = %s AND status='approved' AND text_embedding IS NULL
+              AND title IS NOT DISTINCT FROM %s AND description IS NOT DISTINCT FROM %s;
+        """, (psycopg2.Binary(np.asarray(vec, dtype="float32").tobytes()), fid, title, description))
+        if cur.rowcount:
+            written.append(fid)
+
+    conn.commit()
+    cur.close()
+    conn.close()
+    return written
+
+
+def backfill_text_embeddings(embedder, mgr=None, batch_size: int = None) -> dict:
+    """
+    Embeds the title + description of approved products missing a text
+    embedding, in EMBED_BATCH_SIZE batches; needs a worker with the text
+    tower. The vectors are added to the text index `mgr` when given (after
+    the DB commit, see rebuild_index), otherwise the next reconcile or
+    rebuild picks them up.
+    """
+    batch_size = batch_size or settings.EMBED_BATCH_SIZE
+    rows = missing_text_rows()
+
+    filled = 0
+    for start in range(0, len(rows), batch_size):
+        chunk = rows[start:start + batch_size]
+        vectors = embedder.embed_texts([product_text(title, desc) for _, title, desc, _ in chunk])
+        written = set(store_text_embeddings(chunk, vectors))
+        filled += len(written)
+
+        if mgr is not None and written:
+            keep = [i for i, row in enumerate(chunk) if row[0] in written]
+            mgr.add_vectors(
+                np.stack([vectors[i] for i in keep]),
+                [chunk[i][0] for i in keep],
+                [chunk[i][3] for i in keep],
+            )
+
+    return {"missing": len(rows), "filled": filled}
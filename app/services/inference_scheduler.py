@@ -0,0 +1,114 @@
+# app/services/inference_scheduler.py
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from app.core.config import settings
+
+
+class MicroBatcher:
+    """
+    Collects single items submitted from many request threads and runs
+    them through `batch_fn` as one batch. A batch is dispatched as soon as
+    `max_batch` items are queued or `max_wait_ms` has passed since the
+    first item of the batch arrived.
+    """
+
+    def __init__(self, batch_fn, max_batch: int, max_wait_ms: float, name: str = "batcher"):
+        self.batch_fn = batch_fn
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue = queue.Queue()
+
+        self._worker = threading.Thread(target=self._run, name=name, daemon=True)
+        self._worker.start()
+
+    # -----------------------------------------------
+    def submit(self, item) -> Future:
+        """Queue one item; the returned future resolves to its result row."""
+        fut = Future()
+        self._queue.put((item, fut))
+        return fut
+
+    # -----------------------------------------------
+    def _collect(self):
+        """Block for the first item, then gather more until the window closes."""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    # -----------------------------------------------
+    def _run(self):
+        while True:
+            batch = self._collect()
+            items = [item for item, _ in batch]
+
+            try:
+                results = self.batch_fn(items)
+            except Exception:
+                # one bad input (e.g. a corrupt upload) must not fail
+                # the other requests it was batched with
+                self._run_individually(batch)
+                continue
+
+            for (_, fut), row in zip(batch, results):
+                fut.set_result(row)
+
+    # -----------------------------------------------
+    def _run_individually(self, batch):
+        for item, fut in batch:
+            try:
+                fut.set_result(self.batch_fn([item])[0])
+            except Exception as e:
+                fut.set_exception(e)
+
+
+class InferenceScheduler:
+    """
+    Dynamic micro-batching front for the shared CLIPEmbedder.
+    Concurrent search requests are grouped into one forward pass per
+    tower, and each caller gets back its own normalized vector.
+    """
+
+    def __init__(self, embedder):
+        self.embedder = embedder
+        self.text = MicroBatcher(
+            embedder.embed_texts,
+            settings.SCHEDULER_MAX_BATCH,
+            settings.SCHEDULER_MAX_WAIT_MS,
+            name="clip-text-batcher",
+        )
+        self.image = MicroBatcher(
+            lambda pixels: embedder.embed_pixels(np.stack(pixels)),
+            settings.SCHEDULER_MAX_BATCH,
+            settings.SCHEDULER_MAX_WAIT_MS,
+            name="clip-image-batcher",
+        )
+
+    # -----------------------------------------------
+    def embed_text(self, text: str) -> np.ndarray:
+        """Embeds one text query, batched with concurrent callers."""
+        return self.text.submit(text).result()
+
+    # -----------------------------------------------
+    def embed_pixels(self, pixel_values: np.ndarray) -> np.ndarray:
+        """
+        Embeds one preprocessed (3, 224, 224) image, batched with concurrent
+        callers. Decoding stays with the caller so a bad upload never
+        reaches the shared batch.
+        """
+        return self.image.submit(pixel_values).result()
@@ -0,0 +1,168 @@
+# app/services/metadata_store.py
+
+import threading
+
+import faiss
+import numpy as np
+
+from app.db.database import get_connection
+
+STATUSES = ("pending", "approved", "rejected", "deleted")
+
+
+class IdFilter:
+    """
+    A set of allowed FAISS ids, as a bitmap (bit i set = id i allowed).
+    `selector` is the FAISS IDSelector applied inside index.search.
+    """
+
+    def __init__(self, bitmap: np.ndarray, count: int):
+        self.bitmap = bitmap  # keep alive: the selector only holds a pointer
+        self.count = count
+        self.selector = faiss.IDSelectorBitmap(len(bitmap), faiss.swig_ptr(bitmap))
+
+    # -----------------------------------------------
+    def contains(self, ids) -> np.ndarray:
+        ids = np.asarray(ids, dtype="int64")
+        inside = (ids >= 0) & ((ids >> 3) < len(self.bitmap))
+        out = np.zeros(len(ids), dtype=bool)
+        safe = ids[inside]
+        out[inside] = (self.bitmap[safe >> 3] >> (safe & 7).astype("uint8")) & 1 == 1
+        return out
+
+
+class MetadataStore:
+    """
+    In-memory columnar copy of the product fields search can filter on,
+    keyed by FAISS id: main_category, price, seller_id and status.
+
+    Columns are numpy arrays sorted by FAISS id. Updates build new arrays
+    and swap them in, so filters never see a half-applied change.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._categories = {}  # lower-cased main_category -> code
+        self._set_columns(
+            np.zeros(0, dtype="int64"),
+            np.zeros(0, dtype="int32"),
+            np.zeros(0, dtype="float64"),
+            np.zeros(0, dtype="int64"),
+            np.zeros(0, dtype="int8"),
+        )
+
+    # -----------------------------------------------
+    def _set_columns(self, ids, category, price, seller, status):
+        self._columns = (ids, category, price, seller, status)
+
+    # -----------------------------------------------
+    def _category_code(self, name) -> int:
+        if not name:
+            return -1
+        key = name.strip().lower()
+        if key not in self._categories:
+            self._categories[key] = len(self._categories)
+        return self._categories[key]
+
+    # -----------------------------------------------
+    def _encode(self, rows):
+        """(faiss_index, main_category, price, seller_id, status) rows -> column arrays."""
+        rows = sorted(rows, key=lambda r: r[0])
+        return (
+            np.array([r[0] for r in rows], dtype="int64"),
+            np.array([self._category_code(r[1]) for r in rows], dtype="int32"),
+            np.array([float(r[2]) if r[2] is not None else np.nan for r in rows], dtype="float64"),
+            np.array([r[3] if r[3] is not None else -1 for r in rows], dtype="int64"),
+            np.array([STATUSES.index(r[4]) if r[4] in STATUSES else -1 for r in rows], dtype="int8"),
+        )
+
+    # -----------------------------------------------
+    @staticmethod
+    def _fetch(where: str = "", params=()):
+        conn = get_connection()
+        cur = conn.cursor()
+        cur.execute(f"""
+            SELECT faiss_index, main_category, price, seller_id, status
+            FROM products
+            WHERE faiss_index IS NOT NULL {where};
+        """, params)
+        rows = cur.fetchall()
+        cur.close()
+        conn.close()
+        return rows
+
+    # -----------------------------------------------
+    def load(self):
+        """Loads the columns of every indexed product from the DB."""
+        rows = self._fetch()
+        with self._lock:
+            self._set_columns(*self._encode(rows))
+        return len(rows)
+
+    # -----------------------------------------------
+    def upsert(self, rows):
+        """Adds/replaces rows of (faiss_index, main_category, price, seller_id, status)."""
+        if not rows:
+            return
+        with self._lock:
+            new = self._encode(rows)
+            cur = self._columns
+            keep = ~np.isin(cur[0], new[0])
+            merged = [np.concatenate([c[keep], n]) for c, n in zip(cur, new)]
+            order = np.argsort(merged[0], kind="stable")
+            self._set_columns(*(col[order] for col in merged))
+
+    # -----------------------------------------------
+    def refresh_products(self, product_ids):
+        """Re-reads the given products (by product id) from the DB."""
+        if not product_ids:
+            return
+        rows = self._fetch("AND id = ANY(%s)", (list(product_ids),))
+        self.upsert(rows)
+
+    # -----------------------------------------------
+    def remove(self, faiss_ids):
+        if len(faiss_ids) == 0:
+            return
+        with self._lock:
+            cur = self._columns
+            keep = ~np.isin(cur[0], np.asarray(faiss_ids, dtype="int64"))
+            self._set_columns(*(col[keep] for col in cur))
+
+    # -----------------------------------------------
+    def __len__(self):
+        return len(self._columns[0])
+
+    # -----------------------------------------------
+    def build_filter(self, category=None, min_price=None, max_price=None,
+                     seller_id=None, status=None):
+        """
+        Returns an IdFilter of the FAISS ids matching all given conditions,
+        or None when no condition is set (unfiltered search).
+        Products without a price never match a price bound.
+        """
+        if category is None and min_price is None and max_price is None \
+                and seller_id is None and status is None:
+            return None
+
+        ids, cat_col, price_col, seller_col, status_col = self._columns
+        mask = np.ones(len(ids), dtype=bool)
+
+        if category is not None:
+            code = self._categories.get(category.strip().lower(), -2)
+            mask &= cat_col == code
+        if min_price is not None:
+            mask &= price_col >= float(min_price)
+        if max_price is not None:
+            mask &= price_col <= float(max_price)
+        if seller_id is not None:
+            mask &= seller_col == int(seller_id)
+        if status is not None:
+            code = STATUSES.index(status) if status in STATUSES else -2
+            mask &= status_col == code
+
+        allowed = ids[mask]
+        size = int(ids[-1] >> 3) + 1 if len(ids) else 1
+        bitmap = np.zeros(size, dtype="uint8")
+        np.bitwise_or.at(bitmap, allowed >> 3, (1 << (allowed & 7)).astype("uint8"))
+        return IdFilter(bitmap, int(mask.sum()))
@@ -165,6 +165,15 @@ def update_product(product_id: int, product: ProductUpdate) -> bool:
         conn.close()
         return False
 
+    # the stored text embedding no longer matches an edited title/description;
+    # it is re-embedded at approval or by the text backfill
+    if product.title is not None or product.description is not None:
+        updates.append("""text_embedding = CASE
+            WHEN title IS DISTINCT FROM COALESCE(%s, title)
+              OR description IS DISTINCT FROM COALESCE(%s, description)
+            THEN NULL ELSE text_embedding END""")
+        values.extend([product.title, product.description])
+
     values.append(product_id)
     query = f"UPDATE products SET {', '.join(updates)} WHERE id = %s;"
     cur.execute(query, tuple(values))
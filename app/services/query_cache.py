@@ -0,0 +1,119 @@
+# app/services/query_cache.py
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from app.core.config import settings
+
+
+def normalize_query(text: str) -> str:
+    """
+    Canonical cache key for a text query: trimmed, lower-cased and with
+    runs of whitespace collapsed (CLIP's tokenizer lower-cases anyway).
+    """
+    return " ".join(text.lower().split())
+
+
+class QueryEmbeddingCache:
+    """
+    Bounded, thread-safe LRU cache of normalized query string -> 512-d
+    text embedding, with an optional TTL and hit/miss counters.
+    """
+
+    def __init__(self, max_size: int = None, ttl_seconds: float = None):
+        self.max_size = max_size if max_size is not None else settings.QUERY_CACHE_SIZE
+        self.ttl = ttl_seconds if ttl_seconds is not None else settings.QUERY_CACHE_TTL
+        self._data = OrderedDict()  # key -> (expires_at, vector)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # -----------------------------------------------
+    def get(self, text: str):
+        """Returns the cached vector for `text`, or None."""
+        key = normalize_query(text)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, vec = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return vec
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    # -----------------------------------------------
+    def put(self, text: str, vector: np.ndarray):
+        """Stores a vector, evicting the least recently used entries."""
+        if self.max_size <= 0:
+            return
+        key = normalize_query(text)
+        vec = np.asarray(vector, dtype="float32").reshape(-1)
+        vec.flags.writeable = False  # shared across requests
+        expires_at = time.monotonic() + self.ttl if self.ttl > 0 else None
+
+        with self._lock:
+            self._data[key] = (expires_at, vec)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    # -----------------------------------------------
+    def get_or_compute(self, text: str, compute_fn) -> np.ndarray:
+        """Returns the cached vector, computing and storing it on a miss."""
+        vec = self.get(text)
+        if vec is None:
+            vec = compute_fn(text)
+            self.put(text, vec)
+        return vec
+
+    # -----------------------------------------------
+    def warm_from_file(self, path: str, embed_fn, batch_size: int = None) -> int:
+        """
+        Pre-fills the cache from a file with one query per line
+        (most popular first). `embed_fn` takes a list of strings and
+        returns an (N, 512) matrix. Returns the number of queries loaded.
+        """
+        if not path or not os.path.exists(path):
+            return 0
+
+        with open(path, encoding="utf-8") as f:
+            queries = []
+            seen = set()
+            for line in f:
+                key = normalize_query(line)
+                if key and key not in seen:
+                    seen.add(key)
+                    queries.append(key)
+
+        # never load more than fits, and keep the most popular ones
+        queries = queries[:self.max_size]
+        batch_size = batch_size or settings.EMBED_BATCH_SIZE
+
+        # insert least popular first so the top queries end up most recent
+        for start in reversed(range(0, len(queries), batch_size)):
+            chunk = queries[start:start + batch_size]
+            vectors = embed_fn(chunk)
+            for text, vec in reversed(list(zip(chunk, vectors))):
+                self.put(text, vec)
+
+        return len(queries)
+
+    # -----------------------------------------------
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+            }
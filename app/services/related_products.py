@@ -0,0 +1,258 @@
+# app/services/related_products.py
+from datetime import datetime
+
+import numpy as np
+from psycopg2.extras import execute_values
+
+from app.core.config import settings
+from app.db.database import get_connection
+
+# Postgres advisory lock: one refresh at a time across uvicorn workers
+REFRESH_LOCK_KEY = 0x52454C41
+
+BASE_URL = settings.BASE_URL
+
+
+# -------------------------------------------------------
+# NEIGHBOUR COMPUTATION
+# -------------------------------------------------------
+def compute_related(mgr, faiss_ids, top_n: int = None, id_filter=None, batch_size: int = None):
+    """
+    Top-N neighbours of each id, from its stored vector (no CLIP inference)
+    and one batched index search per RELATED_BATCH_SIZE ids.
+    Yields (faiss_id, [(neighbour_id, score)]) best first, without the id
+    itself; ids with no stored vector are skipped.
+    """
+    top_n = top_n or settings.RELATED_TOP_N
+    batch_size = batch_size or settings.RELATED_BATCH_SIZE
+    ids = [int(i) for i in faiss_ids]
+
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start:start + batch_size]
+        by_id = mgr.vectors(batch)
+        query_ids = [i for i in batch if i in by_id]
+        if not query_ids:
+            continue
+
+        hits = mgr.search_batch(np.stack([by_id[i] for i in query_ids]), top_n + 1, id_filter)
+        for own_id, (ids_, scores) in zip(query_ids, hits):
+            yield own_id, [
+                (int(fid), float(score)) for fid, score in zip(ids_, scores)
+                if fid != -1 and fid != own_id
+            ][:top_n]
+
+
+def reverse_neighbours(mgr, faiss_ids, floors_of, top_n: int = None, id_filter=None,
+                       batch_size: int = None) -> set:
+    """
+    Products whose stored top-N list one of `faiss_ids` now enters, without
+    the given ids themselves. Each id's stored vector runs a k-NN search
+    (batched, see search_batch) that doubles k from 2 x top_n until a whole
+    band of new hits scores below their own stored floors, i.e. enters no
+    list.
+    `floors_of(ids) -> {faiss_id: (stored list length, worst stored score)}`
+    is called once per band with the ids not looked up yet.
+    """
+    top_n = top_n or settings.RELATED_TOP_N
+    batch_size = batch_size or settings.RELATED_BATCH_SIZE
+    ids = [int(i) for i in faiss_ids]
+    own = set(ids)
+    total = mgr.ntotal
+    floors, looked_up = {}, set()
+    affected = set()
+
+    for start in range(0, len(ids), batch_size):
+        by_id = mgr.vectors(ids[start:start + batch_size])
+        pending = list(by_id)
+        seen, k = 0, min(2 * top_n, total)
+
+        while pending and k > seen:
+            hits = mgr.search_batch(np.stack([by_id[i] for i in pending]), k, id_filter)
+            bands = [
+                {q: s for q, s in zip(row_ids[seen:], row_scores[seen:]) if q != -1 and q not in own}
+                for row_ids, row_scores in hits
+            ]
+            new = sorted({q for band in bands for q in band} - looked_up)
+            looked_up.update(new)
+            floors.update(floors_of(new))
+
+            still = []
+            for fid, band in zip(pending, bands):
+                entered = affected_by(band, floors, top_n)
+                if entered:
+                    affected |= entered
+                    still.append(fid)
+            pending, seen, k = still, k, min(k * 2, total)
+    return affected
+
+
+def affected_by(candidates: dict, floors: dict, top_n: int) -> set:
+    """
+    The candidates ({faiss_id: score with a changed product}) whose stored
+    list must be recomputed: a changed product now scores higher than the
+    list's worst entry, or the list is short or missing.
+    `floors` = {faiss_id: (stored list length, worst stored score)}.
+    """
+    affected = set()
+    for q, score in candidates.items():
+        length, worst = floors.get(q, (0, None))
+        if length < top_n or worst is None or score > worst:
+            affected.add(q)
+    return affected
+
+
+# -------------------------------------------------------
+# REFRESH JOB
+# -------------------------------------------------------
+def _stored_floors(cur, ids, batch_size: int = None) -> dict:
+    """{product_id: (list length, worst score)} of stored lists, RELATED_BATCH_SIZE ids per query."""
+    batch_size = batch_size or settings.RELATED_BATCH_SIZE
+    floors = {}
+    for start in range(0, len(ids), batch_size):
+        cur.execute("""
+            SELECT product_id, cardinality(scores), scores[cardinality(scores)]
+            FROM related_products
+            WHERE product_id = ANY(%s);
+        """, (list(ids[start:start + batch_size]),))
+        floors.update({pid: (length, worst) for pid, length, worst in cur.fetchall()})
+    return floors
+
+
+def refresh_related(mgr, id_filter=None, full: bool = False) -> dict:
+    """
+    Brings the related_products table up to date with the index.
+
+    - full: recomputes every approved product
+    - otherwise only products approved since the last run (or without a
+      row yet), the stored lists they now enter, and the lists that
+      mention a changed or no longer approved product
+    Rows of products that are no longer approved are deleted.
+
+    `id_filter` keeps non-approved products out of the lists. FAISS ids
+    are product ids. Only one worker refreshes at a time (session-level
+    advisory lock); the others skip.
+    """
+    top_n = settings.RELATED_TOP_N
+    started = datetime.utcnow()
+
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT pg_try_advisory_lock(%s);", (REFRESH_LOCK_KEY,))
+    if not cur.fetchone()[0]:
+        cur.close()
+        conn.close()
+        return {"action": "skipped", "reason": "refresh already running"}
+
+    try:
+        cur.execute("""
+            SELECT r.product_id
+            FROM related_products r
+            LEFT JOIN products p ON p.id = r.product_id
+            WHERE p.id IS NULL OR p.status <> 'approved';
+        """)
+        removed = [row[0] for row in cur.fetchall()]
+
+        if full:
+            cur.execute("""
+                SELECT id FROM products
+                WHERE status = 'approved' AND faiss_index IS NOT NULL;
+            """)
+        else:
+            cur.execute("SELECT MAX(computed_at) FROM related_products;")
+            watermark = cur.fetchone()[0] or datetime.min
+            cur.execute("""
+                SELECT p.id FROM products p
+                WHERE p.status = 'approved' AND p.faiss_index IS NOT NULL
+                  AND (p.approved_at > %s
+                       OR NOT EXISTS (SELECT 1 FROM related_products r WHERE r.product_id = p.id));
+            """, (watermark,))
+        changed = [row[0] for row in cur.fetchall()]
+
+        targets = set(changed)
+        if not full and changed:
+            # the lists a changed product enters: its neighbours that it
+            # scores above their own stored worst entry
+            targets |= reverse_neighbours(
+                mgr, changed, lambda ids: _stored_floors(cur, ids), top_n, id_filter
+            )
+
+            cur.execute("""
+                SELECT product_id FROM related_products
+                WHERE related_ids && %s::integer[] OR cardinality(scores) < %s;
+            """, (sorted(set(changed) | set(removed)), top_n))
+            targets |= {row[0] for row in cur.fetchall()}
+        elif removed:
+            cur.execute("""
+                SELECT product_id FROM related_products WHERE related_ids && %s::integer[];
+            """, (removed,))
+            targets |= {row[0] for row in cur.fetchall()}
+        targets -= set(removed)
+
+        lists = dict(compute_related(mgr, sorted(targets), top_n, id_filter))
+
+        if lists:
+            execute_values(cur, """
+                INSERT INTO related_products (product_id, related_ids, scores, computed_at)
+                VALUES %s
+                ON CONFLICT (product_id) DO UPDATE
+                SET related_ids = EXCLUDED.related_ids,
+                    scores = EXCLUDED.scores,
+                    computed_at = EXCLUDED.computed_at;
+            """, [
+                (pid, [q for q, _ in hits], [s for _, s in hits], started)
+                for pid, hits in lists.items()
+            ])
+        if removed:
+            cur.execute("DELETE FROM related_products WHERE product_id = ANY(%s);", (removed,))
+        conn.commit()
+    finally:
+        # closing the session releases the advisory lock
+        cur.close()
+        conn.close()
+
+    return {
+        "action": "full" if full else "incremental",
+        "changed": len(changed),
+        "recomputed": len(lists),
+        "removed": len(removed),
+    }
+
+
+# -------------------------------------------------------
+# DETAIL PAGE LOOKUP
+# -------------------------------------------------------
+def get_related_products(product_id: int, limit: int = None) -> list:
+    """
+    Precomputed related products of one product, best first: a single
+    primary-key read of its related_products row joined to the products.
+    """
+    limit = limit or settings.RELATED_TOP_N
+
+    conn = get_connection()
+    cur = conn.cursor()
+
+    cur.execute("""
+        SELECT p.id, p.title, p.price, p.image, p.product_url, u.score
+        FROM related_products r
+        CROSS JOIN LATERAL unnest(r.related_ids, r.scores) WITH ORDINALITY AS u(related_id, score, pos)
+        JOIN products p ON p.id = u.related_id
+        WHERE r.product_id = %s AND p.status = 'approved'
+        ORDER BY u.pos
+        LIMIT %s;
+    """, (product_id, limit))
+
+    rows = cur.fetchall()
+    cur.close()
+    conn.close()
+
+    return [
+        {
+            "id": pid,
+            "title": title,
+            "price": float(price) if price else None,
+            "image_url": BASE_URL + image if image else None,
+            "product_url": product_url,
+            "score": float(score),
+        }
+        for pid, title, price, image, product_url, score in rows
+    ]
@@ -1,12 +1,21 @@
 
+import base64
+import binascii
+
 import numpy as np
-import torch
 from fastapi import HTTPException
 
 from app.core.config import settings
+from app.services.image_preprocess import DECODE_ERRORS
 
 # Use global FAISS + CLIP (shared across app)
-from app.services.global_faiss import ensure_services
+from app.services.global_faiss import (
+    ensure_metadata_store,
+    ensure_query_cache,
+    ensure_scheduler,
+    ensure_services,
+    ensure_text_index,
+)
 
 # Correct database import
 from app.db.database import get_connection
@@ -14,67 +23,210 @@ from app.db.database import get_connection
 IMAGE_DIR = settings.IMAGE_DIR
 BASE_URL = settings.BASE_URL
 
+TEXT_SEARCH_SOURCES = ("image", "text", "both")
+
+# metadata filter keys accepted by the search functions
+FILTER_KEYS = ("category", "min_price", "max_price", "seller_id", "status")
+
+
+# -------------------------------------------------------
+# METADATA FILTERS
+# -------------------------------------------------------
+def _build_filter(filters):
+    """
+    Turns {category, min_price, max_price, seller_id, status} into an
+    IdFilter applied inside the FAISS search, or None if no filter is set.
+    Filtered searches only return approved products unless `status` says otherwise.
+    """
+    filters = {k: v for k, v in (filters or {}).items() if k in FILTER_KEYS and v is not None}
+    if not filters:
+        return None
+    filters.setdefault("status", "approved")
+    return ensure_metadata_store().build_filter(**filters)
+
+
+def _category(filters):
+    """Category filter value; sharded indexes search only that shard."""
+    return (filters or {}).get("category")
+
+
+# -------------------------------------------------------
+# K-NN / SIMILARITY THRESHOLD
+# -------------------------------------------------------
+def _result_limit(top_k, min_score=None, max_results=None):
+    """Number of hits a search may return: top_k, or the range search cap."""
+    if min_score is None:
+        return top_k
+    cap = settings.SEARCH_RANGE_MAX_RESULTS
+    return min(max_results, cap) if max_results else cap
+
+
+def _run_search(mgr, vec, top_k, id_filter, filters, min_score=None, max_results=None, extra: int = 0):
+    """
+    k-NN search, or with `min_score` a range search returning only hits at
+    least that similar (capped by max_results / SEARCH_RANGE_MAX_RESULTS),
+    so irrelevant neighbours never reach format_results.
+    `extra` hits are fetched on top of the limit for the caller to drop.
+    """
+    if min_score is None:
+        return mgr.search(vec, top_k + extra, id_filter, _category(filters))
+    limit = _result_limit(top_k, min_score, max_results) + extra
+    return mgr.range_search(vec, min_score, limit, id_filter, _category(filters))
+
+
+# -------------------------------------------------------
+# QUERY EMBEDDING
+# -------------------------------------------------------
+def _require_tower(embedder, tower: str):
+    """503 when this worker does not load the CLIP tower a query needs (CLIP_TOWERS)."""
+    if tower not in embedder.towers:
+        raise HTTPException(status_code=503, detail=f"CLIP {tower} tower is not loaded on this worker")
+
+
+def _compute_text_embedding(text: str) -> np.ndarray:
+    embedder, _ = ensure_services()
+    _require_tower(embedder, "text")
+    scheduler = ensure_scheduler()
+    if scheduler is not None:
+        return scheduler.embed_text(text)
+    return embedder.embed_texts([text])[0]
+
+
+def _embed_text_query(text: str) -> np.ndarray:
+    """
+    Embeds one text query as a (1, 512) normalized vector.
+    Repeated queries are served from the query cache; misses go through
+    the micro-batching scheduler when it is enabled.
+    """
+    vec = ensure_query_cache().get_or_compute(text, _compute_text_embedding)
+    return np.asarray(vec, dtype="float32").reshape(1, -1)
+
+
+def _embed_image_query(image) -> np.ndarray:
+    """
+    Embeds one query image (raw bytes) as a (1, 512) normalized vector.
+    Decoding/resizing runs on the preprocessing pool; the forward pass goes
+    through the micro-batching scheduler when it is enabled.
+    """
+    embedder, _ = ensure_services()
+    _require_tower(embedder, "vision")
+    try:
+        pixels = embedder.preprocess(image)
+    except DECODE_ERRORS as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image: {e}")
+
+    scheduler = ensure_scheduler()
+    if scheduler is not None:
+        vec = scheduler.embed_pixels(pixels)
+    else:
+        vec = embedder.embed_pixels(pixels[None])[0]
+    return np.asarray(vec, dtype="float32").reshape(1, -1)
+
 
 # -------------------------------------------------------
 # IMAGE SEARCH
 # -------------------------------------------------------
-def search_by_image(image_file_bytes, top_k=10):
+def search_by_image(image_file_bytes, top_k=10, filters=None, min_score=None, max_results=None):
     """
     Embeds an image using CLIP and searches the FAISS index for similar products.
+    `filters` restricts results by metadata (see _build_filter); `min_score`
+    returns only hits at least that similar instead of the top_k (see _run_search).
     """
-    embedder, faiss_mgr = ensure_services()
+    _, faiss_mgr = ensure_services()
 
-    temp_path = settings.TEMP_IMAGE_PATH
-    with open(temp_path, "wb") as f:
-        f.write(image_file_bytes)
+    id_filter = _build_filter(filters)
+    if id_filter is not None and id_filter.count == 0:
+        return []
 
-    vec = embedder.embed_image(temp_path)
-    query_vec = np.asarray(vec, dtype="float32").reshape(1, -1)
+    query_vec = _embed_image_query(image_file_bytes)
 
-    ids, scores = faiss_mgr.search(query_vec, top_k)
+    ids, scores = _run_search(faiss_mgr, query_vec, top_k, id_filter, filters, min_score, max_results)
     return format_results(ids, scores)
 
 
 # -------------------------------------------------------
 # TEXT SEARCH
 # -------------------------------------------------------
-def search_by_text(query: str, top_k=10):
+def search_by_text(query: str, top_k=10, source=None, filters=None, min_score=None, max_results=None):
     """
-    Embeds a text query using CLIP and searches the FAISS index.
+    Embeds a text query using CLIP and searches the FAISS indexes.
+    `source` picks the product side to match against: "image" (product
+    image vectors), "text" (title + description vectors) or "both",
+    fused with reciprocal rank fusion.
+    `filters` restricts results by metadata (see _build_filter); with
+    `min_score` each index only contributes hits at least that similar.
     """
-    embedder, faiss_mgr = ensure_services()
+    source = source or settings.TEXT_SEARCH_SOURCE
+    if source not in TEXT_SEARCH_SOURCES:
+        raise HTTPException(status_code=400, detail=f"source must be one of {TEXT_SEARCH_SOURCES}")
+
+    _, faiss_mgr = ensure_services()
 
-    inputs = embedder.processor(
-        text=[query],
-        return_tensors="pt",
-        padding=True,
-        truncation=True,
-        max_length=settings.MAX_TEXT_LENGTH
-    ).to(embedder.device)
+    id_filter = _build_filter(filters)
+    if id_filter is not None and id_filter.count == 0:
+        return []
 
-    with torch.no_grad():
-        txt = embedder.model.get_text_features(**inputs)
+    txt_vec = _embed_text_query(query)
 
-    txt = txt / txt.norm(dim=-1, keepdim=True)
-    txt_vec = txt.cpu().numpy().astype("float32").reshape(1, -1)
+    range_args = (min_score, max_results)
+    if source == "image":
+        ids, scores = _run_search(faiss_mgr, txt_vec, top_k, id_filter, filters, *range_args)
+    elif source == "text":
+        ids, scores = _run_search(ensure_text_index(), txt_vec, top_k, id_filter, filters, *range_args)
+    else:
+        ids, scores = fuse_rankings([
+            _run_search(faiss_mgr, txt_vec, top_k, id_filter, filters, *range_args),
+            _run_search(ensure_text_index(), txt_vec, top_k, id_filter, filters, *range_args),
+        ], _result_limit(top_k, *range_args))
 
-    ids, scores = faiss_mgr.search(txt_vec, top_k)
     return format_results(ids, scores)
 
 
+# -------------------------------------------------------
+# SCORE FUSION
+# -------------------------------------------------------
+def fuse_rankings(rankings, top_k, rrf_k=None):
+    """
+    Reciprocal rank fusion of several (ids, scores) result lists.
+    Text-to-text and text-to-image cosine scores live on different
+    scales, so ranks are fused instead of raw scores.
+    Returns (ids, fused_scores) sorted best first.
+    """
+    rrf_k = rrf_k or settings.RRF_K
+    fused = {}
+
+    for ids, _ in rankings:
+        rank = 0
+        for fid in ids:
+            if fid == -1:
+                continue
+            rank += 1
+            fused[fid] = fused.get(fid, 0.0) + 1.0 / (rrf_k + rank)
+
+    best = sorted(fused.items(), key=lambda kv: kv[1], reverse=True)[:top_k]
+    return [fid for fid, _ in best], [score for _, score in best]
+
+
 # -------------------------------------------------------
 # HYBRID SEARCH
 # -------------------------------------------------------
-def search_hybrid(image_bytes, text_query, w_image=0.5, w_text=0.5, top_k=10):
+def search_hybrid(image_bytes, text_query, w_image=0.5, w_text=0.5, top_k=10, filters=None,
+                  min_score=None, max_results=None):
     """
     Combines image and text vectors with weighted importance and searches FAISS.
     Norms are handled to ensure balanced contribution.
+    `filters` restricts results by metadata (see _build_filter); `min_score`
+    returns only hits at least that similar instead of the top_k.
     """
-    embedder, faiss_mgr = ensure_services()
+    _, faiss_mgr = ensure_services()
 
     if not image_bytes and not text_query:
         raise HTTPException(status_code=400, detail="Provide at least image or text")
 
+    id_filter = _build_filter(filters)
+    if id_filter is not None and id_filter.count == 0:
+        return []
+
     w_image = float(w_image)
     w_text = float(w_text)
     s = w_image + w_text
@@ -88,28 +240,12 @@ def search_hybrid(image_bytes, text_query, w_image=0.5, w_text=0.5, top_k=10):
 
     # Image embedding
     if image_bytes:
-        tmp = settings.TEMP_HYBRID_IMAGE_PATH
-        with open(tmp, "wb") as f:
-            f.write(image_bytes)
-        img_vec = embedder.embed_image(tmp)
-        img_vec = np.asarray(img_vec, dtype="float32").reshape(1, -1)
+        img_vec = _embed_image_query(image_bytes)
         parts.append((w_image, img_vec))
 
     # Text embedding
     if text_query:
-        inputs = embedder.processor(
-            text=[text_query],
-            return_tensors="pt",
-            padding=True,
-            truncation=True,
-            max_length=settings.MAX_TEXT_LENGTH
-        ).to(embedder.device)
-
-        with torch.no_grad():
-            txt = embedder.model.get_text_features(**inputs)
-
-        txt = txt / txt.norm(dim=-1, keepdim=True)
-        txt_vec = txt.cpu().numpy().astype("float32").reshape(1, -1)
+        txt_vec = _embed_text_query(text_query)
         parts.append((w_text, txt_vec))
 
     combined = np.zeros_like(parts[0][1], dtype="float32")
@@ -121,34 +257,256 @@ def search_hybrid(image_bytes, text_query, w_image=0.5, w_text=0.5, top_k=10):
         norm[0] = 1
     combined = combined / norm
 
-    ids, scores = faiss_mgr.search(combined.astype("float32"), top_k)
+    ids, scores = _run_search(
+        faiss_mgr, combined.astype("float32"), top_k, id_filter, filters, min_score, max_results
+    )
     return format_results(ids, scores)
 
 
 # -------------------------------------------------------
-# FORMAT RESULTS
+# MORE LIKE THIS
 # -------------------------------------------------------
-def format_results(ids, scores):
+def search_similar(product_id: int, top_k=10, source="image", filters=None,
+                   min_score=None, max_results=None):
     """
-    Resolves FAISS IDs back to database product records.
-    Returns a list of result dictionaries with metadata.
+    Finds products similar to a catalog product using its stored vector
+    (reconstructed from the index, or products.embedding / text_embedding),
+    so no CLIP inference runs. The product itself is left out of the results.
+    `source` picks the image or text index.
     """
+    if source not in ("image", "text"):
+        raise HTTPException(status_code=400, detail="source must be 'image' or 'text'")
+    mgr = ensure_services()[1] if source == "image" else ensure_text_index()
+
     conn = get_connection()
     cur = conn.cursor()
+    cur.execute("SELECT faiss_index FROM products WHERE id = %s;", (product_id,))
+    row = cur.fetchone()
+    cur.close()
+    conn.close()
 
-    results = []
+    if not row:
+        raise HTTPException(status_code=404, detail="Product not found")
+    faiss_id = row[0]
+    vec = mgr.vector(faiss_id) if faiss_id is not None else None
+    if vec is None:
+        raise HTTPException(status_code=404, detail=f"Product has no {source} vector")
 
-    for fid, dist in zip(ids, scores):
-        if fid == -1:
+    id_filter = _build_filter(filters)
+    if id_filter is not None and id_filter.count == 0:
+        return []
+
+    # one extra hit to make up for the product itself, also past the range cap
+    ids, scores = _run_search(
+        mgr, np.asarray(vec, dtype="float32").reshape(1, -1), top_k, id_filter, filters,
+        min_score, max_results, extra=1,
+    )
+    hits = [(fid, score) for fid, score in zip(ids, scores) if fid != faiss_id]
+    hits = hits[:_result_limit(top_k, min_score, max_results)]
+    return format_results([fid for fid, _ in hits], [score for _, score in hits])
+
+
+# -------------------------------------------------------
+# BATCH SEARCH
+# -------------------------------------------------------
+def _embed_text_queries(texts) -> np.ndarray:
+    """
+    Embeds many text queries as an (N, 512) matrix: cache hits are reused,
+    the misses go through one batched forward pass and are cached.
+    """
+    cache = ensure_query_cache()
+    out = np.zeros((len(texts), settings.FAISS_DIM), dtype="float32")
+
+    missing = {}
+    for i, text in enumerate(texts):
+        vec = cache.get(text)
+        if vec is not None:
+            out[i] = vec
+        else:
+            missing.setdefault(text, []).append(i)
+
+    if missing:
+        embedder, _ = ensure_services()
+        _require_tower(embedder, "text")
+        miss_texts = list(missing)
+        vectors = embedder.embed_texts(miss_texts)
+        for text, vec in zip(miss_texts, vectors):
+            cache.put(text, vec)
+            out[missing[text]] = vec
+
+    return out
+
+
+def _embed_image_queries(images, positions) -> np.ndarray:
+    """
+    Embeds many query images (raw bytes) as an (N, 512) matrix.
+    All images are preprocessed on the pool in parallel, then run through
+    the vision tower in EMBED_BATCH_SIZE forward passes.
+    `positions` are the query indexes, used in error messages.
+    """
+    embedder, _ = ensure_services()
+    _require_tower(embedder, "vision")
+    futures = [embedder.preprocess_async(img) for img in images]
+
+    pixels = []
+    for pos, fut in zip(positions, futures):
+        try:
+            pixels.append(fut.result())
+        except DECODE_ERRORS as e:
+            raise HTTPException(status_code=400, detail=f"Query {pos}: invalid image: {e}")
+
+    out = np.zeros((len(pixels), settings.FAISS_DIM), dtype="float32")
+    batch_size = settings.EMBED_BATCH_SIZE
+    for start in range(0, len(pixels), batch_size):
+        chunk = np.stack(pixels[start:start + batch_size])
+        out[start:start + len(chunk)] = embedder.embed_pixels(chunk)
+    return out
+
+
+def _decode_image(data: str, pos: int) -> bytes:
+    try:
+        return base64.b64decode(data, validate=True)
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=400, detail=f"Query {pos}: image is not valid base64")
+
+
+def search_batch(queries, top_k=10):
+    """
+    Runs many text, image or hybrid queries at once.
+
+    Each query is a dict with optional `text`, `image` (base64 string),
+    `w_image` / `w_text` (hybrid weights), `source` (text-only queries,
+    as in search_by_text) and metadata filters (FILTER_KEYS). All texts
+    and all images are embedded in batched forward passes, each FAISS
+    index is searched with one matrix call per distinct filter, and all
+    hits are hydrated in one DB round trip.
+    Returns one result list per query, in input order.
+    """
+    if len(queries) > settings.SEARCH_BATCH_MAX_QUERIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.SEARCH_BATCH_MAX_QUERIES} queries per batch"
+        )
+
+    text_pos, texts = [], []
+    image_pos, images = [], []
+    for pos, q in enumerate(queries):
+        if not q.get("text") and not q.get("image"):
+            raise HTTPException(status_code=400, detail=f"Query {pos}: provide text or image")
+        source = q.get("source") or settings.TEXT_SEARCH_SOURCE
+        if source not in TEXT_SEARCH_SOURCES:
+            raise HTTPException(status_code=400, detail=f"Query {pos}: source must be one of {TEXT_SEARCH_SOURCES}")
+        if q.get("text"):
+            text_pos.append(pos)
+            texts.append(q["text"])
+        if q.get("image"):
+            image_pos.append(pos)
+            images.append(_decode_image(q["image"], pos))
+
+    text_vecs = dict(zip(text_pos, _embed_text_queries(texts))) if texts else {}
+    image_vecs = dict(zip(image_pos, _embed_image_queries(images, image_pos))) if images else {}
+
+    # one query vector per (index, query): hybrid + image queries and text
+    # queries with source image/both hit the image index; source text/both
+    # text queries hit the text index
+    image_index_rows, image_index_pos = [], []
+    text_index_rows, text_index_pos = [], []
+
+    for pos, q in enumerate(queries):
+        if pos in image_vecs:
+            w_image = float(q.get("w_image", settings.DEFAULT_WEIGHT_IMAGE))
+            w_text = float(q.get("w_text", settings.DEFAULT_WEIGHT_TEXT)) if pos in text_vecs else 0.0
+            if w_image + w_text <= 0:
+                raise HTTPException(status_code=400, detail=f"Query {pos}: invalid weights")
+            combined = w_image * image_vecs[pos]
+            if pos in text_vecs:
+                combined = combined + w_text * text_vecs[pos]
+            norm = np.linalg.norm(combined)
+            image_index_rows.append(combined / (norm if norm > 0 else 1.0))
+            image_index_pos.append(pos)
             continue
 
-        cur.execute("""
-            SELECT id, faiss_index, title, price, image, description, product_url
-            FROM products
-            WHERE faiss_index = %s;
-        """, (int(fid),))
+        source = q.get("source") or settings.TEXT_SEARCH_SOURCE
+        if source in ("image", "both"):
+            image_index_rows.append(text_vecs[pos])
+            image_index_pos.append(pos)
+        if source in ("text", "both"):
+            text_index_rows.append(text_vecs[pos])
+            text_index_pos.append(pos)
+
+    _, faiss_mgr = ensure_services()
+    rankings = {pos: [] for pos in range(len(queries))}
+
+    # queries sharing the same filters share one search call
+    filter_keys = [
+        tuple((k, q.get(k)) for k in FILTER_KEYS if q.get(k) is not None)
+        for q in queries
+    ]
+    id_filters = {key: _build_filter(dict(key)) for key in set(filter_keys)}
+
+    for mgr, rows, positions in (
+        (faiss_mgr, image_index_rows, image_index_pos),
+        (ensure_text_index(), text_index_rows, text_index_pos),
+    ):
+        groups = {}
+        for row, pos in zip(rows, positions):
+            groups.setdefault(filter_keys[pos], []).append((row, pos))
+
+        for key, members in groups.items():
+            id_filter = id_filters[key]
+            if id_filter is not None and id_filter.count == 0:
+                hits = [([], [])] * len(members)
+            else:
+                hits = mgr.search_batch(
+                    np.stack([row for row, _ in members]), top_k, id_filter, dict(key).get("category")
+                )
+            for (_, pos), hit in zip(members, hits):
+                rankings[pos].append(hit)
+
+    per_query = []
+    for pos in range(len(queries)):
+        ranked = rankings[pos]
+        per_query.append(ranked[0] if len(ranked) == 1 else fuse_rankings(ranked, top_k))
+
+    products = _fetch_products_by_faiss_ids(
+        {int(fid) for ids, _ in per_query for fid in ids if fid != -1}
+    )
+    return [_format_hits(ids, scores, products) for ids, scores in per_query]
+
+
+# -------------------------------------------------------
+# RESULT HYDRATION
+# -------------------------------------------------------
+def _fetch_products_by_faiss_ids(faiss_ids) -> dict:
+    """
+    Loads the product rows for a set of FAISS ids in one round trip.
+    Returns {faiss_index: row}.
+    """
+    if not faiss_ids:
+        return {}
 
-        row = cur.fetchone()
+    conn = get_connection()
+    cur = conn.cursor()
+
+    cur.execute("""
+        SELECT id, faiss_index, title, price, image, description, product_url
+        FROM products
+        WHERE faiss_index = ANY(%s);
+    """, (list(faiss_ids),))
+
+    rows = cur.fetchall()
+    cur.close()
+    conn.close()
+
+    return {row[1]: row for row in rows}
+
+
+def _format_hits(ids, scores, products) -> list:
+    """Builds result dicts for FAISS hits, in rank order, from preloaded rows."""
+    results = []
+
+    for fid, dist in zip(ids, scores):
+        row = products.get(int(fid)) if fid != -1 else None
         if not row:
             continue
 
@@ -165,7 +523,17 @@ def format_results(ids, scores):
             "distance": float(dist)
         })
 
-    cur.close()
-    conn.close()
-
     return results
+
+
+# -------------------------------------------------------
+# FORMAT RESULTS
+# -------------------------------------------------------
+def format_results(ids, scores):
+    """
+    Resolves FAISS IDs back to database product records in one query
+    (WHERE faiss_index = ANY), keeping the FAISS rank order.
+    Returns a list of result dictionaries with metadata.
+    """
+    faiss_ids = list(dict.fromkeys(int(fid) for fid in ids if fid != -1))
+    return _format_hits(ids, scores, _fetch_products_by_faiss_ids(faiss_ids))
@@ -0,0 +1,430 @@
+# app/services/sharded_faiss.py
+
+import hashlib
+import heapq
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.faiss_manager import FaissManager, file_lock, file_state, write_json_atomic
+
+
+def category_key(category) -> str:
+    """Normalized shard key of a main_category ('' = uncategorized)."""
+    return (category or "").strip().lower()
+
+
+class ShardedFaissManager:
+    """
+    Keeps one FaissManager shard per main_category, with the same search /
+    mutation interface as FaissManager.
+
+    - category-scoped queries search only their shard
+    - global queries fan out over all shards on a thread pool (FAISS
+      releases the GIL while searching) and merge the top-k with a heap
+    - shards are rebuilt independently (rebuild_shard)
+
+    Shards are stored as `<name>__<slug>.faiss`; `<name>.shards.json` maps
+    shard names back to categories. With FAISS_SHARED, shards created or
+    changed by other workers are picked up from the registry and the
+    shard files.
+    """
+
+    def __init__(self, name: str = "index", vector_loader=None):
+        self.name = name
+        self.vector_loader = vector_loader
+        self.dim = settings.FAISS_DIM
+        self.index_type = settings.FAISS_INDEX_TYPE
+        self.registry_path = os.path.join(settings.FAISS_INDEX_DIR, f"{name}.shards.json")
+        self.registry_lock_path = os.path.join(settings.FAISS_INDEX_DIR, f"{name}.shards.lock")
+        self.shared = settings.FAISS_SHARED
+
+        self._lock = threading.RLock()
+        self.shards = {}  # category key -> FaissManager
+        self._shard_of = {}  # faiss id -> category key
+        self._synced = {}  # category key -> shard generation _shard_of reflects
+        self._registry_state = None
+        self._next_check = 0.0
+        self._pool = ThreadPoolExecutor(
+            max_workers=settings.FAISS_SHARD_WORKERS, thread_name_prefix=f"faiss-{name}"
+        )
+
+        os.makedirs(settings.FAISS_INDEX_DIR, exist_ok=True)
+        with self._lock:
+            self._sync_registry()
+
+    # -----------------------------------------------
+    def _shard_name(self, key: str) -> str:
+        slug = re.sub(r"[^a-z0-9]+", "_", key).strip("_")[:40] or "uncategorized"
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:8]
+        return f"{self.name}__{slug}_{digest}"
+
+    # -----------------------------------------------
+    def _read_registry(self) -> set:
+        try:
+            with open(self.registry_path) as f:
+                return set(json.load(f).get("categories", []))
+        except (OSError, ValueError):
+            return set()
+
+    # -----------------------------------------------
+    def _sync_registry(self):
+        """Opens shards listed in the registry and forgets unlisted ones (caller holds _lock)."""
+        state = file_state(self.registry_path)
+        if state == self._registry_state:
+            return
+        self._registry_state = state
+
+        keys = self._read_registry()
+        for key in keys - set(self.shards):
+            self.shards[key] = FaissManager(name=self._shard_name(key), vector_loader=self.vector_loader)
+            self.refresh_shard_ids(key)
+        for key in set(self.shards) - keys:
+            self.shards.pop(key)
+            self._forget_ids(key)
+
+    # -----------------------------------------------
+    def _update_registry(self, add=(), drop=()):
+        """Adds/removes registry entries; shared registries are merged under a file lock."""
+        with file_lock(self.registry_lock_path):
+            keys = self._read_registry() if self.shared else set(self.shards)
+            write_json_atomic(self.registry_path, {"categories": sorted((keys | set(add)) - set(drop))})
+
+    # -----------------------------------------------
+    def refresh(self, force: bool = False):
+        """
+        FAISS_SHARED: picks up shards other workers created or dropped
+        (at most every FAISS_SHARED_CHECK_INTERVAL seconds unless `force`).
+        Each shard remaps its own newer generations.
+        """
+        if not self.shared:
+            return
+        now = time.monotonic()
+        if not force and now < self._next_check:
+            return
+        self._next_check = now + settings.FAISS_SHARED_CHECK_INTERVAL
+        if self._lock.acquire(blocking=force):
+            try:
+                self._sync_registry()
+            finally:
+                self._lock.release()
+
+    # -----------------------------------------------
+    def _sync_ids(self):
+        """
+        FAISS_SHARED: brings the id -> shard map up to date with shards
+        other workers changed, before a mutation (caller holds _lock).
+        """
+        if not self.shared:
+            return
+        self._sync_registry()
+        for key, shard in self.shards.items():
+            shard.refresh(force=True)
+            if self._synced.get(key) != shard.generation:
+                self.refresh_shard_ids(key)
+
+    # -----------------------------------------------
+    def shard(self, category, create: bool = False):
+        """The shard of a category (created on demand if `create`)."""
+        key = category_key(category)
+        with self._lock:
+            if key not in self.shards and create:
+                self.shards[key] = FaissManager(
+                    name=self._shard_name(key), vector_loader=self.vector_loader
+                )
+                self._update_registry(add=[key])
+                self.refresh_shard_ids(key)
+            return self.shards.get(key)
+
+    # -----------------------------------------------
+    def drop_shard(self, category):
+        """Removes a shard and its files: index, sidecar, delta, lock and backups."""
+        key = category_key(category)
+        with self._lock:
+            shard = self.shards.pop(key, None)
+            if shard is None:
+                return
+            shard.close()
+            self._update_registry(drop=[key])
+            # workers that still map the files keep reading the unlinked pages
+            for path in (shard.index_path, shard.meta_path, shard.delta_path, shard.lock_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            shutil.rmtree(shard.backup.dir, ignore_errors=True)
+            self._forget_ids(key)
+
+    # -----------------------------------------------
+    def refresh_shard_ids(self, category):
+        """Re-syncs the id -> shard map after a shard was changed directly."""
+        key = category_key(category)
+        with self._lock:
+            self._forget_ids(key)
+            shard = self.shards.get(key)
+            if shard is not None:
+                self._synced[key] = shard.generation
+                for fid in shard.ids().tolist():
+                    self._shard_of[fid] = key
+
+    # -----------------------------------------------
+    def _forget_ids(self, key: str):
+        self._shard_of = {fid: k for fid, k in self._shard_of.items() if k != key}
+        self._synced.pop(key, None)
+
+    # -----------------------------------------------
+    def ids(self) -> np.ndarray:
+        with self._lock:
+            self._sync_ids()
+            return np.fromiter(self._shard_of.keys(), dtype="int64", count=len(self._shard_of))
+
+    # -----------------------------------------------
+    @property
+    def ntotal(self) -> int:
+        self.refresh()
+        return sum(s.ntotal for s in list(self.shards.values()))
+
+    # -----------------------------------------------
+    # MUTATIONS
+    # -----------------------------------------------
+    def add_vectors(self, vectors, ids, categories=None):
+        """
+        Adds/updates vectors in the shard of their category. A product whose
+        category changed is removed from its previous shard.
+        """
+        if len(ids) == 0:
+            return
+        if categories is None:
+            raise ValueError("Sharded FAISS indexes need the category of each vector")
+
+        vecs = np.asarray(vectors, dtype="float32").reshape(len(ids), -1)
+        groups = {}
+        for row, (fid, category) in enumerate(zip(ids, categories)):
+            groups.setdefault(category_key(category), []).append((row, int(fid)))
+
+        with self._lock:
+            self._sync_ids()
+            moved = {}
+            for key, members in groups.items():
+                for _, fid in members:
+                    old = self._shard_of.get(fid)
+                    if old is not None and old != key:
+                        moved.setdefault(old, []).append(fid)
+            for old, fids in moved.items():
+                self.shards[old].remove_vectors(fids)
+                for fid in fids:
+                    self._shard_of.pop(fid, None)
+                self._synced[old] = self.shards[old].generation
+
+            for key, members in groups.items():
+                rows = [r for r, _ in members]
+                fids = [f for _, f in members]
+                shard = self.shard(key, create=True)
+                shard.add_vectors(vecs[rows], fids)
+                for fid in fids:
+                    self._shard_of[fid] = key
+                self._synced[key] = shard.generation
+
+    # -----------------------------------------------
+    def add_vector(self, vector: np.ndarray, id_: int, category=None):
+        self.add_vectors(np.asarray(vector, dtype="float32").reshape(1, -1), [id_], [category])
+
+    # -----------------------------------------------
+    def remove_vectors(self, ids):
+        with self._lock:
+            self._sync_ids()
+            groups = {}
+            for fid in ids:
+                key = self._shard_of.get(int(fid))
+                if key is not None:
+                    groups.setdefault(key, []).append(int(fid))
+
+            ok = True
+            for key, fids in groups.items():
+                ok = self.shards[key].remove_vectors(fids) and ok
+                for fid in fids:
+                    self._shard_of.pop(fid, None)
+                self._synced[key] = self.shards[key].generation
+            return ok
+
+    # -----------------------------------------------
+    def remove_vector(self, product_id: int):
+        return self.remove_vectors([product_id])
+
+    # -----------------------------------------------
+    def rebuild_shard(self, category, vectors, ids, watermark=None):
+        """Rebuilds a single category shard (dropping it when empty)."""
+        key = category_key(category)
+        with self._lock:
+            self._sync_ids()
+            if not ids:
+                self.drop_shard(key)
+                return
+            shard = self.shard(key, create=True)
+            shard.rebuild(vectors, ids, watermark=watermark)
+            self.refresh_shard_ids(key)
+
+    # -----------------------------------------------
+    def rebuild(self, vectors, ids, watermark=None, categories=None):
+        """Rebuilds every shard from scratch; shards with no vectors are dropped."""
+        if ids and categories is None:
+            raise ValueError("Sharded FAISS indexes need the category of each vector")
+
+        groups = {}
+        for vec, fid, category in zip(vectors, ids, categories or []):
+            vs, fs = groups.setdefault(category_key(category), ([], []))
+            vs.append(vec)
+            fs.append(fid)
+
+        with self._lock:
+            self._sync_ids()
+            for key in list(self.shards):
+                if key not in groups:
+                    self.drop_shard(key)
+            for key, (vs, fs) in groups.items():
+                self.rebuild_shard(key, vs, fs, watermark=watermark)
+
+    # -----------------------------------------------
+    def note_watermark(self, approved_at):
+        for shard in list(self.shards.values()):
+            shard.note_watermark(approved_at)
+
+    # -----------------------------------------------
+    def set_search_params(self, nprobe: int = None, ef_search: int = None):
+        for shard in list(self.shards.values()):
+            shard.set_search_params(nprobe=nprobe, ef_search=ef_search)
+
+    # -----------------------------------------------
+    def save(self):
+        for shard in list(self.shards.values()):
+            shard.save()
+
+    # -----------------------------------------------
+    def flush(self):
+        for shard in list(self.shards.values()):
+            shard.flush()
+
+    # -----------------------------------------------
+    def close(self):
+        for shard in list(self.shards.values()):
+            shard.close()
+        self._pool.shutdown(wait=False)
+
+    # -----------------------------------------------
+    def backup_index(self):
+        return {
+            key or "(uncategorized)": shard.backup_index()
+            for key, shard in sorted(self.shards.items())
+        }
+
+    # -----------------------------------------------
+    def list_backups(self) -> dict:
+        return {key or "(uncategorized)": shard.list_backups() for key, shard in sorted(self.shards.items())}
+
+    # -----------------------------------------------
+    def restore_backup(self, base: str = None) -> dict:
+        """Restores every shard that has a backup from its latest one (bases are per shard)."""
+        if base is not None:
+            raise ValueError("Sharded indexes restore each shard from its latest backup")
+        with self._lock:
+            results = {}
+            for key, shard in sorted(self.shards.items()):
+                if shard.backup.latest() is None:
+                    continue
+                results[key or "(uncategorized)"] = shard.restore_backup()
+                self.refresh_shard_ids(key)
+            return results
+
+    # -----------------------------------------------
+    # SEARCH
+    # -----------------------------------------------
+    def _targets(self, category):
+        self.refresh()
+        if category is not None:
+            shard = self.shards.get(category_key(category))
+            return [shard] if shard is not None else []
+        return [s for s in list(self.shards.values()) if s.ntotal > 0]
+
+    # -----------------------------------------------
+    def search(self, vector: np.ndarray, top_k: int = 10, id_filter=None, category=None):
+        """
+        Searches the shard of `category`, or all shards in parallel,
+        and returns the merged top-k (ids, scores).
+        """
+        return self.search_batch(vector, top_k, id_filter, category)[0]
+
+    # -----------------------------------------------
+    def search_batch(self, vectors: np.ndarray, top_k: int = 10, id_filter=None, category=None):
+        vecs = np.asarray(vectors, dtype="float32").reshape(-1, self.dim)
+        targets = self._targets(category)
+        if not targets:
+            return [([], []) for _ in range(len(vecs))]
+        if len(targets) == 1:
+            return targets[0].search_batch(vecs, top_k, id_filter)
+
+        futures = [self._pool.submit(s.search_batch, vecs, top_k, id_filter) for s in targets]
+        per_shard = [f.result() for f in futures]
+
+        results = []
+        for row in range(len(vecs)):
+            hits = (
+                (score, fid)
+                for shard_hits in per_shard
+                for fid, score in zip(*shard_hits[row])
+                if fid != -1
+            )
+            best = heapq.nlargest(top_k, hits)
+            results.append(([fid for _, fid in best], [score for score, _ in best]))
+        return results
+
+    # -----------------------------------------------
+    def vectors(self, faiss_ids) -> dict:
+        """Stored vectors of many ids, from the shards holding them (see FaissManager.vectors)."""
+        groups = {}
+        for fid in faiss_ids:
+            groups.setdefault(self._shard_of.get(int(fid)), []).append(int(fid))
+
+        found = {}
+        for key, ids in groups.items():
+            shard = self.shards.get(key)
+            if shard is not None:
+                found.update(shard.vectors(ids))
+            elif self.vector_loader is not None:
+                found.update(self.vector_loader(ids))
+        return found
+
+    # -----------------------------------------------
+    def vector(self, faiss_id: int):
+        return self.vectors([faiss_id]).get(int(faiss_id))
+
+    # -----------------------------------------------
+    def range_search(self, vector: np.ndarray, min_score: float, max_results: int = None,
+                     id_filter=None, category=None):
+        """Range search over the shard of `category` or all shards, merged best first."""
+        targets = self._targets(category)
+        if len(targets) == 1:
+            return targets[0].range_search(vector, min_score, max_results, id_filter)
+
+        futures = [
+            self._pool.submit(s.range_search, vector, min_score, max_results, id_filter)
+            for s in targets
+        ]
+        hits = [(score, fid) for f in futures for fid, score in zip(*f.result())]
+        best = heapq.nlargest(max_results, hits) if max_results is not None else sorted(hits, reverse=True)
+        return [fid for _, fid in best], [score for score, _ in best]
+
+    # -----------------------------------------------
+    def stats(self) -> dict:
+        shards = {key or "(uncategorized)": s.stats() for key, s in sorted(self.shards.items())}
+        return {
+            "configured_type": self.index_type,
+            "sharded": True,
+            "ntotal": sum(s["ntotal"] for s in shards.values()),
+            "memory_bytes": sum(s["memory_bytes"] for s in shards.values()),
+            "shards": shards,
+        }
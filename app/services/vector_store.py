@@ -0,0 +1,73 @@
+# app/services/vector_store.py
+
+from typing import Dict, List
+
+import numpy as np
+
+from app.db.database import get_connection
+
+# products columns holding float32 CLIP vectors
+VECTOR_COLUMNS = ("embedding", "text_embedding")
+
+
+def load_product_vectors(faiss_ids: List[int], column: str = "embedding") -> Dict[int, np.ndarray]:
+    """
+    Fetches the stored float32 vectors of products by FAISS id in one
+    round trip. Returns {faiss_id: vector} for the ids found.
+    Not limited to approved products: the index also holds products
+    moderated after approval, and re-scoring compressed-index candidates
+    must not drop them (admin moderation search filters on status).
+    """
+    if column not in VECTOR_COLUMNS:
+        raise ValueError(f"Unknown vector column: {column}")
+    if not faiss_ids:
+        return {}
+
+    conn = get_connection()
+    cur = conn.cursor()
+
+    cur.execute(f"""
+        SELECT faiss_index, {column}
+        FROM products
+        WHERE faiss_index = ANY(%s) AND {column} IS NOT NULL;
+    """, (list(faiss_ids),))
+
+    rows = cur.fetchall()
+    cur.close()
+    conn.close()
+
+    return {fid: np.frombuffer(emb, dtype="float32") for fid, emb in rows}
+
+
+def load_all_product_vectors():
+    """
+    Loads every approved product's image and text vectors.
+    Returns (vectors, ids, text_vectors, text_ids).
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+
+    cur.execute("""
+        SELECT faiss_index, embedding, text_embedding
+        FROM products
+        WHERE status='approved' AND embedding IS NOT NULL;
+    """)
+
+    rows = cur.fetchall()
+    cur.close()
+    conn.close()
+
+    vectors = []
+    ids = []
+    text_vectors = []
+    text_ids = []
+
+    for faiss_id, emb_bytes, text_bytes in rows:
+        if faiss_id is not None and emb_bytes:
+            vectors.append(np.frombuffer(emb_bytes, dtype="float32"))
+            ids.append(faiss_id)
+        if faiss_id is not None and text_bytes:
+            text_vectors.append(np.frombuffer(text_bytes, dtype="float32"))
+            text_ids.append(faiss_id)
+
+    return vectors, ids, text_vectors, text_ids
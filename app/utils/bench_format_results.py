@@ -0,0 +1,104 @@
+# app/utils/bench_format_results.py
+"""
+Measures search result hydration latency as a function of k against the
+configured database: the batched format_results (one ANY query) versus
+the previous one-SELECT-per-hit loop. Uses approved products' FAISS ids.
+
+Usage:
+    python -m app.utils.bench_format_results [--k 1 5 10 25 50 100] [--repeats 20]
+"""
+
+import argparse
+import statistics
+import time
+
+from app.db.database import get_connection
+from app.services.search_service import BASE_URL, format_results
+
+
+def per_row_format_results(ids, scores):
+    """The previous hydration: one SELECT per hit (the baseline)."""
+    conn = get_connection()
+    cur = conn.cursor()
+
+    results = []
+    for fid, dist in zip(ids, scores):
+        if fid == -1:
+            continue
+        cur.execute("""
+            SELECT id, faiss_index, title, price, image, description, product_url
+            FROM products
+            WHERE faiss_index = %s;
+        """, (int(fid),))
+        row = cur.fetchone()
+        if not row:
+            continue
+
+        prod_id, faiss_index, title, price, image, description, product_url = row
+        results.append({
+            "id": prod_id,
+            "faiss_index": faiss_index,
+            "title": title,
+            "price": float(price) if price else None,
+            "description": description,
+            "image_url": BASE_URL + image if image else None,
+            "product_url": product_url,
+            "distance": float(dist)
+        })
+
+    cur.close()
+    conn.close()
+    return results
+
+
+def sample_faiss_ids(limit: int) -> list:
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT faiss_index FROM products
+        WHERE status = 'approved' AND faiss_index IS NOT NULL
+        ORDER BY random()
+        LIMIT %s;
+    """, (limit,))
+    ids = [row[0] for row in cur.fetchall()]
+    cur.close()
+    conn.close()
+    return ids
+
+
+def time_ms(fn, ids, scores, repeats: int) -> float:
+    """Median wall time of fn(ids, scores) in milliseconds."""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(ids, scores)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark search result hydration by k")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 5, 10, 25, 50, 100])
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    pool = sample_faiss_ids(max(args.k))
+    if not pool:
+        print("No approved products to benchmark with.")
+        return
+
+    print(f"{'k':>5} {'per-row ms':>12} {'batched ms':>12} {'speedup':>9}")
+    for k in args.k:
+        ids = pool[:k]
+        scores = [1.0 - i / (k + 1) for i in range(len(ids))]
+
+        # same results, same order
+        assert format_results(ids, scores) == per_row_format_results(ids, scores)
+
+        per_row = time_ms(per_row_format_results, ids, scores, args.repeats)
+        batched = time_ms(format_results, ids, scores, args.repeats)
+        print(f"{len(ids):>5} {per_row:>12.2f} {batched:>12.2f} {per_row / batched:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+# app/utils/faiss_restore.py
+"""
+Lists or restores incremental FAISS backups (base snapshot + replayed
+add/remove log). Stop the API first unless FAISS_SHARED is on, otherwise
+a running worker overwrites the restored file with its next save.
+
+Usage:
+    python -m app.utils.faiss_restore [--index index|text_index] [--list] [--base NAME]
+"""
+
+import argparse
+import json
+from functools import partial
+
+from app.core.config import settings
+from app.services.faiss_manager import FaissManager
+from app.services.sharded_faiss import ShardedFaissManager
+from app.services.vector_store import load_product_vectors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Restore a FAISS index from its incremental backups")
+    parser.add_argument("--index", default="index", choices=["index", "text_index"])
+    parser.add_argument("--list", action="store_true", help="only list the available bases")
+    parser.add_argument("--base", default=None, help="base file name (default: the latest)")
+    args = parser.parse_args()
+
+    column = "embedding" if args.index == "index" else "text_embedding"
+    manager_class = ShardedFaissManager if settings.FAISS_SHARD_BY_CATEGORY else FaissManager
+    mgr = manager_class(name=args.index, vector_loader=partial(load_product_vectors, column=column))
+    try:
+        if args.list:
+            print(json.dumps(mgr.list_backups(), indent=2))
+            return
+        print(json.dumps(mgr.restore_backup(args.base), indent=2))
+    finally:
+        mgr.close()
+
+
+if __name__ == "__main__":
+    main()
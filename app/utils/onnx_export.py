@@ -0,0 +1,146 @@
+# app/utils/onnx_export.py
+"""
+Exports the CLIP vision and text towers to ONNX, optionally writes
+dynamically int8-quantized copies, and reports cosine drift against the
+PyTorch embeddings the FAISS index was built with.
+
+Usage:
+    python -m app.utils.onnx_export [--out DIR] [--quantize] [--images DIR]
+"""
+
+import argparse
+import os
+
+import torch
+from transformers import CLIPModel
+
+from app.core.config import settings
+from app.services.clip_backends import onnx_path, parity_report
+
+PARITY_TEXTS = [
+    "red running shoes",
+    "wireless bluetooth headphones",
+    "wooden dining table",
+    "women's summer dress",
+    "stainless steel water bottle",
+    "kids toy car",
+]
+
+
+class _VisionTower(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values):
+        return self.model.get_image_features(pixel_values=pixel_values)
+
+
+class _TextTower(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        return self.model.get_text_features(input_ids=input_ids, attention_mask=attention_mask)
+
+
+def export_towers(out_dir: str, opset: int = 17):
+    """Exports both towers with dynamic batch (and sequence) axes."""
+    os.makedirs(out_dir, exist_ok=True)
+    model = CLIPModel.from_pretrained(settings.MODEL_PATH).eval()
+
+    size = model.config.vision_config.image_size
+    dummy_pixels = torch.zeros(1, 3, size, size, dtype=torch.float32)
+    torch.onnx.export(
+        _VisionTower(model),
+        (dummy_pixels,),
+        onnx_path(out_dir, "vision"),
+        input_names=["pixel_values"],
+        output_names=["image_embeds"],
+        dynamic_axes={"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}},
+        opset_version=opset,
+    )
+    print(f"[ONNX] Vision tower -> {onnx_path(out_dir, 'vision')}")
+
+    dummy_ids = torch.ones(1, 8, dtype=torch.int64)
+    dummy_mask = torch.ones(1, 8, dtype=torch.int64)
+    torch.onnx.export(
+        _TextTower(model),
+        (dummy_ids, dummy_mask),
+        onnx_path(out_dir, "text"),
+        input_names=["input_ids", "attention_mask"],
+        output_names=["text_embeds"],
+        dynamic_axes={
+            "input_ids": {0: "batch", 1: "sequence"},
+            "attention_mask": {0: "batch", 1: "sequence"},
+            "text_embeds": {0: "batch"},
+        },
+        opset_version=opset,
+    )
+    print(f"[ONNX] Text tower -> {onnx_path(out_dir, 'text')}")
+
+
+def quantize_towers(out_dir: str):
+    """Writes dynamic int8 (weight-only) quantized copies of both towers."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    for tower in ("vision", "text"):
+        quantize_dynamic(
+            onnx_path(out_dir, tower),
+            onnx_path(out_dir, tower, quantized=True),
+            weight_type=QuantType.QInt8,
+        )
+        print(f"[ONNX] Quantized {tower} tower -> {onnx_path(out_dir, tower, quantized=True)}")
+
+
+def sample_images(image_dir: str, limit: int = 16):
+    if not image_dir or not os.path.isdir(image_dir):
+        return []
+    names = sorted(
+        n for n in os.listdir(image_dir)
+        if n.lower().endswith((".jpg", ".jpeg", ".png"))
+    )
+    return [os.path.join(image_dir, n) for n in names[:limit]]
+
+
+def check_parity(out_dir: str, quantized: bool, image_dir: str):
+    """Prints cosine drift of the ONNX backend against the torch backend."""
+    from app.services.embedding_service import CLIPEmbedder
+
+    settings.ONNX_MODEL_DIR = out_dir
+    settings.ONNX_QUANTIZE = quantized
+
+    reference = CLIPEmbedder(device="cpu", backend="torch", towers="both")
+    candidate = CLIPEmbedder(device="cpu", backend="onnx", towers="both")
+
+    report = parity_report(reference, candidate, PARITY_TEXTS, sample_images(image_dir))
+    label = "int8" if quantized else "fp32"
+    for tower, stats in report.items():
+        print(
+            f"[ONNX PARITY] {label} {tower}: n={stats['count']} "
+            f"mean_cos={stats['mean_cosine']:.5f} min_cos={stats['min_cosine']:.5f}"
+        )
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export CLIP towers to ONNX")
+    parser.add_argument("--out", default=settings.ONNX_MODEL_DIR)
+    parser.add_argument("--quantize", action="store_true", help="also write int8 models")
+    parser.add_argument("--images", default=settings.IMAGE_DIR, help="sample images for parity")
+    parser.add_argument("--skip-parity", action="store_true")
+    args = parser.parse_args()
+
+    export_towers(args.out)
+    if args.quantize:
+        quantize_towers(args.out)
+
+    if not args.skip_parity:
+        check_parity(args.out, False, args.images)
+        if args.quantize:
+            check_parity(args.out, True, args.images)
+
+
+if __name__ == "__main__":
+    main()
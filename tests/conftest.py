@@ -58,3 +58,15 @@ def patch_paths(tmp_path_factory):
     
     settings.FAISS_INDEX_DIR = original_faiss
     settings.IMAGE_DIR = original_images
+
+
+@pytest.fixture
+def faiss_settings(monkeypatch, tmp_path):
+    """
+    FAISS settings for one test: its own index directory, a flat
+    32-dimension index. Returns monkeypatch for further overrides.
+    """
+    monkeypatch.setattr(settings, "FAISS_INDEX_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "FAISS_DIM", 32)
+    monkeypatch.setattr(settings, "FAISS_INDEX_TYPE", "flat")
+    return monkeypatch
@@ -0,0 +1,8 @@
+import numpy as np
+
+
+def unit_vectors(n, dim, seed=0):
+    """n random L2-normalized float32 vectors of `dim` dimensions."""
+    rng = np.random.default_rng(seed)
+    x = rng.standard_normal((n, dim)).astype("float32")
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
@@ -0,0 +1,105 @@
+import sys
+import types
+
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.services.clip_backends import ALL_TOWERS, OnnxCLIPBackend, create_backend, onnx_path, parse_towers
+
+
+@pytest.mark.parametrize("value, towers", [
+    ("both", ALL_TOWERS),
+    ("ALL", ALL_TOWERS),
+    (None, ALL_TOWERS),
+    ("text", {"text"}),
+    (" vision ", {"vision"}),
+    ("vision,text", ALL_TOWERS),
+])
+def test_parse_towers(value, towers):
+    assert parse_towers(value) == towers
+
+
+@pytest.mark.parametrize("value", ["audio", "text,audio", ","])
+def test_parse_towers_rejects_unknown_towers(value):
+    with pytest.raises(ValueError, match="Invalid CLIP_TOWERS"):
+        parse_towers(value)
+
+
+@pytest.fixture
+def fake_ort(monkeypatch):
+    """Stand-in onnxruntime module recording the sessions it opens."""
+    sessions = []
+
+    class InferenceSession:
+        def __init__(self, path, opts, providers):
+            self.path = path
+            sessions.append(path)
+
+        def run(self, outputs, feeds):
+            batch = len(next(iter(feeds.values())))
+            return [np.full((batch, 4), 2.0, dtype="float64")]
+
+    ort = types.SimpleNamespace(
+        SessionOptions=lambda: types.SimpleNamespace(),
+        GraphOptimizationLevel=types.SimpleNamespace(ORT_ENABLE_ALL=99),
+        InferenceSession=InferenceSession,
+    )
+    monkeypatch.setitem(sys.modules, "onnxruntime", ort)
+    return sessions
+
+
+def _export(onnx_dir, quantized):
+    for tower in ("vision", "text"):
+        path = onnx_path(str(onnx_dir), tower, quantized)
+        with open(path, "wb") as f:
+            f.write(b"onnx")
+
+
+@pytest.mark.parametrize("quantized, variant, suffix", [
+    (False, "onnx", ".onnx"),
+    (True, "onnx-int8", ".int8.onnx"),
+])
+def test_onnx_variant_selects_model_files(tmp_path, fake_ort, quantized, variant, suffix):
+    _export(tmp_path, quantized=False)
+    _export(tmp_path, quantized=True)
+
+    backend = OnnxCLIPBackend(str(tmp_path), quantized=quantized)
+
+    assert backend.variant == variant
+    assert sorted(fake_ort) == [str(tmp_path / f"text{suffix}"), str(tmp_path / f"vision{suffix}")]
+    features = backend.image_features(np.zeros((3, 3, 224, 224), dtype="float32"))
+    assert features.shape == (3, 4) and features.dtype == np.float32
+
+
+def test_onnx_loads_only_configured_towers(tmp_path, fake_ort):
+    _export(tmp_path, quantized=True)
+
+    backend = OnnxCLIPBackend(str(tmp_path), quantized=True, towers={"text"})
+
+    assert backend.vision is None
+    assert fake_ort == [str(tmp_path / "text.int8.onnx")]
+
+
+def test_onnx_missing_int8_export_is_an_error(tmp_path, fake_ort):
+    _export(tmp_path, quantized=False)
+
+    with pytest.raises(RuntimeError, match="ONNX model missing"):
+        OnnxCLIPBackend(str(tmp_path), quantized=True)
+
+
+def test_onnx_backend_needs_onnxruntime(tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, "onnxruntime", None)
+
+    with pytest.raises(RuntimeError, match="onnxruntime"):
+        OnnxCLIPBackend(str(tmp_path))
+
+
+def test_create_backend_reads_onnx_settings(tmp_path, fake_ort, monkeypatch):
+    _export(tmp_path, quantized=True)
+    monkeypatch.setattr(settings, "ONNX_MODEL_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "ONNX_QUANTIZE", True)
+
+    assert create_backend("ONNX", "cpu").variant == "onnx-int8"
+    with pytest.raises(ValueError, match="Unknown EMBEDDING_BACKEND"):
+        create_backend("tensorrt", "cpu")
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.services.dedupe import find_batch_duplicates, find_near_duplicates, near_duplicate_report
+from app.services.faiss_manager import FaissManager
+from tests.helpers import unit_vectors
+
+
+def _near(v, seed):
+    noisy = v + 0.01 * unit_vectors(1, len(v), seed)[0]
+    return (noisy / np.linalg.norm(noisy)).astype("float32")
+
+
+@pytest.fixture
+def catalog(faiss_settings):
+    faiss_settings.setattr(settings, "FAISS_DIM", 64)
+    faiss_settings.setattr(settings, "DEDUPE_THRESHOLD", 0.95)
+
+    x = unit_vectors(200, settings.FAISS_DIM)
+    ids = list(range(200)) + [500, 501, 600]
+    vectors = np.vstack([x, _near(x[3], 1), _near(x[3], 2), _near(x[10], 3)])
+
+    mgr = FaissManager(name="test_dedupe")
+    mgr.rebuild(list(vectors), ids)
+    return mgr, x
+
+
+def test_find_near_duplicates_flags_copies(catalog):
+    mgr, x = catalog
+
+    hits = find_near_duplicates(mgr, np.stack([x[3], x[50]]), [3, 50])
+    assert sorted(fid for fid, _ in hits[0]) == [500, 501]
+    assert all(score >= 0.95 for _, score in hits[0])
+    assert hits[1] == []
+
+
+def test_find_batch_duplicates_points_at_earliest_id():
+    x = unit_vectors(5, 64)
+    vectors = np.stack([_near(x[0], 1), x[1], x[0], _near(x[0], 2), x[2]])
+    ids = [30, 11, 20, 40, 12]
+
+    found = find_batch_duplicates(vectors, ids, threshold=0.95)
+
+    assert sorted(found) == [30, 40]
+    assert found[30][0] == 20 and found[40][0] == 20
+    assert found[30][1] >= 0.95
+    assert find_batch_duplicates(vectors[:1], ids[:1], threshold=0.95) == {}
+
+
+def test_near_duplicate_report_streams_clusters(catalog):
+    mgr, _ = catalog
+
+    events = list(near_duplicate_report(mgr, batch_size=64))
+    pairs = {(e["a"], e["b"]) for e in events if e["type"] == "pair"}
+    clusters = [e["product_ids"] for e in events if e["type"] == "cluster"]
+
+    assert pairs == {(3, 500), (3, 501), (500, 501), (10, 600)}
+    assert clusters == [[3, 500, 501], [10, 600]]
+    assert sum(e["type"] == "progress" for e in events) == 4
+    assert events[-1] == {"type": "done", "scanned": 203, "pairs": 4, "clusters": 2}
@@ -0,0 +1,98 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+from transformers import CLIPImageProcessor
+
+from app.services import embedding_cache
+from app.services.image_preprocess import config_from_processor, preprocess_image
+
+
+CONFIG = config_from_processor(CLIPImageProcessor(), max_pixels=100_000)
+
+
+def _png(color, size=(64, 64)):
+    buf = io.BytesIO()
+    Image.new("RGB", size, color).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+class StubEmbedder:
+    """Decodes for real; the 'forward pass' is the mean pixel per channel."""
+
+    model_id = "stub:abc:torch"
+
+    def __init__(self, vision=True):
+        self.vision = vision
+        self.batches = []
+
+    def embed_image(self, blob):
+        return self.embed_images([blob])[0]
+
+    def embed_images(self, blobs):
+        if not self.vision:
+            raise RuntimeError("CLIP vision tower is not loaded on this worker")
+        self.batches.append(len(blobs))
+        pixels = [preprocess_image(b, CONFIG) for b in blobs]
+        return [p.mean(axis=(1, 2)).astype("float32") for p in pixels]
+
+
+@pytest.fixture
+def store(monkeypatch):
+    """In-memory stand-in for the embedding_cache table."""
+    rows = {}
+
+    def get_cached(hashes, model_id):
+        return {h: rows[(h, model_id)] for h in hashes if (h, model_id) in rows}
+
+    def put(vectors, model_id):
+        for h, v in vectors.items():
+            rows.setdefault((h, model_id), v)
+
+    monkeypatch.setattr(embedding_cache, "get_cached_embeddings", get_cached)
+    monkeypatch.setattr(embedding_cache, "store_embeddings", put)
+    return rows
+
+
+def test_misses_are_embedded_once_and_stored(store):
+    embedder = StubEmbedder()
+    red, blue = _png("red"), _png("blue")
+
+    out = embedding_cache.embed_images_cached(embedder, [red, blue, red])
+
+    assert embedder.batches == [2]
+    assert len(store) == 2
+    np.testing.assert_array_equal(out[0], out[2])
+    assert not np.array_equal(out[0], out[1])
+
+
+def test_hits_skip_inference(store):
+    embedder = StubEmbedder()
+    red = _png("red")
+    first = embedding_cache.embed_images_cached(embedder, [red])
+
+    again = embedding_cache.embed_images_cached(embedder, [red])
+
+    assert embedder.batches == [1]
+    np.testing.assert_array_equal(first[0], again[0])
+
+
+def test_undecodable_and_oversized_images_are_none(store):
+    embedder = StubEmbedder()
+    red = _png("red")
+
+    out = embedding_cache.embed_images_cached(
+        embedder, [b"not an image", red, _png("green", size=(600, 600))]
+    )
+
+    assert out[0] is None
+    assert out[1] is not None
+    assert out[2] is None
+    assert len(store) == 1
+
+
+def test_backend_errors_propagate(store):
+    with pytest.raises(RuntimeError, match="vision tower"):
+        embedding_cache.embed_images_cached(StubEmbedder(vision=False), [_png("red")])
+    assert store == {}
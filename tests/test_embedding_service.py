@@ -0,0 +1,166 @@
+import io
+
+import huggingface_hub
+import numpy as np
+import pytest
+from PIL import Image
+from transformers import CLIPImageProcessor
+
+from app.core.config import settings
+from app.services import embedding_service
+from app.services.embedding_service import CLIPEmbedder, checkpoint_dir, checkpoint_fingerprint
+
+
+def _checkpoint(path, weights=b"w" * 4096):
+    path.mkdir(parents=True, exist_ok=True)
+    (path / "config.json").write_text('{"projection_dim": 512}')
+    (path / "model.safetensors").write_bytes(weights)
+    return path
+
+
+def test_fingerprint_of_local_checkpoint_follows_weights(tmp_path):
+    checkpoint_fingerprint.cache_clear()
+    first = checkpoint_fingerprint(str(_checkpoint(tmp_path / "a")))
+    same = checkpoint_fingerprint(str(_checkpoint(tmp_path / "b")))
+    retrained = checkpoint_fingerprint(str(_checkpoint(tmp_path / "c", weights=b"v" * 4096)))
+
+    assert first == same
+    assert retrained != first
+
+
+def test_fingerprint_of_cached_hub_id(tmp_path, monkeypatch):
+    snapshot = _checkpoint(tmp_path / "snapshots" / "abc123")
+    calls = []
+
+    def snapshot_download(repo_id, local_files_only=False):
+        calls.append((repo_id, local_files_only))
+        return str(snapshot)
+
+    monkeypatch.setattr(huggingface_hub, "snapshot_download", snapshot_download)
+    checkpoint_fingerprint.cache_clear()
+
+    assert checkpoint_dir("openai/clip-vit-base-patch32") == str(snapshot)
+    assert checkpoint_fingerprint("openai/clip-vit-base-patch32") == checkpoint_fingerprint(str(snapshot))
+    assert calls[0] == ("openai/clip-vit-base-patch32", True)  # never downloads
+
+
+def test_fingerprint_of_uncached_hub_id(monkeypatch):
+    def snapshot_download(repo_id, local_files_only=False):
+        raise huggingface_hub.errors.LocalEntryNotFoundError("not cached")
+
+    monkeypatch.setattr(huggingface_hub, "snapshot_download", snapshot_download)
+    checkpoint_fingerprint.cache_clear()
+
+    assert checkpoint_dir("openai/clip-vit-base-patch32") is None
+    fingerprint = checkpoint_fingerprint("openai/clip-vit-base-patch32")
+    assert len(fingerprint) == 16
+    assert fingerprint != checkpoint_fingerprint("openai/clip-vit-large-patch14")
+
+
+# -------------------------------------------------------
+# EMBEDDING WITH A STUB BACKEND
+# -------------------------------------------------------
+DIM = 8
+
+
+class StubBackend:
+    """Features are simple functions of the inputs; records every batch."""
+
+    variant = "stub"
+
+    def __init__(self, towers):
+        self.towers = towers
+        self.image_batches = []
+        self.text_batches = []
+
+    def image_features(self, pixel_values):
+        self.image_batches.append(len(pixel_values))
+        means = pixel_values.mean(axis=(2, 3))
+        return np.hstack([means, np.ones((len(means), DIM - 3))]).astype("float32")
+
+    def text_features(self, input_ids, attention_mask):
+        self.text_batches.append(input_ids.shape)
+        ids = (input_ids * attention_mask).astype("float32")
+        stats = [ids.sum(axis=1), attention_mask.sum(axis=1), (ids ** 2).sum(axis=1) / 100, ids[:, 0]]
+        return np.hstack([np.stack(stats, axis=1), np.ones((len(ids), DIM - 4))]).astype("float32")
+
+
+class StubTokenizer:
+    """One token per character, padded to the longest text of the call."""
+
+    @classmethod
+    def from_pretrained(cls, path):
+        return cls()
+
+    def __call__(self, texts, return_tensors, padding, truncation, max_length):
+        rows = [[ord(c) for c in t][:max_length] for t in texts]
+        width = max(len(r) for r in rows)
+        ids = np.array([r + [0] * (width - len(r)) for r in rows], dtype="int64")
+        mask = np.array([[1] * len(r) + [0] * (width - len(r)) for r in rows], dtype="int64")
+        return {"input_ids": ids, "attention_mask": mask}
+
+
+@pytest.fixture
+def make_embedder(monkeypatch):
+    monkeypatch.setattr(settings, "FAISS_DIM", DIM)
+    monkeypatch.setattr(settings, "PREPROCESS_WORKERS", 0)
+    monkeypatch.setattr(embedding_service, "CLIPTokenizerFast", StubTokenizer)
+    monkeypatch.setattr(
+        embedding_service.CLIPImageProcessor, "from_pretrained", classmethod(lambda cls, path: CLIPImageProcessor())
+    )
+    monkeypatch.setattr(embedding_service, "create_backend", lambda name, device, towers: StubBackend(towers))
+    return lambda towers="both": CLIPEmbedder(device="cpu", backend="stub", towers=towers)
+
+
+def _png(color):
+    buf = io.BytesIO()
+    Image.new("RGB", (40, 30), color).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def test_embed_images_keeps_input_order_across_batches(make_embedder):
+    embedder = make_embedder()
+    images = [_png(c) for c in ("red", "green", "blue", "white", "black")]
+
+    out = embedder.embed_images(images, batch_size=2)
+
+    assert out.shape == (5, DIM)
+    assert embedder.backend.image_batches == [2, 2, 1]
+    for img, row in zip(images, out):
+        np.testing.assert_allclose(row, embedder.embed_image(img), rtol=1e-6)
+    np.testing.assert_allclose(np.linalg.norm(out, axis=1), 1.0, rtol=1e-6)
+    assert len({row.tobytes() for row in out}) == 5
+
+
+def test_embed_texts_ignores_padding_across_batches(make_embedder):
+    embedder = make_embedder()
+    texts = ["red", "a much longer product title", "bag", "shoes"]
+
+    out = embedder.embed_texts(texts, batch_size=2)
+
+    # each batch is padded to its own longest text
+    assert embedder.backend.text_batches == [(2, len(texts[1])), (2, 5)]
+    for text, row in zip(texts, out):
+        np.testing.assert_allclose(row, embedder.embed_texts([text])[0], rtol=1e-6)
+    np.testing.assert_allclose(np.linalg.norm(out, axis=1), 1.0, rtol=1e-6)
+
+
+def test_text_only_worker_refuses_images(make_embedder):
+    embedder = make_embedder("text")
+
+    assert embedder.preprocessor is None
+    assert embedder.backend.towers == {"text"}
+    with pytest.raises(RuntimeError, match="vision tower is not loaded"):
+        embedder.embed_images([_png("red")])
+    with pytest.raises(RuntimeError, match="vision tower is not loaded"):
+        embedder.preprocess_async(_png("red"))
+    assert embedder.embed_texts(["red shoes"]).shape == (1, DIM)
+
+
+def test_vision_only_worker_refuses_texts(make_embedder):
+    embedder = make_embedder("vision")
+
+    assert embedder.tokenizer is None
+    with pytest.raises(RuntimeError, match="text tower is not loaded"):
+        embedder.embed_texts(["red shoes"])
+    assert embedder.embed_images([_png("red")]).shape == (1, DIM)
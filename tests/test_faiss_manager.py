@@ -0,0 +1,399 @@
+import os
+
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.services.faiss_manager import FaissManager, compression_report, index_kind
+from tests.helpers import unit_vectors
+
+
+@pytest.fixture
+def index_settings(faiss_settings):
+    faiss_settings.setattr(settings, "FAISS_DIM", 64)
+    faiss_settings.setattr(settings, "FAISS_NLIST", 8)
+    faiss_settings.setattr(settings, "FAISS_PQ_M", 8)
+    faiss_settings.setattr(settings, "FAISS_HNSW_M", 16)
+    faiss_settings.setattr(settings, "FAISS_NPROBE", 8)
+    return faiss_settings
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf_flat", "ivf_pq", "hnsw"])
+def test_index_types_round_trip(index_settings, index_type):
+    index_settings.setattr(settings, "FAISS_INDEX_TYPE", index_type)
+    x = unit_vectors(1000, settings.FAISS_DIM)
+    ids = list(range(1, 1001))
+
+    mgr = FaissManager(name=f"test_{index_type}")
+    mgr.rebuild(list(x), ids)
+    mgr.remove_vector(5)
+    mgr.flush()
+
+    found, _ = mgr.search(x[19], 1)
+    assert found == [20]
+
+    # the trained type survives save + load
+    reloaded = FaissManager(name=f"test_{index_type}")
+    assert index_kind(reloaded.index) == index_type
+    assert 5 not in reloaded.ids()
+    assert reloaded.ntotal == 999
+
+
+def test_small_catalogs_fall_back_to_flat(index_settings):
+    index_settings.setattr(settings, "FAISS_INDEX_TYPE", "ivf_pq")
+    x = unit_vectors(10, settings.FAISS_DIM)
+
+    mgr = FaissManager(name="test_small")
+    mgr.rebuild(list(x), list(range(10)))
+
+    assert index_kind(mgr.index) == "flat"
+
+
+@pytest.mark.parametrize("index_type", ["sq8", "fp16", "pq", "ivf_sq8"])
+def test_compressed_types_rescore_exactly(index_settings, index_type):
+    index_settings.setattr(settings, "FAISS_INDEX_TYPE", index_type)
+    index_settings.setattr(settings, "FAISS_RERANK_FACTOR", 4)
+    x = unit_vectors(1000, settings.FAISS_DIM)
+    ids = list(range(1000))
+    by_id = dict(zip(ids, x))
+
+    mgr = FaissManager(name=f"test_{index_type}", vector_loader=lambda ids_: {i: by_id[i] for i in ids_})
+    mgr.rebuild(list(x), ids)
+    assert index_kind(mgr.index) == index_type
+
+    found, scores = mgr.search(x[42], 5)
+    assert found[0] == 42
+    assert scores[0] == pytest.approx(1.0, abs=1e-5)  # exact, not the quantized score
+    assert scores == sorted(scores, reverse=True)
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf_flat", "hnsw", "sq8"])
+def test_range_search_returns_hits_above_threshold(index_settings, index_type):
+    index_settings.setattr(settings, "FAISS_INDEX_TYPE", index_type)
+    x = unit_vectors(1000, settings.FAISS_DIM)
+    by_id = dict(enumerate(x))
+    mgr = FaissManager(name=f"test_range_{index_type}", vector_loader=lambda ids_: {i: by_id[i] for i in ids_})
+    mgr.rebuild(list(x), list(range(1000)))
+
+    exact = x @ x[3]
+    expected = set(np.flatnonzero(exact >= 0.3).tolist())
+
+    found, scores = mgr.range_search(x[3], 0.3)
+    assert found[0] == 3
+    assert scores == sorted(scores, reverse=True)
+    assert min(scores) >= 0.3 - 1e-5
+    assert set(found) <= expected
+    if index_type == "flat":
+        assert set(found) == expected
+
+    capped, _ = mgr.range_search(x[3], 0.3, max_results=2)
+    assert capped == found[:2]
+    assert mgr.range_search(x[3], 0.99)[0] == [3]
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf_flat", "hnsw", "sq8"])
+def test_vector_of_stored_id(index_settings, index_type):
+    index_settings.setattr(settings, "FAISS_INDEX_TYPE", index_type)
+    x = unit_vectors(500, settings.FAISS_DIM)
+    loaded = []
+
+    def loader(ids_):
+        loaded.extend(ids_)
+        return {i: x[i] for i in ids_ if i < 500}
+
+    mgr = FaissManager(name=f"test_vector_{index_type}", vector_loader=loader)
+    mgr.rebuild(list(x), list(range(500)))
+
+    assert np.allclose(mgr.vector(17), x[17], atol=1e-6)
+    # exact-storage indexes reconstruct; compressed ones read the exact vector instead
+    assert loaded == ([17] if index_type == "sq8" else [])
+    assert mgr.vector(900) is None
+
+
+def test_compression_report(index_settings):
+    x = unit_vectors(2000, settings.FAISS_DIM)
+    report = compression_report(x, list(range(2000)), ("flat", "sq8", "pq"), k=5, n_queries=50)
+
+    by_type = {row["type"]: row for row in report}
+    assert by_type["flat"]["recall@5"] == 1.0
+    assert by_type["sq8"]["memory_ratio"] < 0.3
+    assert by_type["pq"]["memory_ratio"] < by_type["sq8"]["memory_ratio"]
+    assert by_type["pq"]["recall@5_rescored"] >= by_type["pq"]["recall@5"]
+
+
+def test_write_behind_coalesces_saves(index_settings):
+    index_settings.setattr(settings, "FAISS_FLUSH_INTERVAL", 3600)
+    index_settings.setattr(settings, "FAISS_FLUSH_THRESHOLD", 100)
+    x = unit_vectors(150, settings.FAISS_DIM)
+
+    mgr = FaissManager(name="test_write_behind")
+    mgr.add_vectors(x[:50], list(range(50)))
+    mgr.remove_vectors([0, 1])
+    assert FaissManager(name="test_write_behind").ntotal == 0  # not saved yet
+
+    mgr.add_vectors(x[50:], list(range(50, 150)))  # crosses the dirty threshold
+    assert FaissManager(name="test_write_behind").ntotal == 148
+
+    mgr.remove_vector(2)
+    mgr.close()
+    assert FaissManager(name="test_write_behind").ntotal == 147
+
+
+def test_corrupt_index_is_quarantined(index_settings, tmp_path):
+    x = unit_vectors(20, settings.FAISS_DIM)
+
+    mgr = FaissManager(name="test_corrupt")
+    mgr.rebuild(list(x), list(range(20)))
+    assert not (tmp_path / "test_corrupt.faiss.tmp").exists()
+
+    with open(mgr.index_path, "r+b") as f:
+        f.seek(-8, 2)
+        f.write(b"\xff" * 8)
+
+    reloaded = FaissManager(name="test_corrupt")
+    assert reloaded.index.ntotal == 0
+    assert list(tmp_path.glob("test_corrupt.faiss.corrupt-*"))
+
+
+def test_crash_between_sidecar_and_index_renames(index_settings, tmp_path, monkeypatch):
+    x = unit_vectors(40, settings.FAISS_DIM)
+    mgr = FaissManager(name="test_torn_save")
+    mgr.rebuild(list(x[:20]), list(range(20)))
+
+    real_replace = os.replace
+    renamed = []
+
+    def crash_on_second_rename(src, dst):
+        if dst in (mgr.index_path, mgr.meta_path):
+            renamed.append(dst)
+            if len(renamed) == 2:
+                raise KeyboardInterrupt("crash")
+        real_replace(src, dst)
+
+    monkeypatch.setattr(os, "replace", crash_on_second_rename)
+    with pytest.raises(KeyboardInterrupt):
+        mgr.rebuild(list(x), list(range(40)))
+    monkeypatch.setattr(os, "replace", real_replace)
+
+    # one file of the pair is new, the other old: the saved index still loads
+    reloaded = FaissManager(name="test_torn_save")
+    assert not list(tmp_path.glob("test_torn_save.faiss.corrupt-*"))
+    assert sorted(reloaded.ids().tolist()) in (list(range(20)), list(range(40)))
+
+    # the next save completes normally
+    reloaded.rebuild(list(x), list(range(40)))
+    assert sorted(FaissManager(name="test_torn_save").ids().tolist()) == list(range(40))
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf_flat", "hnsw"])
+def test_mmap_load_then_mutate(index_settings, index_type):
+    index_settings.setattr(settings, "FAISS_INDEX_TYPE", index_type)
+    index_settings.setattr(settings, "FAISS_MMAP", True)
+    x = unit_vectors(500, settings.FAISS_DIM)
+
+    FaissManager(name=f"test_mmap_{index_type}").rebuild(list(x), list(range(500)))
+
+    mgr = FaissManager(name=f"test_mmap_{index_type}")
+    assert mgr.stats()["mmapped"]
+    assert mgr.search(x[7], 1)[0] == [7]
+
+    # writes go to the delta; the mapped base is only copied by a fold
+    mgr.remove_vector(7)
+    mgr.add_vector(x[7], 1000)
+    assert mgr.stats()["mmapped"]
+    assert mgr.search(x[7], 1)[0] == [1000]
+
+    mgr.fold()
+    assert not mgr.stats()["mmapped"]
+    assert mgr.stats()["delta"] == 0
+    assert mgr.search(x[7], 1)[0] == [1000]
+
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw"])
+def test_shared_workers_see_each_others_writes(index_settings, index_type):
+    index_settings.setattr(settings, "FAISS_INDEX_TYPE", index_type)
+    index_settings.setattr(settings, "FAISS_SHARED", True)
+    index_settings.setattr(settings, "FAISS_SHARED_CHECK_INTERVAL", 0)
+    x = unit_vectors(300, settings.FAISS_DIM)
+
+    # two managers on one file stand in for two uvicorn workers
+    worker_a = FaissManager(name="test_shared")
+    worker_a.rebuild(list(x[:200]), list(range(200)))
+    worker_b = FaissManager(name="test_shared")
+    assert worker_b.stats()["mmapped"] and worker_b.ntotal == 200
+
+    # a write in one worker is published and mapped by the other
+    worker_a.add_vector(x[250], 250)
+    assert worker_a.stats()["mmapped"]
+    assert worker_b.search(x[250], 1)[0] == [250]
+
+    # b writes on top of a's publish without having searched since
+    worker_a.remove_vector(3)
+    worker_b.add_vector(x[260], 260)
+    ids = set(worker_a.ids().tolist())
+    assert 260 in ids and 250 in ids and 3 not in ids
+    assert set(worker_b.ids().tolist()) == ids
+
+
+def test_incremental_backup_and_restore(index_settings, tmp_path):
+    x = unit_vectors(120, settings.FAISS_DIM)
+
+    mgr = FaissManager(name="test_backup")
+    mgr.rebuild(list(x[:100]), list(range(100)))
+    first = mgr.backup_index()
+    assert first["log_records"] == 0
+
+    mgr.add_vectors(x[100:105], list(range(100, 105)))
+    mgr.remove_vectors([1, 2])
+    expected = set(mgr.ids().tolist())
+
+    # not due yet: the same base, with the changes in its log
+    second = mgr.backup_index()
+    assert second["base"] == first["base"] and second["log_records"] == 2
+
+    # a crash mid-append leaves a torn record; the restarted manager cuts it off
+    log = tmp_path / "backups" / "test_backup" / first["base"].replace(".faiss", ".log")
+    with open(log, "ab") as f:
+        f.write(b"A\x05\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x01")
+    restarted = FaissManager(name="test_backup")
+    restarted.remove_vectors(list(range(50)))
+    expected -= set(range(50))
+    restarted.rebuild([], [])  # lose the live index (rebuild starts a new base)
+
+    result = restarted.restore_backup(first["base"])
+    assert result["replayed"] == 3
+    assert set(restarted.ids().tolist()) == expected
+    assert set(FaissManager(name="test_backup").ids().tolist()) == expected
+
+
+def test_backup_retention(index_settings):
+    index_settings.setattr(settings, "FAISS_FLUSH_INTERVAL", 0)
+    index_settings.setattr(settings, "FAISS_BACKUP_LOG_RATIO", 0)
+    index_settings.setattr(settings, "FAISS_BACKUP_KEEP", 2)
+    x = unit_vectors(10, settings.FAISS_DIM)
+
+    mgr = FaissManager(name="test_retention")
+    mgr.rebuild(list(x[:5]), list(range(5)))
+    mgr.backup_index()
+    for i in range(5, 10):
+        mgr.add_vector(x[i], i)  # every save rolls a new base
+
+    assert len(mgr.list_backups()) == 2
+    assert mgr.list_backups()[0]["log_records"] == 0
+
+
+def test_writers_swap_new_generations(index_settings):
+    x = unit_vectors(400, settings.FAISS_DIM)
+    mgr = FaissManager(name="test_snapshot")
+    mgr.rebuild(list(x[:200]), list(range(200)))
+
+    snapshot = mgr.snapshot
+    mgr.add_vectors(x[200:], list(range(200, 400)))
+    mgr.remove_vector(0)
+
+    assert snapshot.ntotal == 200  # published generations are never mutated
+    assert mgr.index is snapshot.base  # and mutations don't copy the base
+    assert mgr.ntotal == 399
+    assert mgr.stats()["generation"] == 3
+
+
+def test_delta_persists_and_folds_at_threshold(index_settings, tmp_path):
+    index_settings.setattr(settings, "FAISS_FLUSH_INTERVAL", 0)
+    index_settings.setattr(settings, "FAISS_DELTA_MAX", 20)
+    x = unit_vectors(300, settings.FAISS_DIM)
+
+    mgr = FaissManager(name="test_delta")
+    mgr.rebuild(list(x[:200]), list(range(200)))
+    base_saved = (tmp_path / "test_delta.faiss").stat().st_mtime_ns
+
+    mgr.add_vectors(x[200:210], list(range(200, 210)))
+    mgr.add_vector(-x[5], 5)  # update: base entry tombstoned, new vector in the delta
+    mgr.remove_vector(6)
+    assert (tmp_path / "test_delta.faiss").stat().st_mtime_ns == base_saved
+
+    reloaded = FaissManager(name="test_delta")
+    assert reloaded.stats()["delta"] == 11 and reloaded.stats()["tombstones"] == 2
+    assert reloaded.ntotal == 209
+    assert reloaded.search(-x[5], 1)[0] == [5]
+    assert reloaded.search(x[5], 3)[0][0] != 5
+    assert 6 not in reloaded.search(x[6], 5)[0]
+    assert np.allclose(reloaded.vector(5), -x[5])
+
+    mgr.add_vectors(x[210:220], list(range(210, 220)))  # 23 entries: folded on save
+    assert mgr.stats()["delta"] == 0 and mgr.stats()["tombstones"] == 0
+    assert (tmp_path / "test_delta.faiss").stat().st_mtime_ns != base_saved
+    reloaded = FaissManager(name="test_delta")
+    assert sorted(reloaded.ids().tolist()) == sorted(set(range(220)) - {6})
+    assert reloaded.search(-x[5], 1)[0] == [5]
+
+
+def test_search_during_rebuilds(index_settings):
+    import threading
+
+    index_settings.setattr(settings, "FAISS_FLUSH_INTERVAL", 3600)
+    x = unit_vectors(300, settings.FAISS_DIM)
+    mgr = FaissManager(name="test_concurrent")
+    mgr.rebuild(list(x), list(range(300)))
+
+    errors = []
+    stop = threading.Event()
+
+    def reader():
+        while not stop.is_set():
+            try:
+                ids, _ = mgr.search(x[10], 1)
+                assert ids == [10]
+            except Exception as e:
+                errors.append(e)
+
+    readers = [threading.Thread(target=reader) for _ in range(4)]
+    for t in readers:
+        t.start()
+    for i in range(20):
+        mgr.rebuild(list(x), list(range(300)))
+        mgr.add_vector(x[299 - i], 299 - i)
+    stop.set()
+    for t in readers:
+        t.join()
+
+    assert errors == []
+
+
+def test_search_batch_matches_single_searches(index_settings):
+    x = unit_vectors(300, settings.FAISS_DIM)
+    mgr = FaissManager(name="test_search_batch")
+    mgr.rebuild(list(x), list(range(300)))
+
+    batched = mgr.search_batch(x[:10], 3)
+
+    assert [ids for ids, _ in batched] == [mgr.search(q, 3)[0] for q in x[:10]]
+
+
+def test_hnsw_keeps_tombstones_until_compaction(index_settings):
+    index_settings.setattr(settings, "FAISS_INDEX_TYPE", "hnsw")
+    index_settings.setattr(settings, "FAISS_FLUSH_INTERVAL", 0)
+    index_settings.setattr(settings, "FAISS_DELTA_MAX", 10)
+    index_settings.setattr(settings, "FAISS_TOMBSTONE_MAX_FRACTION", 0.1)
+    x = unit_vectors(600, settings.FAISS_DIM)
+
+    mgr = FaissManager(name="test_hnsw_tombstones")
+    mgr.rebuild(list(x[:500]), list(range(500)))
+
+    # removals and a re-approval: tombstoned, the graph is not rebuilt on fold
+    mgr.remove_vectors(list(range(20)))
+    mgr.add_vector(-x[30], 30)
+    mgr.add_vectors(x[500:510], list(range(500, 510)))  # folds the new ids in
+    assert mgr.index.ntotal == 510
+    assert mgr.stats()["tombstones"] == 21 and mgr.stats()["delta"] == 1
+    assert mgr.search(x[3], 1)[0] != [3]
+    assert mgr.search(-x[30], 1)[0] == [30]
+    assert mgr.search(x[505], 1)[0] == [505]
+
+    # past 10% tombstoned the graph is rebuilt from the live vectors
+    mgr.remove_vectors(list(range(40, 80)))
+    assert mgr.index.ntotal == 510 - 61 + 1
+    assert mgr.stats()["tombstones"] == 0 and mgr.stats()["delta"] == 0
+    assert mgr.search(-x[30], 1)[0] == [30]
+    assert sorted(FaissManager(name="test_hnsw_tombstones").ids().tolist()) == sorted(
+        set(range(510)) - set(range(20)) - set(range(40, 80))
+    )
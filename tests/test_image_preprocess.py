@@ -0,0 +1,44 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+from transformers import CLIPImageProcessor
+
+from app.services.image_preprocess import config_from_processor, preprocess_image
+
+
+@pytest.fixture(scope="module")
+def processor():
+    return CLIPImageProcessor()
+
+
+@pytest.mark.parametrize("size", [(300, 200), (224, 224), (640, 1280)])
+def test_preprocess_matches_clip_image_processor(processor, size):
+    rng = np.random.default_rng(0)
+    img = Image.fromarray(rng.integers(0, 255, (size[1], size[0], 3), dtype=np.uint8))
+
+    expected = processor(images=[img], return_tensors="np")["pixel_values"][0]
+    actual = preprocess_image(img, config_from_processor(processor, max_pixels=0))
+
+    assert actual.shape == expected.shape
+    assert np.abs(actual - expected).max() < 1e-4
+
+
+def test_preprocess_rejects_oversized_images(processor):
+    buf = io.BytesIO()
+    Image.new("RGB", (600, 600)).save(buf, format="PNG")
+
+    config = config_from_processor(processor, max_pixels=100_000)
+    with pytest.raises(ValueError):
+        preprocess_image(buf.getvalue(), config)
+
+
+def test_max_pixels_applies_before_draft_decoding(processor):
+    buf = io.BytesIO()
+    Image.new("RGB", (1200, 1200)).save(buf, format="JPEG")
+
+    # draft decoding would shrink this to 300x300, under the limit
+    config = config_from_processor(processor, max_pixels=1_000_000, draft=True)
+    with pytest.raises(ValueError, match="too large"):
+        preprocess_image(buf.getvalue(), config)
@@ -0,0 +1,122 @@
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.services import index_reconcile
+from app.services.faiss_manager import FaissManager
+
+T0 = datetime(2025, 1, 1)
+
+
+@pytest.fixture
+def catalog(monkeypatch):
+    """In-memory stand-in for the approved products table."""
+    monkeypatch.setattr(settings, "FAISS_DIM", 16)
+    rng = np.random.default_rng(0)
+    rows = {i: (rng.standard_normal(16).astype("float32"), T0 + timedelta(minutes=i)) for i in range(100)}
+    fetched = []
+
+    def approved_id_state(column="embedding", category=None):
+        approved = {i: ts for i, (_, ts) in rows.items()}
+        return approved, max(approved.values()) if approved else None
+
+    def load_product_vectors(ids, column="embedding"):
+        fetched.append(len(ids))
+        return {i: rows[i][0] for i in ids if i in rows}
+
+    monkeypatch.setattr(index_reconcile, "approved_id_state", approved_id_state)
+    monkeypatch.setattr(index_reconcile, "load_product_vectors", load_product_vectors)
+    return rows, fetched
+
+
+def test_reconcile_applies_only_the_diff(catalog):
+    rows, fetched = catalog
+
+    first = index_reconcile.reconcile_index(FaissManager(name="test_reconcile"))
+    assert first["action"] == "rebuilt"
+
+    # restart with nothing changed
+    assert index_reconcile.reconcile_index(FaissManager(name="test_reconcile"))["action"] == "up_to_date"
+
+    # one product removed, one re-approved with a new vector, one new product
+    del rows[3]
+    rows[5] = (-rows[5][0], T0 + timedelta(days=1))
+    rows[500] = (rows[7][0] * 2, T0 + timedelta(days=1))
+    fetched.clear()
+
+    mgr = FaissManager(name="test_reconcile")
+    result = index_reconcile.reconcile_index(mgr)
+
+    assert result == {"action": "reconciled", "added": 2, "removed": 1, "count": 100}
+    assert fetched == [2]
+    assert sorted(mgr.ids().tolist()) == sorted(rows)
+    assert mgr.search(rows[5][0], 1)[0] == [5]
+
+
+def test_type_change_forces_rebuild(catalog, monkeypatch):
+    index_reconcile.reconcile_index(FaissManager(name="test_reconcile_type"))
+
+    monkeypatch.setattr(settings, "FAISS_INDEX_TYPE", "hnsw")
+    result = index_reconcile.reconcile_index(FaissManager(name="test_reconcile_type"))
+
+    assert result["action"] == "rebuilt"
+    assert "index type changed" in result["reason"]
+
+
+def test_rebuild_keeps_approvals_committed_after_its_read(catalog, monkeypatch):
+    rows, _ = catalog
+    mgr = FaissManager(name="test_rebuild_race")
+    read_state = index_reconcile.approved_id_state
+    approval = {}
+
+    def approved_id_state(column="embedding", category=None):
+        state = read_state(column, category)
+        # a product approved right after the read adds itself to FAISS
+        vec = rows[7][0] * 3
+        approval["thread"] = threading.Thread(target=mgr.add_vector, args=(vec, 900))
+        approval["thread"].start()
+        approval["thread"].join(timeout=0.5)
+        return state
+
+    monkeypatch.setattr(index_reconcile, "approved_id_state", approved_id_state)
+    index_reconcile.rebuild_index(mgr)
+    approval["thread"].join()
+
+    assert 900 in mgr.ids().tolist()
+    assert len(mgr.ids()) == len(rows) + 1
+
+
+def test_backfill_embeds_missing_text_and_indexes_what_was_written(catalog, monkeypatch):
+    missing = [(i, f"title {i}", "desc", "shoes") for i in range(5)]
+    stored = {}
+
+    class TextEmbedder:
+        def __init__(self):
+            self.batches = []
+
+        def embed_texts(self, texts):
+            self.batches.append(texts)
+            rng = np.random.default_rng(len(texts))
+            return rng.standard_normal((len(texts), 16)).astype("float32")
+
+    def store_text_embeddings(rows, vectors):
+        # product 3 was edited between the read and the write
+        written = [fid for fid, *_ in rows if fid != 3]
+        stored.update({fid: vec for (fid, *_), vec in zip(rows, vectors) if fid in written})
+        return written
+
+    monkeypatch.setattr(index_reconcile, "missing_text_rows", lambda: missing)
+    monkeypatch.setattr(index_reconcile, "store_text_embeddings", store_text_embeddings)
+    embedder = TextEmbedder()
+    mgr = FaissManager(name="test_text_backfill")
+
+    result = index_reconcile.backfill_text_embeddings(embedder, mgr, batch_size=2)
+
+    assert result == {"missing": 5, "filled": 4}
+    assert [len(b) for b in embedder.batches] == [2, 2, 1]
+    assert embedder.batches[0] == ["title 0. desc", "title 1. desc"]
+    assert sorted(mgr.ids().tolist()) == [0, 1, 2, 4]
+    assert mgr.search(stored[4], 1)[0] == [4]
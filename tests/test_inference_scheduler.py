@@ -0,0 +1,46 @@
+import threading
+
+import numpy as np
+import pytest
+
+from app.services.inference_scheduler import MicroBatcher
+
+
+def test_micro_batcher_groups_concurrent_requests():
+    batch_sizes = []
+
+    def batch_fn(items):
+        batch_sizes.append(len(items))
+        return np.array([[float(i)] for i in items], dtype="float32")
+
+    batcher = MicroBatcher(batch_fn, max_batch=8, max_wait_ms=50)
+    results = {}
+
+    def worker(i):
+        results[i] = batcher.submit(i).result(timeout=5)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # every caller gets its own row back
+    assert {i: float(v[0]) for i, v in results.items()} == {i: float(i) for i in range(16)}
+    assert len(batch_sizes) < 16
+    assert max(batch_sizes) <= 8
+
+
+def test_micro_batcher_isolates_bad_inputs():
+    def batch_fn(items):
+        if "bad" in items:
+            raise ValueError("cannot decode")
+        return np.ones((len(items), 1), dtype="float32")
+
+    batcher = MicroBatcher(batch_fn, max_batch=4, max_wait_ms=50)
+    good = batcher.submit("ok")
+    bad = batcher.submit("bad")
+
+    assert good.result(timeout=5)[0] == 1.0
+    with pytest.raises(ValueError):
+        bad.result(timeout=5)
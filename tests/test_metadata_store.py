@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.services.faiss_manager import FaissManager
+from app.services.metadata_store import MetadataStore
+
+
+def _store():
+    store = MetadataStore()
+    store.upsert([
+        (1, "Shoes", 50, 7, "approved"),
+        (2, "shoes", 150, 7, "approved"),
+        (3, "Bags", 80, 8, "approved"),
+        (4, "Shoes", None, 8, "approved"),
+        (5, "Shoes", 60, 8, "pending"),
+    ])
+    return store
+
+
+def _allowed(id_filter, n=10):
+    return np.flatnonzero(id_filter.contains(np.arange(n))).tolist()
+
+
+def test_filters_combine():
+    store = _store()
+
+    assert store.build_filter() is None
+    assert _allowed(store.build_filter(category="SHOES")) == [1, 2, 4, 5]
+    assert _allowed(store.build_filter(category="shoes", max_price=100, status="approved")) == [1]
+    assert _allowed(store.build_filter(seller_id=8, min_price=0)) == [3, 5]
+    assert store.build_filter(category="hats").count == 0
+
+
+def test_upsert_and_remove():
+    store = _store()
+    store.upsert([(3, "Shoes", 20, 8, "approved")])
+    store.remove([1])
+
+    assert len(store) == 4
+    assert _allowed(store.build_filter(category="shoes", status="approved")) == [2, 3, 4]
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf_flat", "hnsw", "pq"])
+def test_filter_applies_inside_search(monkeypatch, index_type):
+    monkeypatch.setattr(settings, "FAISS_DIM", 32)
+    monkeypatch.setattr(settings, "FAISS_INDEX_TYPE", index_type)
+    monkeypatch.setattr(settings, "FAISS_NLIST", 4)
+    monkeypatch.setattr(settings, "FAISS_PQ_M", 4)
+    monkeypatch.setattr(settings, "FAISS_NPROBE", 4)
+
+    rng = np.random.default_rng(0)
+    x = rng.standard_normal((400, 32)).astype("float32")
+    x /= np.linalg.norm(x, axis=1, keepdims=True)
+
+    mgr = FaissManager(name=f"test_filtered_{index_type}")
+    mgr.rebuild(list(x), list(range(400)))
+
+    store = MetadataStore()
+    store.upsert([(i, "even" if i % 2 == 0 else "odd", i, 1, "approved") for i in range(400)])
+    id_filter = store.build_filter(category="odd", max_price=300)
+
+    ids, _ = mgr.search(x[10], 5, id_filter)
+
+    assert len(ids) == 5
+    assert all(i % 2 == 1 and i <= 300 for i in ids)
+
+
+@pytest.mark.parametrize("status", ["approved", "rejected"])
+def test_status_filter_survives_compressed_rescoring(monkeypatch, status):
+    """Moderation search on a compressed index: re-scoring must keep non-approved hits."""
+    monkeypatch.setattr(settings, "FAISS_DIM", 32)
+    monkeypatch.setattr(settings, "FAISS_INDEX_TYPE", "pq")
+    monkeypatch.setattr(settings, "FAISS_PQ_M", 4)
+
+    rng = np.random.default_rng(1)
+    x = rng.standard_normal((400, 32)).astype("float32")
+    x /= np.linalg.norm(x, axis=1, keepdims=True)
+    statuses = {i: "rejected" if i % 4 == 0 else "approved" for i in range(400)}
+    loaded = []
+
+    def vector_loader(ids):
+        # products.embedding by faiss_index, whatever the status
+        loaded.extend(ids)
+        return {i: x[i] for i in ids}
+
+    mgr = FaissManager(name=f"test_moderation_{status}", vector_loader=vector_loader)
+    mgr.rebuild(list(x), list(range(400)))
+    assert mgr.stats()["rerank_factor"] > 1
+
+    store = MetadataStore()
+    store.upsert([(i, "shoes", 10, 1, statuses[i]) for i in range(400)])
+
+    query = x[8] if status == "rejected" else x[9]
+    ids, scores = mgr.search(query, 5, store.build_filter(status=status))
+
+    assert loaded
+    assert len(ids) == 5
+    assert all(statuses[i] == status for i in ids)
+    assert ids[0] == (8 if status == "rejected" else 9)
+    assert scores[0] == pytest.approx(1.0, abs=1e-5)
@@ -0,0 +1,49 @@
+import numpy as np
+
+from app.services.query_cache import QueryEmbeddingCache
+
+
+def _vec(value):
+    return np.full(4, value, dtype="float32")
+
+
+def test_query_cache_normalizes_and_counts():
+    cache = QueryEmbeddingCache(max_size=10, ttl_seconds=0)
+    calls = []
+
+    def compute(text):
+        calls.append(text)
+        return _vec(1.0)
+
+    cache.get_or_compute("Red  Shoes", compute)
+    cache.get_or_compute("  red shoes ", compute)
+
+    assert calls == ["Red  Shoes"]
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_query_cache_evicts_least_recently_used():
+    cache = QueryEmbeddingCache(max_size=2, ttl_seconds=0)
+    cache.put("a", _vec(1.0))
+    cache.put("b", _vec(2.0))
+    cache.get("a")
+    cache.put("c", _vec(3.0))
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+
+
+def test_query_cache_warm_from_file(tmp_path):
+    path = tmp_path / "top_queries.txt"
+    path.write_text("shoes\nRed Dress\n\nshoes\n")
+
+    cache = QueryEmbeddingCache(max_size=10, ttl_seconds=0)
+    count = cache.warm_from_file(
+        str(path), lambda texts: np.ones((len(texts), 4), dtype="float32")
+    )
+
+    assert count == 2
+    assert cache.get("red dress") is not None
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.services.faiss_manager import FaissManager
+from app.services.related_products import affected_by, compute_related, reverse_neighbours
+from tests.helpers import unit_vectors
+
+
+@pytest.fixture
+def catalog(faiss_settings):
+    faiss_settings.setattr(settings, "RELATED_TOP_N", 5)
+    faiss_settings.setattr(settings, "RELATED_BATCH_SIZE", 16)
+
+    x = unit_vectors(120, settings.FAISS_DIM)
+    mgr = FaissManager(name="test_related")
+    mgr.rebuild(list(x), list(range(120)))
+    return mgr, x
+
+
+def test_compute_related_matches_brute_force(catalog):
+    mgr, x = catalog
+
+    lists = dict(compute_related(mgr, range(120)))
+
+    assert sorted(lists) == list(range(120))
+    for pid in (0, 37, 119):
+        sims = x @ x[pid]
+        sims[pid] = -np.inf
+        assert [q for q, _ in lists[pid]] == np.argsort(-sims)[:5].tolist()
+        assert all(pid != q for q, _ in lists[pid])
+
+
+def test_compute_related_skips_ids_without_vectors(catalog):
+    mgr, _ = catalog
+    assert [pid for pid, _ in compute_related(mgr, [3, 999, 4])] == [3, 4]
+
+
+def test_affected_by_finds_every_list_a_new_product_enters(catalog):
+    mgr, x = catalog
+    top_n = settings.RELATED_TOP_N
+    before = dict(compute_related(mgr, range(120)))
+
+    # a new product right between 7 and 8
+    new = x[7] + x[8]
+    mgr.add_vectors(np.stack([new / np.linalg.norm(new)]), [500])
+    after = dict(compute_related(mgr, range(120)))
+
+    floors = {q: (len(hits), hits[-1][1]) for q, hits in before.items()}
+    looked_up = []
+
+    def floors_of(ids):
+        looked_up.extend(ids)
+        return {q: floors[q] for q in ids if q in floors}
+
+    affected = reverse_neighbours(mgr, [500], floors_of, top_n)
+
+    changed = {q for q in range(120) if before[q] != after[q]}
+    assert {7, 8} <= changed
+    assert affected == changed
+    assert 500 not in affected
+    # only the neighbourhood of the new product is looked up, each id once
+    assert len(looked_up) == len(set(looked_up)) < 120
+
+
+def test_affected_by_short_or_missing_lists():
+    candidates = {2: 0.1, 3: 0.2}
+    floors = {2: (5, 0.5), 3: (2, 0.9)}
+    # 2's list is full and better; 3's list is short
+    assert affected_by(candidates, floors, top_n=5) == {3}
+    assert affected_by(candidates, {}, top_n=5) == {2, 3}
@@ -19,3 +19,61 @@ def test_search_text(client):
         assert "results" in data
         assert isinstance(data["results"], list)
         assert "time_taken" in data
+
+
+def test_fuse_rankings_prefers_items_in_both_lists():
+    from app.services.search_service import fuse_rankings
+
+    image_side = ([1, 2, 3], [0.31, 0.30, 0.29])
+    text_side = ([3, 4, -1], [0.92, 0.90, 0.0])
+
+    ids, scores = fuse_rankings([image_side, text_side], top_k=3, rrf_k=60)
+
+    assert ids[0] == 3
+    assert len(ids) == 3
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_search_batch(client):
+    with patch("app.routers.search.search_batch") as mock_search:
+        mock_search.return_value = [[{"id": 1, "distance": 0.9}], []]
+
+        response = client.post("/search/batch", json={
+            "queries": [{"text": "red shoes"}, {"text": "blue bag", "source": "text"}],
+            "k": 5,
+        })
+        assert response.status_code == 200
+        assert len(response.json()) == 2
+
+        queries = mock_search.call_args[0][0]
+        assert [q["text"] for q in queries] == ["red shoes", "blue bag"]
+        assert mock_search.call_args[1]["top_k"] == 5
+
+
+def test_similar_products(client):
+    with patch("app.routers.search.search_similar") as mock_search:
+        mock_search.return_value = [{"id": 2, "distance": 0.8}]
+
+        response = client.get("/search/similar/1?k=4&source=text")
+        assert response.status_code == 200
+        assert response.json() == [{"id": 2, "distance": 0.8}]
+
+        assert mock_search.call_args[0][0] == 1
+        assert mock_search.call_args[1]["top_k"] == 4
+        assert mock_search.call_args[1]["source"] == "text"
+
+
+def test_format_results_single_query_keeps_rank_order():
+    from app.services import search_service
+
+    rows = {
+        fid: (fid + 100, fid, f"P{fid}", 9.5, f"{fid}.jpg", "", None)
+        for fid in (7, 3, 9)
+    }
+    with patch("app.services.search_service._fetch_products_by_faiss_ids") as mock_fetch:
+        mock_fetch.return_value = rows
+        results = search_service.format_results([9, -1, 42, 3, 7], [0.9, 0.0, 0.8, 0.7, 0.6])
+
+    mock_fetch.assert_called_once_with([9, 42, 3, 7])
+    assert [r["faiss_index"] for r in results] == [9, 3, 7]
+    assert [r["distance"] for r in results] == [0.9, 0.7, 0.6]
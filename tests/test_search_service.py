@@ -0,0 +1,93 @@
+import base64
+import io
+
+import pytest
+from fastapi import HTTPException
+from PIL import Image
+from transformers import CLIPImageProcessor
+
+from app.services import search_service
+from app.services.image_preprocess import config_from_processor, preprocess_image
+from app.services.query_cache import QueryEmbeddingCache
+
+
+class TowerlessEmbedder:
+    """Embedder of a worker started with CLIP_TOWERS limited to `towers`."""
+
+    def __init__(self, towers):
+        self.towers = set(towers)
+
+    def preprocess(self, image):
+        raise AssertionError("preprocess called without the vision tower")
+
+    def preprocess_async(self, image):
+        raise AssertionError("preprocess_async called without the vision tower")
+
+    def embed_texts(self, texts):
+        raise AssertionError("embed_texts called without the text tower")
+
+
+@pytest.fixture
+def worker(monkeypatch):
+    def start(towers):
+        embedder = TowerlessEmbedder(towers)
+        monkeypatch.setattr(search_service, "ensure_services", lambda: (embedder, None))
+        monkeypatch.setattr(search_service, "ensure_scheduler", lambda: None)
+        return embedder
+    return start
+
+
+def test_batch_image_query_on_text_only_worker_is_503(worker):
+    worker({"text"})
+    image = base64.b64encode(b"\x89PNG...").decode()
+
+    with pytest.raises(HTTPException) as e:
+        search_service.search_batch([{"image": image}])
+
+    assert e.value.status_code == 503
+    assert "vision" in e.value.detail
+
+
+def test_single_image_query_on_text_only_worker_is_503(worker):
+    worker({"text"})
+
+    with pytest.raises(HTTPException) as e:
+        search_service._embed_image_query(b"\x89PNG...")
+
+    assert e.value.status_code == 503
+
+
+def test_text_query_on_vision_only_worker_is_503(worker, monkeypatch):
+    worker({"vision"})
+    monkeypatch.setattr(search_service, "ensure_query_cache", lambda: QueryEmbeddingCache(max_size=10, ttl_seconds=0))
+
+    with pytest.raises(HTTPException) as e:
+        search_service.search_batch([{"text": "red shoes"}])
+
+    assert e.value.status_code == 503
+    assert "text" in e.value.detail
+
+
+class VisionEmbedder(TowerlessEmbedder):
+    """Decodes for real, without a model."""
+
+    def __init__(self):
+        super().__init__({"vision"})
+        self.config = config_from_processor(CLIPImageProcessor(), max_pixels=0)
+
+    def preprocess(self, image):
+        return preprocess_image(image, self.config)
+
+
+def test_decompression_bomb_is_400(monkeypatch):
+    embedder = VisionEmbedder()
+    monkeypatch.setattr(search_service, "ensure_services", lambda: (embedder, None))
+    # PIL refuses images over twice MAX_IMAGE_PIXELS before decoding them
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 10_000)
+    buf = io.BytesIO()
+    Image.new("RGB", (300, 300)).save(buf, format="PNG")
+
+    with pytest.raises(HTTPException) as e:
+        search_service._embed_image_query(buf.getvalue())
+
+    assert e.value.status_code == 400
@@ -0,0 +1,143 @@
+import os
+
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.services.faiss_manager import FaissManager
+from app.services.sharded_faiss import ShardedFaissManager
+from tests.helpers import unit_vectors
+
+
+@pytest.fixture
+def shard_settings(faiss_settings):
+    faiss_settings.setattr(settings, "FAISS_SHARD_WORKERS", 2)
+    return faiss_settings
+
+
+CATEGORIES = ["Shoes", "Bags", "Watches"]
+
+
+def test_fan_out_matches_unsharded_search(shard_settings):
+    x = unit_vectors(300, settings.FAISS_DIM)
+    ids = list(range(300))
+    categories = [CATEGORIES[i % 3] for i in ids]
+
+    sharded = ShardedFaissManager(name="test_sharded")
+    sharded.rebuild(list(x), ids, categories=categories)
+    single = FaissManager(name="test_unsharded")
+    single.rebuild(list(x), ids)
+
+    q = unit_vectors(5, settings.FAISS_DIM, seed=1)
+    for (s_ids, s_scores), (u_ids, u_scores) in zip(sharded.search_batch(q, 10), single.search_batch(q, 10)):
+        assert s_ids == u_ids
+        assert np.allclose(s_scores, u_scores, atol=1e-5)
+
+    assert len(sharded.shards) == 3
+    assert sharded.ntotal == 300
+
+
+def test_range_search_merges_shards(shard_settings):
+    x = unit_vectors(300, settings.FAISS_DIM)
+    ids = list(range(300))
+    sharded = ShardedFaissManager(name="test_range_sharded")
+    sharded.add_vectors(x, ids, [CATEGORIES[i % 3] for i in ids])
+
+    exact = x @ x[5]
+    found, scores = sharded.range_search(x[5], 0.2)
+    assert set(found) == set(np.flatnonzero(exact >= 0.2).tolist())
+    assert scores == sorted(scores, reverse=True)
+
+    assert sharded.range_search(x[5], 0.2, max_results=3)[0] == found[:3]
+    scoped, _ = sharded.range_search(x[5], 0.2, category="Bags")
+    assert scoped == [fid for fid in found if fid % 3 == 1]
+
+
+def test_category_search_hits_only_its_shard(shard_settings):
+    x = unit_vectors(90, settings.FAISS_DIM)
+    ids = list(range(90))
+    sharded = ShardedFaissManager(name="test_scoped")
+    sharded.add_vectors(x, ids, [CATEGORIES[i % 3] for i in ids])
+
+    found, _ = sharded.search(x[4], 10, category=" shoes ")
+    assert found and all(fid % 3 == 0 for fid in found)
+    assert sharded.search(x[4], 10, category="Hats") == ([], [])
+
+
+def test_category_change_moves_product(shard_settings):
+    x = unit_vectors(10, settings.FAISS_DIM)
+    sharded = ShardedFaissManager(name="test_move")
+    sharded.add_vectors(x, list(range(10)), ["Shoes"] * 10)
+
+    sharded.add_vector(x[3], 3, "Bags")
+
+    assert 3 not in sharded.shard("Shoes").ids().tolist()
+    assert sharded.search(x[3], 1, category="Bags")[0] == [3]
+    assert sharded.ntotal == 10
+
+    sharded.remove_vector(3)
+    assert sharded.ntotal == 9
+
+
+def test_rebuild_shard_and_reload(shard_settings):
+    x = unit_vectors(60, settings.FAISS_DIM)
+    ids = list(range(60))
+    sharded = ShardedFaissManager(name="test_reload")
+    sharded.rebuild(list(x), ids, categories=[CATEGORIES[i % 3] for i in ids])
+
+    # only the Bags shard is rebuilt; the others are untouched
+    sharded.rebuild_shard("Bags", [x[1]], [1])
+    assert sharded.shard("Bags").ids().tolist() == [1]
+    assert sharded.ntotal == 41
+
+    sharded.rebuild_shard("Watches", [], [])
+    assert sharded.shard("Watches") is None
+    sharded.flush()
+
+    reloaded = ShardedFaissManager(name="test_reload")
+    assert sorted(reloaded.shards) == ["bags", "shoes"]
+    assert sorted(reloaded.ids().tolist()) == sorted([1] + list(range(0, 60, 3)))
+
+
+def test_drop_shard_removes_all_its_files(shard_settings, tmp_path):
+    shard_settings.setattr(settings, "FAISS_SHARED", True)
+    x = unit_vectors(30, settings.FAISS_DIM)
+    ids = list(range(30))
+    sharded = ShardedFaissManager(name="test_drop")
+    sharded.rebuild(list(x), ids, categories=[CATEGORIES[i % 3] for i in ids])
+    sharded.shard("Watches").backup_index()
+    # a mutation after the backup leaves a delta file and a backup log entry
+    sharded.add_vector(x[0], 100, "Watches")
+    sharded.flush()
+
+    name = sharded.shard("Watches").name
+    owned = lambda: [
+        os.path.join(root, f) for root, dirs, files in os.walk(tmp_path)
+        for f in files + dirs if f.startswith(name)
+    ]
+    assert any(p.endswith(".delta.npz") for p in owned())
+    assert any(p.endswith(".lock") for p in owned())
+    assert any(os.sep + "backups" + os.sep in p for p in owned())
+
+    sharded.drop_shard("Watches")
+
+    assert owned() == []
+    assert sharded.shard("Shoes").ntotal == 10
+
+
+def test_shared_workers_see_new_shards(shard_settings):
+    shard_settings.setattr(settings, "FAISS_SHARED", True)
+    shard_settings.setattr(settings, "FAISS_SHARED_CHECK_INTERVAL", 0)
+    x = unit_vectors(20, settings.FAISS_DIM)
+
+    worker_a = ShardedFaissManager(name="test_shared_shards")
+    worker_b = ShardedFaissManager(name="test_shared_shards")
+    worker_a.add_vectors(x[:10], list(range(10)), ["Shoes"] * 10)
+
+    assert worker_b.search(x[4], 1, category="Shoes")[0] == [4]
+
+    # b moves a product a added into a new shard; a sees both changes
+    worker_b.add_vector(x[4], 4, "Bags")
+    assert worker_a.search(x[4], 1, category="Bags")[0] == [4]
+    assert 4 not in worker_a.shard("Shoes").ids().tolist()
+    assert worker_a.ntotal == 10